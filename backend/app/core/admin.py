@@ -0,0 +1,20 @@
+"""Admin authentication for operational endpoints."""
+
+import os
+import secrets
+from typing import Optional
+
+from fastapi import Header, HTTPException
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+
+def is_admin(token: Optional[str]) -> bool:
+    """Whether ``token`` is the configured admin token; never true if unset."""
+    return bool(ADMIN_TOKEN) and secrets.compare_digest(token or "", ADMIN_TOKEN)
+
+
+def require_admin(x_admin_token: str = Header(None)):
+    """Dependency rejecting requests without a valid ``X-Admin-Token``."""
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
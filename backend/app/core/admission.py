@@ -0,0 +1,211 @@
+"""
+Admission control.
+
+Each worker watches its own event-loop lag, in-flight upstream requests,
+queued background jobs and resident memory. When any of them is over its
+threshold, bulk analysis requests (PDF, image, batch and calendar import
+uploads) wait briefly for the pressure to clear and are otherwise turned
+away with 503 and ``Retry-After``. Everything else, including ICS
+generation, chat and stream resumes, is always admitted. Background jobs
+are deferred rather than rejected: workers hold off starting the next job
+until the pressure clears.
+
+Thresholds are configurable through the environment:
+
+- ``ADMISSION_MAX_LOOP_LAG_MS``: smoothed event-loop lag
+- ``ADMISSION_MAX_UPSTREAM``: concurrent OpenAI requests
+- ``ADMISSION_MAX_QUEUED_JOBS``: background jobs waiting to start
+- ``ADMISSION_MAX_RSS_MB``: process resident memory
+- ``ADMISSION_DEFER_SECONDS``: how long a bulk request may wait for capacity
+- ``ADMISSION_ENABLED``: set to "0" to admit everything
+"""
+
+import asyncio
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") != "0"
+MAX_LOOP_LAG = float(os.getenv("ADMISSION_MAX_LOOP_LAG_MS", "250")) / 1000
+MAX_UPSTREAM = int(os.getenv("ADMISSION_MAX_UPSTREAM", "8"))
+MAX_QUEUED_JOBS = int(os.getenv("ADMISSION_MAX_QUEUED_JOBS", "8"))
+MAX_RSS_BYTES = int(os.getenv("ADMISSION_MAX_RSS_MB", "700")) * 1024 * 1024
+DEFER_SECONDS = float(os.getenv("ADMISSION_DEFER_SECONDS", "2"))
+RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER", "15"))
+
+LAG_PROBE_INTERVAL = 0.1
+# Lag jumps up immediately and decays by this factor per probe.
+LAG_DECAY = 0.8
+DEFER_POLL_INTERVAL = 0.1
+
+# POST routes doing bulk extraction work; everything else is admitted.
+LOW_PRIORITY_PATHS = {
+    "/pdf/analyze",
+    "/pdf/analyze-stream",
+    "/generate/analyze-image",
+    "/generate/analyze-image-stream",
+    "/batch/analyze",
+    "/calendar/import",
+}
+
+
+def rss_bytes() -> Optional[int]:
+    """Current resident set size of this process, or None if unavailable."""
+    try:
+        with open("/proc/self/statm", "r", encoding="utf-8") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class AdmissionController:
+    """Load signals for one worker and the admission decisions based on them."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._monitor: Optional[asyncio.Task] = None
+        self.loop_lag = 0.0
+        self.upstream = 0
+        self.admitted = 0
+        self.deferred = 0
+        self.rejected = 0
+        self.last_rejection: Optional[str] = None
+        self._queue_depth: Optional[Callable[[], int]] = None
+
+    def watch_queue(self, depth: Callable[[], int]):
+        """Count the jobs ``depth`` reports as queued against the threshold."""
+        self._queue_depth = depth
+
+    def queued_jobs(self) -> int:
+        return self._queue_depth() if self._queue_depth is not None else 0
+
+    def ensure_monitor(self):
+        """Start the event-loop lag probe on the running loop, once."""
+        if self._monitor is None or self._monitor.done():
+            self._monitor = asyncio.create_task(self._probe_loop_lag())
+
+    async def _probe_loop_lag(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(LAG_PROBE_INTERVAL)
+            lag = max(loop.time() - started - LAG_PROBE_INTERVAL, 0.0)
+            self.loop_lag = max(lag, self.loop_lag * LAG_DECAY)
+
+    @contextmanager
+    def upstream_request(self):
+        """Count an in-flight upstream request for the duration of the block."""
+        with self._lock:
+            self.upstream += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.upstream -= 1
+
+    def pressure(self, include_queue: bool = True) -> Optional[str]:
+        """
+        Name the first signal over its threshold.
+
+        Args:
+            include_queue: Whether queued background jobs count; job workers
+                themselves ignore it so the queue can drain
+
+        Returns:
+            Reason, or None when there is capacity
+        """
+        if self.loop_lag > MAX_LOOP_LAG:
+            return f"event loop lag {self.loop_lag * 1000:.0f}ms"
+        if self.upstream >= MAX_UPSTREAM:
+            return f"{self.upstream} upstream requests in flight"
+        if include_queue and self.queued_jobs() >= MAX_QUEUED_JOBS:
+            return "background job queue is backed up"
+        rss = rss_bytes()
+        if rss is not None and rss > MAX_RSS_BYTES:
+            return f"memory at {rss // (1024 * 1024)}MB"
+        return None
+
+    async def wait_for_capacity(
+        self, timeout: Optional[float] = None, include_queue: bool = True
+    ) -> Optional[str]:
+        """
+        Wait until there is capacity.
+
+        Args:
+            timeout: Give up after this many seconds, or wait indefinitely
+            include_queue: Passed to pressure()
+
+        Returns:
+            None once there is capacity, or the reason if still overloaded
+        """
+        if not ADMISSION_ENABLED:
+            return None
+        deadline = None if timeout is None else time.monotonic() + timeout
+        reason = self.pressure(include_queue)
+        while reason is not None:
+            if deadline is not None and time.monotonic() >= deadline:
+                return reason
+            await asyncio.sleep(DEFER_POLL_INTERVAL)
+            reason = self.pressure(include_queue)
+        return None
+
+    def snapshot(self) -> Dict[str, Any]:
+        rss = rss_bytes()
+        return {
+            "enabled": ADMISSION_ENABLED,
+            "pressure": self.pressure(),
+            "loop_lag_ms": round(self.loop_lag * 1000, 1),
+            "upstream_in_flight": self.upstream,
+            "queued_jobs": self.queued_jobs(),
+            "rss_mb": round(rss / (1024 * 1024), 1) if rss is not None else None,
+            "admitted": self.admitted,
+            "deferred": self.deferred,
+            "rejected": self.rejected,
+            "last_rejection": self.last_rejection,
+            "thresholds": {
+                "loop_lag_ms": MAX_LOOP_LAG * 1000,
+                "upstream_in_flight": MAX_UPSTREAM,
+                "queued_jobs": MAX_QUEUED_JOBS,
+                "rss_mb": MAX_RSS_BYTES // (1024 * 1024),
+            },
+        }
+
+
+admission = AdmissionController()
+
+
+def is_low_priority(request: Request) -> bool:
+    """Whether a request is bulk analysis work that may be turned away."""
+    if request.method != "POST" or request.url.path not in LOW_PRIORITY_PATHS:
+        return False
+    # Resuming a stream replays buffered events; it costs nothing upstream.
+    return "last-event-id" not in request.headers
+
+
+async def admission_control(request: Request, call_next):
+    """HTTP middleware deferring or rejecting bulk work under pressure."""
+    admission.ensure_monitor()
+    if not ADMISSION_ENABLED or not is_low_priority(request):
+        return await call_next(request)
+
+    if admission.pressure() is not None:
+        admission.deferred += 1
+        reason = await admission.wait_for_capacity(DEFER_SECONDS)
+        if reason is not None:
+            admission.rejected += 1
+            admission.last_rejection = reason
+            print(f"Rejected {request.url.path}: {reason}")
+            return JSONResponse(
+                status_code=503,
+                content={"detail": f"Server is busy ({reason}), try again later"},
+                headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+            )
+
+    admission.admitted += 1
+    return await call_next(request)
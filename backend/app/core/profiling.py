@@ -0,0 +1,307 @@
+"""
+Opt-in sampling profiler.
+
+A request is profiled when it carries ``X-Profile: 1`` with a valid
+``X-Admin-Token``, or at random with probability ``PROFILE_SAMPLE_RATE``.
+While at least one profiled request is running, a background thread
+samples every ``PROFILE_INTERVAL_MS``:
+
+- the event loop thread, counted for a request when the task currently
+  running belongs to it. While profiling, a task factory tags every task
+  created in a profiled request's context, which covers the handler, its
+  stream generator and tasks they start;
+- every suspended task of a profiled request, as its coroutine chain
+  ending in ``[awaiting]``, so time spent waiting on upstream shows up;
+- other busy threads (``asyncio.to_thread`` work such as PDF extraction),
+  under ``thread:<name>``. These can't be attributed to a request and are
+  counted for every profiled request running at the time.
+
+Profiles end when the response body is finished and are written as
+collapsed stacks (``frame;frame;frame count``, which speedscope and
+flamegraph.pl both read) under ``PROFILES_DIR``.
+
+When neither trigger is configured the middleware isn't installed at all;
+the sampler thread and task factory only exist while a profiled request is
+in flight.
+"""
+
+import asyncio
+import contextvars
+import gc
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+import weakref
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import Request
+
+from app.core.admin import ADMIN_TOKEN, is_admin
+
+PROFILES_DIR = os.getenv("PROFILES_DIR", "profiles")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+MAX_STACK_DEPTH = 128
+
+# Innermost frames of threads that are waiting rather than working.
+_IDLE_FILES = ("threading.py", "queue.py", "selectors.py", "thread.py")
+
+Stack = Tuple[str, ...]
+
+_session: contextvars.ContextVar[Optional["ProfileSession"]] = (
+    contextvars.ContextVar("profile_session", default=None)
+)
+_labels: Dict[object, str] = {}
+_task_sessions: "weakref.WeakKeyDictionary[asyncio.Task, ProfileSession]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def profiling_enabled() -> bool:
+    """Whether any request can be profiled; otherwise skip the middleware."""
+    return bool(ADMIN_TOKEN) or PROFILE_SAMPLE_RATE > 0
+
+
+def _label(code) -> str:
+    label = _labels.get(code)
+    if label is None:
+        filename = os.path.basename(code.co_filename)
+        label = f"{code.co_name} ({filename}:{code.co_firstlineno})"
+        _labels[code] = label
+    return label
+
+
+def _frame_stack(frame) -> Stack:
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_label(frame.f_code))
+        frame = frame.f_back
+    return tuple(reversed(labels))
+
+
+def _await_stack(task: asyncio.Task) -> Stack:
+    """A suspended task's chain of awaiting coroutines, outermost first."""
+    labels = []
+    coro = task.get_coro()
+    while coro is not None and len(labels) < MAX_STACK_DEPTH:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "ag_frame", None)
+        if frame is None:
+            # `async for` awaits an asend wrapper that hides its generator.
+            coro = next(
+                (ref for ref in gc.get_referents(coro) if hasattr(ref, "ag_frame")),
+                None,
+            )
+            continue
+        labels.append(_label(frame.f_code))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "ag_await", None)
+    return tuple(labels) + ("[awaiting]",)
+
+
+def _task_session(task: Optional[asyncio.Task]) -> Optional["ProfileSession"]:
+    return _task_sessions.get(task) if task is not None else None
+
+
+def _tagging_task_factory(previous):
+    """Wrap a loop's task factory to tag tasks created by profiled requests."""
+
+    def factory(loop, coro, context=None):
+        kwargs = {} if context is None else {"context": context}
+        if previous is not None:
+            task = previous(loop, coro, **kwargs)
+        else:
+            task = asyncio.Task(coro, loop=loop, **kwargs)
+        session = (context or contextvars.copy_context()).get(_session)
+        if session is not None:
+            _task_sessions[task] = session
+        return task
+
+    factory.previous = previous
+    return factory
+
+
+def _current_task(loop: asyncio.AbstractEventLoop) -> Optional[asyncio.Task]:
+    # asyncio.current_task() only works on the loop's own thread; this reads
+    # the same mapping from the sampler thread.
+    current_tasks = getattr(asyncio.tasks, "_current_tasks", None)
+    return current_tasks.get(loop) if current_tasks is not None else None
+
+
+class ProfileSession:
+    """Samples collected for one request."""
+
+    def __init__(self, method: str, path: str, loop: asyncio.AbstractEventLoop):
+        slug = path.strip("/").replace("/", "_") or "root"
+        self.name = (
+            f"{time.strftime('%Y%m%dT%H%M%S')}-{method}-{slug}-"
+            f"{uuid.uuid4().hex[:6]}.collapsed"
+        )
+        self.loop = loop
+        self.loop_thread = threading.get_ident()
+        self.samples: Counter = Counter()
+        self.started = time.perf_counter()
+
+    def write(self) -> str:
+        os.makedirs(PROFILES_DIR, exist_ok=True)
+        path = os.path.join(PROFILES_DIR, self.name)
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{';'.join(stack)} {count}\n")
+        return path
+
+
+class SamplingProfiler:
+    """Runs one sampler thread while any profile session is active."""
+
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._sessions: List[ProfileSession] = []
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, method: str, path: str) -> ProfileSession:
+        """Start a session for the current task; call on the event loop."""
+        loop = asyncio.get_running_loop()
+        session = ProfileSession(method, path, loop)
+        _task_sessions[asyncio.current_task()] = session
+        if not hasattr(loop.get_task_factory(), "previous"):
+            loop.set_task_factory(_tagging_task_factory(loop.get_task_factory()))
+        with self._lock:
+            self._sessions.append(session)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="profiler", daemon=True
+                )
+                self._thread.start()
+        return session
+
+    def finish(self, session: ProfileSession):
+        """End a session and write its profile; call on the event loop."""
+        with self._lock:
+            if session not in self._sessions:
+                return
+            self._sessions.remove(session)
+            loop_idle = all(s.loop is not session.loop for s in self._sessions)
+        for task in [t for t, s in _task_sessions.items() if s is session]:
+            _task_sessions.pop(task, None)
+        factory = session.loop.get_task_factory()
+        if loop_idle and hasattr(factory, "previous"):
+            session.loop.set_task_factory(factory.previous)
+
+        path = session.write()
+        elapsed = time.perf_counter() - session.started
+        print(
+            f"Profile {path}: {sum(session.samples.values())} samples "
+            f"over {elapsed:.2f}s"
+        )
+        _prune_profiles()
+
+    def _run(self):
+        own_thread = threading.get_ident()
+        while True:
+            with self._lock:
+                sessions = list(self._sessions)
+                if not sessions:
+                    self._thread = None
+                    return
+            self._sample(sessions, own_thread)
+            time.sleep(self.interval)
+
+    def _sample(self, sessions: List[ProfileSession], own_thread: int):
+        frames = sys._current_frames()
+        loops = {session.loop_thread: session.loop for session in sessions}
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+
+        for thread_id, frame in frames.items():
+            if thread_id == own_thread:
+                continue
+            if thread_id in loops:
+                owner = _task_session(_current_task(loops[thread_id]))
+                if owner in sessions:
+                    owner.samples[_frame_stack(frame)] += 1
+                continue
+            if os.path.basename(frame.f_code.co_filename) in _IDLE_FILES:
+                continue
+            name = thread_names.get(thread_id, str(thread_id))
+            stack = (f"thread:{name}",) + _frame_stack(frame)
+            for session in sessions:
+                session.samples[stack] += 1
+
+        for loop in set(loops.values()):
+            current = _current_task(loop)
+            try:
+                tasks = asyncio.all_tasks(loop)
+            except RuntimeError:
+                continue
+            for task in tasks:
+                if task is current:
+                    continue
+                owner = _task_session(task)
+                if owner in sessions:
+                    owner.samples[_await_stack(task)] += 1
+
+
+profiler = SamplingProfiler()
+
+
+def list_profiles() -> List[Dict[str, object]]:
+    """Stored profiles, newest first."""
+    if not os.path.isdir(PROFILES_DIR):
+        return []
+    profiles = []
+    for name in os.listdir(PROFILES_DIR):
+        if not name.endswith(".collapsed"):
+            continue
+        stat = os.stat(os.path.join(PROFILES_DIR, name))
+        profiles.append({"name": name, "size": stat.st_size, "created": stat.st_mtime})
+    return sorted(profiles, key=lambda p: p["created"], reverse=True)
+
+
+def _prune_profiles():
+    for profile in list_profiles()[PROFILE_MAX_FILES:]:
+        try:
+            os.remove(os.path.join(PROFILES_DIR, str(profile["name"])))
+        except FileNotFoundError:
+            pass
+
+
+def _should_profile(request: Request) -> bool:
+    if request.headers.get("x-profile") == "1" and is_admin(
+        request.headers.get("x-admin-token")
+    ):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+async def profile_requests(request: Request, call_next):
+    """HTTP middleware profiling selected requests, including streamed bodies."""
+    if not _should_profile(request):
+        return await call_next(request)
+
+    session = profiler.start(request.method, request.url.path)
+    token = _session.set(session)
+    try:
+        response = await call_next(request)
+    except BaseException:
+        profiler.finish(session)
+        raise
+    finally:
+        _session.reset(token)
+
+    # Streaming handlers keep working while the body is sent.
+    body = response.body_iterator
+
+    async def profiled_body():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            profiler.finish(session)
+
+    response.body_iterator = profiled_body()
+    response.headers["X-Profile-Id"] = session.name
+    return response
@@ -0,0 +1,289 @@
+"""
+Response serialization and compression.
+
+``FastJSONResponse`` serializes with orjson. FastAPI runs every plain
+return value through ``jsonable_encoder`` before rendering it; the analysis
+and chat endpoints return plain JSON data, so they return a
+``FastJSONResponse`` themselves to skip that pass. Anything orjson can't
+serialize still goes through ``jsonable_encoder`` as a fallback.
+
+``CompressionMiddleware`` negotiates brotli or gzip for compressible
+responses of at least ``COMPRESS_MIN_BYTES``. It never touches
+``text/event-stream`` (compressors buffer, which would hold back SSE
+events), responses that already carry a ``Content-Encoding``, or responses
+whose handler manages its own representations by setting an ``ETag`` or
+``Vary: Accept-Encoding``, such as the pre-compressed calendar feeds.
+Recompressing those would change the bytes behind their validators.
+
+Run ``python -m app.core.responses`` to benchmark serialization time and
+payload sizes on large event lists.
+"""
+
+import os
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.services.ics import generate_ics_file
+
+try:
+    import orjson
+
+    def dumps(data: Any) -> bytes:
+        return orjson.dumps(data)
+
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    import json
+
+    def dumps(data: Any) -> bytes:
+        return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is in requirements.txt
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = 6
+# Brotli quality 4 compresses better than gzip -6 at a similar speed;
+# higher qualities are meant for static assets.
+BROTLI_QUALITY = 4
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "text/",
+)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered with orjson."""
+
+    def render(self, content: Any) -> bytes:
+        try:
+            return dumps(content)
+        except TypeError:
+            # Not plain JSON data (e.g. models or sets): encode it first.
+            return dumps(jsonable_encoder(content))
+
+
+def negotiate_encoding(
+    accept_encoding: Optional[str], available: Optional[Tuple[str, ...]] = None
+) -> Optional[str]:
+    """
+    Pick a content coding from an Accept-Encoding header.
+
+    Args:
+        accept_encoding: Header value, e.g. "gzip, deflate, br;q=0.9"
+        available: Codings the caller can send, in order of preference;
+            defaults to brotli (if installed) and gzip
+
+    Returns:
+        One of the available codings, or None for no compression
+    """
+    if not accept_encoding:
+        return None
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[coding.strip().lower()] = quality
+
+    wildcard = weights.get("*", 0.0)
+    if available is not None:
+        candidates = list(available)
+    else:
+        candidates = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best = max(candidates, key=lambda coding: weights.get(coding, wildcard))
+    return best if weights.get(best, wildcard) > 0 else None
+
+
+class _Compressor:
+    """Streaming gzip or brotli compressor with a common interface."""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._zlib = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, flush: bool = False) -> bytes:
+        if self.encoding == "br":
+            compressed = self._brotli.process(data)
+            return compressed + self._brotli.flush() if flush else compressed
+        compressed = self._zlib.compress(data)
+        if flush:
+            compressed += self._zlib.flush(zlib.Z_SYNC_FLUSH)
+        return compressed
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._brotli.finish()
+        return self._zlib.flush()
+
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    """Compress a complete body with the given content coding."""
+    compressor = _Compressor(encoding)
+    return compressor.compress(body) + compressor.finish()
+
+
+def _should_compress(status: int, headers: Headers, minimum_size: int) -> bool:
+    if not 200 <= status < 300 or status == 204:
+        return False
+    if "content-encoding" in headers or "etag" in headers:
+        return False
+    if "accept-encoding" in headers.get("vary", "").lower():
+        # The handler negotiated the coding itself.
+        return False
+    content_type = headers.get("content-type", "").lower()
+    if content_type.startswith("text/event-stream"):
+        return False
+    if not content_type.startswith(COMPRESSIBLE_TYPES):
+        return False
+    content_length = headers.get("content-length")
+    return content_length is None or int(content_length) >= minimum_size
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing response bodies with brotli or gzip.
+
+    The decision is made from the response headers, and bodies are
+    compressed as they stream through rather than buffered. Streamed bodies
+    without a Content-Length are always compressed, flushing each chunk so
+    it isn't held back.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        compressor: Optional[_Compressor] = None
+        streaming = False
+
+        async def send_compressed(message: Message):
+            nonlocal compressor, streaming
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if _should_compress(message["status"], headers, self.minimum_size):
+                    compressor = _Compressor(encoding)
+                    streaming = "content-length" not in headers
+                    mutable = MutableHeaders(raw=message["headers"])
+                    del mutable["content-length"]
+                    mutable["content-encoding"] = encoding
+                    mutable.add_vary_header("Accept-Encoding")
+                await send(message)
+                return
+
+            if message["type"] != "http.response.body" or compressor is None:
+                await send(message)
+                return
+
+            more_body = message.get("more_body", False)
+            body = compressor.compress(
+                message.get("body", b""), flush=streaming and more_body
+            )
+            if not more_body:
+                body += compressor.finish()
+            await send(
+                {"type": "http.response.body", "body": body, "more_body": more_body}
+            )
+
+        await self.app(scope, receive, send_compressed)
+
+
+def _sample_events(count: int) -> List[Dict[str, Any]]:
+    kinds = ["Lecture", "Lab", "Quiz", "Problem Set", "Office Hours"]
+    return [
+        {
+            "title": f"{kinds[i % len(kinds)]} {i // len(kinds) + 1}",
+            "start_time": f"2025-{(i // 28) % 12 + 1:02d}-{i % 28 + 1:02d}T10:00:00",
+            "end_time": f"2025-{(i // 28) % 12 + 1:02d}-{i % 28 + 1:02d}T11:15:00",
+            "location": f"Science Hall {100 + i % 40}",
+            "description": "Bring a calculator and your lab notebook.",
+            "event_type": "other",
+            "recurrence": "once",
+            "days": [],
+        }
+        for i in range(count)
+    ]
+
+
+def _time(func, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat
+
+
+def benchmark(sizes: Tuple[int, ...] = (50, 500, 5000)) -> List[Dict[str, Any]]:
+    """
+    Compare the default and fast JSON paths and compressed sizes.
+
+    Returns:
+        One row per event count with timings in milliseconds and sizes in
+        bytes; "default" is FastAPI's jsonable_encoder plus JSONResponse
+    """
+    rows = []
+    for count in sizes:
+        schedule = {
+            "course_name": "Biology 101",
+            "course_code": "BIO101",
+            "events": _sample_events(count),
+        }
+        repeat = max(3, 5000 // count)
+        default_ms = 1000 * _time(
+            lambda: JSONResponse(jsonable_encoder(schedule)), repeat
+        )
+        fast_ms = 1000 * _time(lambda: FastJSONResponse(schedule), repeat)
+        body = FastJSONResponse(schedule).body
+        ics = generate_ics_file(schedule).encode("utf-8")
+        row = {
+            "events": count,
+            "default_ms": round(default_ms, 3),
+            "fast_ms": round(fast_ms, 3),
+            "json_bytes": len(body),
+            "json_gzip_bytes": len(compress_body(body, "gzip")),
+            "ics_bytes": len(ics),
+            "ics_gzip_bytes": len(compress_body(ics, "gzip")),
+        }
+        if brotli is not None:
+            row["json_br_bytes"] = len(compress_body(body, "br"))
+            row["ics_br_bytes"] = len(compress_body(ics, "br"))
+            row["json_br_ms"] = round(
+                1000 * _time(lambda: compress_body(body, "br"), repeat), 3
+            )
+        row["json_gzip_ms"] = round(
+            1000 * _time(lambda: compress_body(body, "gzip"), repeat), 3
+        )
+        rows.append(row)
+    return rows
+
+
+if __name__ == "__main__":
+    for result in benchmark():
+        print(", ".join(f"{key}={value}" for key, value in result.items()))
@@ -0,0 +1,217 @@
+"""
+Resumable SSE streams.
+
+Each stream gets an id and every event a sequence number, sent as
+``id: <stream_id>:<seq>``. The producer runs in a background task and
+keeps a bounded ring buffer of emitted events, so a client that drops the
+connection can reconnect with ``Last-Event-ID`` and pick up where it left
+off instead of starting a new analysis. Streams with no subscriber are
+cancelled after a grace period.
+
+Streams live in process memory; a reconnect that lands on another worker
+will not find its stream and must start over.
+"""
+
+import asyncio
+import os
+import time
+import uuid
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+from app.core.sse import (
+    DISCONNECT_CHECK_SECONDS,
+    HEARTBEAT,
+    HEARTBEAT_SECONDS,
+    SSE_HEADERS,
+    Event,
+    coalesce_events,
+    encode_event,
+)
+
+REPLAY_BUFFER_SIZE = int(os.getenv("SSE_REPLAY_BUFFER_SIZE", "512"))
+RESUME_GRACE_SECONDS = float(os.getenv("SSE_RESUME_GRACE_SECONDS", "120"))
+
+
+class ResumableStream:
+    """A background event producer with a replay buffer."""
+
+    def __init__(
+        self,
+        events: AsyncIterator[Event],
+        buffer_size: int = REPLAY_BUFFER_SIZE,
+        grace: float = RESUME_GRACE_SECONDS,
+    ):
+        self.id = uuid.uuid4().hex
+        self.grace = grace
+        self.buffer: Deque[Tuple[int, Event]] = deque(maxlen=buffer_size)
+        self.next_seq = 0
+        self.finished = False
+        self.subscribers = 0
+        self._appended = asyncio.Event()
+        self._expiry: Optional[asyncio.TimerHandle] = None
+        self._task = asyncio.create_task(self._run(events))
+
+    async def _run(self, events: AsyncIterator[Event]):
+        try:
+            async for event in coalesce_events(events, heartbeat=float("inf")):
+                if event is not None:
+                    self._append(event)
+        except Exception as e:
+            print(f"Error in resumable stream {self.id}: {str(e)}")
+            self._append({"status": "error", "message": str(e)})
+        finally:
+            self.finished = True
+            self._notify()
+            if self.subscribers == 0:
+                self._schedule_expiry()
+
+    def _append(self, event: Event):
+        self.buffer.append((self.next_seq, event))
+        self.next_seq += 1
+        self._notify()
+
+    def _notify(self):
+        self._appended.set()
+        self._appended = asyncio.Event()
+
+    def _schedule_expiry(self):
+        if self._expiry is not None:
+            self._expiry.cancel()
+        self._expiry = asyncio.get_running_loop().call_later(self.grace, self._expire)
+
+    def _expire(self):
+        if self.subscribers:
+            return
+        if not self.finished:
+            print(f"No client resumed stream {self.id}, cancelling")
+            self._task.cancel()
+        _streams.pop(self.id, None)
+
+    async def subscribe(
+        self,
+        after_seq: int = -1,
+        request: Optional[Request] = None,
+        heartbeat: float = HEARTBEAT_SECONDS,
+    ) -> AsyncIterator[bytes]:
+        """
+        Stream buffered and future events with a sequence above ``after_seq``.
+
+        Args:
+            after_seq: Last sequence number the client has seen
+            request: Incoming request, used to detect client disconnects
+            heartbeat: Idle seconds before a heartbeat comment
+
+        Yields:
+            bytes: Framed SSE events
+        """
+        self.subscribers += 1
+        if self._expiry is not None:
+            self._expiry.cancel()
+            self._expiry = None
+
+        seq = after_seq + 1
+        last_sent = time.monotonic()
+        try:
+            if self.buffer and self.buffer[0][0] > seq:
+                missed = self.buffer[0][0] - seq
+                print(f"Stream {self.id} resumed with {missed} events evicted")
+                seq = self.buffer[0][0]
+
+            while True:
+                appended = self._appended
+                for event_seq, event in list(self.buffer):
+                    if event_seq >= seq:
+                        yield encode_event(event, f"{self.id}:{event_seq}")
+                        seq = event_seq + 1
+                        last_sent = time.monotonic()
+
+                if self.finished and seq >= self.next_seq:
+                    return
+
+                timeout = heartbeat
+                if request is not None:
+                    timeout = min(timeout, DISCONNECT_CHECK_SECONDS)
+                try:
+                    await asyncio.wait_for(appended.wait(), timeout)
+                except asyncio.TimeoutError:
+                    if request is not None and await request.is_disconnected():
+                        return
+                    if time.monotonic() - last_sent >= heartbeat:
+                        yield HEARTBEAT
+                        last_sent = time.monotonic()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0:
+                self._schedule_expiry()
+
+
+_streams: Dict[str, ResumableStream] = {}
+
+
+def parse_last_event_id(value: Optional[str]) -> Optional[Tuple[str, int]]:
+    """Split a ``<stream_id>:<seq>`` Last-Event-ID, or None if malformed."""
+    if not value or ":" not in value:
+        return None
+    stream_id, _, seq = value.rpartition(":")
+    try:
+        return stream_id, int(seq)
+    except ValueError:
+        return None
+
+
+def _response(stream: ResumableStream, after_seq: int, request: Request):
+    return StreamingResponse(
+        stream.subscribe(after_seq, request),
+        media_type="text/event-stream",
+        headers={**SSE_HEADERS, "X-Stream-Id": stream.id},
+    )
+
+
+def resume_sse_response(
+    request: Request, stream_id: Optional[str] = None
+) -> Optional[StreamingResponse]:
+    """
+    Resume an active stream named by the request's ``Last-Event-ID``.
+
+    Args:
+        request: Incoming request
+        stream_id: Stream to resume when the client has no event id yet
+
+    Returns:
+        A response replaying from the buffer, or None if nothing to resume
+    """
+    last_event = parse_last_event_id(request.headers.get("last-event-id"))
+    if last_event is not None:
+        stream_id, after_seq = last_event
+    elif stream_id is not None:
+        after_seq = -1
+    else:
+        return None
+
+    stream = _streams.get(stream_id)
+    if stream is None:
+        return None
+    print(f"Resuming stream {stream_id} after event {after_seq}")
+    return _response(stream, after_seq, request)
+
+
+def resumable_sse_response(
+    events: AsyncIterator[Event], request: Request
+) -> StreamingResponse:
+    """
+    Start a new resumable stream and subscribe the current request to it.
+
+    Args:
+        events: Async generator of dicts or raw strings
+        request: Incoming request
+
+    Returns:
+        A text/event-stream StreamingResponse with an ``X-Stream-Id`` header
+    """
+    stream = ResumableStream(events)
+    _streams[stream.id] = stream
+    return _response(stream, -1, request)
@@ -0,0 +1,207 @@
+"""
+Server-sent events streaming.
+
+Route generators yield plain dicts (or raw strings); ``sse_response`` turns
+them into a ``text/event-stream`` response that:
+
+- serializes with orjson when available and reuses pre-encoded framing,
+- coalesces consecutive token chunks over a short time/size window,
+- sends heartbeat comments while the stream is idle,
+- cancels the upstream generator as soon as the client disconnects.
+"""
+
+import asyncio
+import os
+import time
+from typing import Any, AsyncIterator, Dict, Optional, Union
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+from app.core.responses import dumps
+
+SSE_HEADERS = {
+    "X-Accel-Buffering": "no",
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+}
+
+COALESCE_SECONDS = float(os.getenv("SSE_COALESCE_MS", "30")) / 1000
+COALESCE_BYTES = int(os.getenv("SSE_COALESCE_BYTES", "256"))
+HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+DISCONNECT_CHECK_SECONDS = 1.0
+
+_DATA = b"data: "
+_ID = b"id: "
+_END = b"\n\n"
+_NEWLINE = b"\n"
+HEARTBEAT = b": ping\n\n"
+
+Event = Union[Dict[str, Any], str]
+
+
+def encode_event(data: Event, event_id: Optional[str] = None) -> bytes:
+    """
+    Frame one SSE event.
+
+    Args:
+        data: Dict to serialize as JSON, or a raw string payload
+        event_id: Optional SSE id line
+
+    Returns:
+        Encoded event bytes
+    """
+    payload = data.encode("utf-8") if isinstance(data, str) else dumps(data)
+    if event_id is None:
+        return _DATA + payload + _END
+    return _ID + event_id.encode("utf-8") + _NEWLINE + _DATA + payload + _END
+
+
+def _can_coalesce(pending: Event, event: Event) -> bool:
+    """Events merge if both are raw strings or chunk dicts with equal metadata."""
+    if isinstance(pending, str) or isinstance(event, str):
+        return isinstance(pending, str) and isinstance(event, str)
+    if "chunk" not in pending or "chunk" not in event or len(pending) != len(event):
+        return False
+    return all(k == "chunk" or event.get(k) == v for k, v in pending.items())
+
+
+def _merge(pending: Event, event: Event) -> Event:
+    if isinstance(pending, str):
+        return pending + event
+    merged = dict(pending)
+    merged["chunk"] = pending["chunk"] + event["chunk"]
+    return merged
+
+
+def _size(event: Event) -> int:
+    return len(event if isinstance(event, str) else event["chunk"])
+
+
+_DONE = object()
+
+
+async def coalesce_events(
+    events: AsyncIterator[Event],
+    request: Optional[Request] = None,
+    window: float = COALESCE_SECONDS,
+    max_bytes: int = COALESCE_BYTES,
+    heartbeat: float = HEARTBEAT_SECONDS,
+) -> AsyncIterator[Optional[Event]]:
+    """
+    Merge bursts of token chunks and interleave idle heartbeats.
+
+    The source generator runs in its own task so a slow upstream never
+    delays flushing; it is cancelled when the client goes away.
+
+    Yields:
+        Events ready to send, or None when a heartbeat is due
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=256)
+
+    async def produce():
+        try:
+            async for event in events:
+                await queue.put(event)
+            await queue.put(_DONE)
+        except Exception as e:
+            await queue.put(e)
+
+    producer = asyncio.create_task(produce())
+    pending: Optional[Event] = None
+    flush_at = 0.0
+    last_sent = time.monotonic()
+    last_disconnect_check = last_sent
+
+    try:
+        while True:
+            now = time.monotonic()
+            if pending is not None:
+                timeout = flush_at - now
+            else:
+                timeout = last_sent + heartbeat - now
+            if request is not None:
+                next_check = last_disconnect_check + DISCONNECT_CHECK_SECONDS
+                timeout = min(timeout, next_check - now)
+
+            if not queue.empty():
+                item = queue.get_nowait()
+            else:
+                try:
+                    item = await asyncio.wait_for(queue.get(), max(timeout, 0))
+                except asyncio.TimeoutError:
+                    item = None
+
+            now = time.monotonic()
+            if (
+                request is not None
+                and now - last_disconnect_check >= DISCONNECT_CHECK_SECONDS
+            ):
+                last_disconnect_check = now
+                if await request.is_disconnected():
+                    print("Client disconnected, cancelling stream")
+                    return
+
+            if item is None:
+                if pending is not None and now >= flush_at:
+                    yield pending
+                    pending, last_sent = None, now
+                elif pending is None and now - last_sent >= heartbeat:
+                    yield None
+                    last_sent = now
+                continue
+
+            if item is _DONE:
+                if pending is not None:
+                    yield pending
+                return
+            if isinstance(item, Exception):
+                raise item
+
+            if pending is not None and _can_coalesce(pending, item):
+                pending = _merge(pending, item)
+            else:
+                if pending is not None:
+                    yield pending
+                    last_sent = now
+                if isinstance(item, str) or "chunk" in item:
+                    pending, flush_at = item, now + window
+                else:
+                    yield item
+                    pending, last_sent = None, now
+                    continue
+
+            if _size(pending) >= max_bytes or now >= flush_at:
+                yield pending
+                pending, last_sent = None, now
+    finally:
+        producer.cancel()
+
+
+async def encode_stream(
+    events: AsyncIterator[Event], request: Optional[Request] = None, **options
+) -> AsyncIterator[bytes]:
+    """Coalesce and frame events as SSE bytes."""
+    async for event in coalesce_events(events, request, **options):
+        yield HEARTBEAT if event is None else encode_event(event)
+
+
+def sse_response(
+    events: AsyncIterator[Event], request: Optional[Request] = None, **options
+) -> StreamingResponse:
+    """
+    Build a streaming SSE response from a generator of events.
+
+    Args:
+        events: Async generator of dicts or raw strings
+        request: Incoming request, used to detect client disconnects
+        **options: Overrides for window, max_bytes and heartbeat
+
+    Returns:
+        A text/event-stream StreamingResponse
+    """
+    return StreamingResponse(
+        encode_stream(events, request, **options),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
@@ -0,0 +1,145 @@
+"""
+Cold start handling.
+
+Defers the expensive parts of startup (OpenAI client, tiktoken encoding)
+to a background warm-up thread and measures the time from process spawn
+to the first served request. Run ``python -m app.core.startup`` to spawn
+a fresh server and report that time.
+"""
+
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
+
+from app.services.o4_mini_service import get_o4_service
+from app.services.pdf_pages import shutdown_raster_pool
+
+
+def _process_start_time() -> float:
+    """Wall-clock time this process was spawned, falling back to import time."""
+    try:
+        with open("/proc/self/stat", "r", encoding="utf-8") as f:
+            # Fields after the command name, which may contain spaces.
+            fields = f.read().rsplit(")", 1)[1].split()
+        start_ticks = int(fields[19])
+        with open("/proc/stat", "r", encoding="utf-8") as f:
+            boot_time = next(
+                int(line.split()[1]) for line in f if line.startswith("btime")
+            )
+        return boot_time + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, StopIteration):
+        return time.time()
+
+
+PROCESS_STARTED_AT = _process_start_time()
+
+
+class StartupTimings:
+    """Startup milestones, in seconds since the process was spawned."""
+
+    def __init__(self):
+        self.app_ready: float | None = None
+        self.warm: float | None = None
+        self.first_request: float | None = None
+
+    @staticmethod
+    def since_spawn() -> float:
+        return time.time() - PROCESS_STARTED_AT
+
+    def as_dict(self) -> dict:
+        return {
+            "app_ready_seconds": self.app_ready,
+            "warm_seconds": self.warm,
+            "first_request_seconds": self.first_request,
+        }
+
+
+timings = StartupTimings()
+
+
+def _warm_up():
+    try:
+        get_o4_service().preload()
+        timings.warm = timings.since_spawn()
+        print(f"Warm-up finished {timings.warm:.3f}s after process start")
+    except Exception as e:
+        print(f"Warm-up failed: {str(e)}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Start serving immediately and warm the shared service in the background.
+
+    Background job workers and PDF raster workers are stopped on shutdown.
+    """
+    _ = app
+    timings.app_ready = timings.since_spawn()
+    print(f"App ready {timings.app_ready:.3f}s after process start")
+    threading.Thread(target=_warm_up, name="warm-up", daemon=True).start()
+    yield
+    # Imported here so the job subsystem stays off the cold start path.
+    from app.services.jobs import get_job_queue
+
+    await get_job_queue().stop()
+    shutdown_raster_pool()
+
+
+async def record_first_request(request: Request, call_next):
+    """HTTP middleware recording when the first request was served."""
+    response = await call_next(request)
+    if timings.first_request is None:
+        timings.first_request = timings.since_spawn()
+        print(
+            f"First request ({request.url.path}) served "
+            f"{timings.first_request:.3f}s after process start"
+        )
+    return response
+
+
+def measure_startup(port: int = 8765, timeout: float = 60.0) -> float:
+    """
+    Spawn a fresh uvicorn process and time it until the first served request.
+
+    Args:
+        port: Port to bind the temporary server to
+        timeout: Seconds to wait before giving up
+
+    Returns:
+        Seconds from spawn to the first successful response
+    """
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app.main:app",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ],
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1):
+                    return time.perf_counter() - started
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.01)
+        raise TimeoutError(f"Server did not respond within {timeout}s")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == "__main__":
+    print(f"Spawn to first served request: {measure_startup():.3f}s")
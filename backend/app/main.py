@@ -4,23 +4,50 @@ from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
-from app.routers import test, pdf, generate
+from app.routers import (
+    test,
+    pdf,
+    generate,
+    streams,
+    jobs,
+    batch,
+    calendar,
+    metrics,
+    admin,
+)
+from app.core.admission import admission_control
 from app.core.limiter import limiter
+from app.core.profiling import profile_requests, profiling_enabled
+from app.core.responses import CompressionMiddleware, FastJSONResponse
+from app.core.startup import lifespan, record_first_request
 from typing import cast
 from starlette.middleware.exceptions import ExceptionMiddleware
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
 
 origins = ["http://localhost:3000"]
 
+# Registered before CORS so that CORS wraps it and 503s stay readable.
+app.middleware("http")(admission_control)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Stream-Id", "Retry-After"],
 )
 
+app.middleware("http")(record_first_request)
+
+# Only installed when an admin token or sampling rate makes profiling possible.
+if profiling_enabled():
+    app.middleware("http")(profile_requests)
+
+# Added last so it is outermost and compresses what every other layer sends.
+app.add_middleware(CompressionMiddleware)
+
 app.state.limiter = limiter
 app.add_exception_handler(
     RateLimitExceeded, cast(ExceptionMiddleware, _rate_limit_exceeded_handler)
@@ -29,6 +56,12 @@ app.add_exception_handler(
 app.include_router(test.router)
 app.include_router(pdf.router)
 app.include_router(generate.router)
+app.include_router(streams.router)
+app.include_router(jobs.router)
+app.include_router(batch.router)
+app.include_router(calendar.router)
+app.include_router(metrics.router)
+app.include_router(admin.router)
 
 
 @app.get("/")
@@ -46,6 +46,8 @@ Be precise and only include information actually visible in the image.
 
 SYLLABUS_ANALYSIS_USER_PROMPT = "Analyze this image and extract all event information. Look for event names, dates, times, locations, and any other schedule details. Return only the JSON format specified in the system prompt."
 
+SYLLABUS_TILE_USER_PROMPT = "This image is section {index} of {count} of a larger image, and it overlaps the neighbouring sections. Analyze this section and extract all event information. Skip any row cut off at the top or bottom edge; it appears whole in a neighbouring section. Return only the JSON format specified in the system prompt."
+
 # PDF exam analysis prompts
 PDF_EXAM_ANALYSIS_SYSTEM_PROMPT = """
 You are an expert at analyzing PDF documents containing course syllabi and academic schedules to identify exam dates and important academic events.
@@ -91,6 +93,8 @@ IMPORTANT FOR EXAM TITLES:
 
 PDF_EXAM_ANALYSIS_USER_PROMPT = "Analyze this PDF document and extract all exam dates, assignment deadlines, and important academic events. Look for midterms, finals, quizzes, project due dates, and other time-sensitive academic events. Return only the JSON format specified in the system prompt."
 
+PDF_PAGE_USER_PROMPT = "This image is page {page} of {count} of a scanned PDF document. Analyze this page and extract all exam dates, assignment deadlines, and important academic events. Look for midterms, finals, quizzes, project due dates, and other time-sensitive academic events. Return only the JSON format specified in the system prompt."
+
 # Chat assistant prompts
 CHAT_SYSTEM_PROMPT = """
 You are a helpful schedule assistant that helps users manage their academic calendar. You can understand natural language requests about schedule changes and generate ICS calendar files.
@@ -140,3 +144,18 @@ If the user is just chatting or asking questions, return:
 
 REMEMBER: Always return valid JSON. Never return plain text. Every response must be parseable as JSON.
 """
+
+# PDF re-analysis prompt for near-duplicate syllabi
+PDF_EXAM_UPDATE_SYSTEM_PROMPT = """
+You are updating the extracted exam and academic events of a course syllabus. A previous version of this syllabus was already analyzed; you receive its extracted JSON, the passages of the new version that differ from the old one, and the passages of the old version that are no longer in the new one.
+
+Apply the changes to the previous result:
+- Update events whose dates, times, locations or details changed
+- Add events that appear only in the changed passages
+- Remove events the changed passages clearly cancel or replace
+- Remove events that came from the removed passages and don't appear in the changed passages
+- Keep every other event exactly as it was
+- Update course_name and course_code only if the changed passages show new ones
+
+Return ONLY the complete, updated JSON object in the same structure as the previous result (no additional text), including unchanged events.
+"""
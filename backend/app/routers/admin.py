@@ -0,0 +1,41 @@
+"""
+Admin routes, authenticated with ``X-Admin-Token``.
+
+"/admin/profiles" lists stored request profiles.
+"/admin/profiles/{name}" downloads a profile in collapsed-stack format.
+"""
+
+import os
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse
+
+from app.core.admin import require_admin
+from app.core.profiling import PROFILES_DIR, list_profiles
+
+router = APIRouter(
+    prefix="/admin", tags=["Admin"], dependencies=[Depends(require_admin)]
+)
+
+
+@router.get("/profiles")
+async def get_profiles():
+    """
+    List stored profiles, newest first.
+
+    Profile names encode the time, method and path of the profiled request.
+    Open a downloaded profile in https://www.speedscope.app or pipe it to
+    flamegraph.pl.
+    """
+    return {"profiles": list_profiles()}
+
+
+@router.get("/profiles/{name}")
+async def get_profile(name: str):
+    """Download one profile."""
+    if os.path.basename(name) != name or not name.endswith(".collapsed"):
+        raise HTTPException(status_code=400, detail="Invalid profile name")
+    path = os.path.join(PROFILES_DIR, name)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain", filename=name)
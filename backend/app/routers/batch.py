@@ -0,0 +1,106 @@
+"""
+Batch upload routes.
+
+"/batch/analyze" analyzes several PDFs and images concurrently and streams
+their progress as one multiplexed SSE feed.
+"""
+
+import asyncio
+import os
+from typing import List
+
+from fastapi import APIRouter, File, HTTPException, Request, UploadFile
+
+from app.core.limiter import limiter
+from app.core.resumable import resumable_sse_response, resume_sse_response
+from app.services.analysis import ANALYZERS, upload_kind
+from app.services.batch import merge_schedules
+
+router = APIRouter(prefix="/batch", tags=["Batch Analysis"])
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "12"))
+
+
+@limiter.limit("10/day")
+@router.post("/analyze")
+async def analyze_batch(request: Request, files: List[UploadFile] = File(None)):
+    """
+    Analyze a semester's worth of syllabi in one request.
+
+    Files are analyzed concurrently, at most ``BATCH_CONCURRENCY`` at a
+    time. Per-file events use the /pdf/analyze-stream vocabulary tagged with
+    ``file`` (upload index) and ``filename``. The final untagged
+    ``complete`` event carries the merged courses and a combined ICS.
+
+    Args:
+        files: Uploaded PDF and image files
+
+    Returns:
+        Streamed, multiplexed analysis response
+    """
+    resumed = resume_sse_response(request)
+    if resumed is not None:
+        return resumed
+
+    if not files:
+        raise HTTPException(status_code=400, detail="No files uploaded")
+    if len(files) > BATCH_MAX_FILES:
+        raise HTTPException(
+            status_code=400, detail=f"At most {BATCH_MAX_FILES} files per batch"
+        )
+
+    uploads = [
+        (index, file.filename or f"file-{index}", upload_kind(file.content_type))
+        for index, file in enumerate(files)
+    ]
+    contents = [await file.read() for file in files]
+    print(f"Received batch of {len(files)} files")
+
+    async def generate_stream():
+        queue: asyncio.Queue = asyncio.Queue()
+        semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+        results = {}
+
+        async def run(index: int, filename: str, kind: str | None):
+            tag = {"file": index, "filename": filename}
+
+            def publish(event):
+                queue.put_nowait({**event, **tag})
+
+            if kind is None:
+                publish({"status": "error", "message": "File must be a PDF or image"})
+                return
+
+            async with semaphore:
+                try:
+                    results[index] = await ANALYZERS[kind](contents[index], publish)
+                    publish({"status": "complete", "data": results[index]})
+                except Exception as e:
+                    print(f"Error analyzing {filename}: {str(e)}")
+                    publish({"status": "error", "message": str(e)})
+
+        yield {
+            "status": "analyzing",
+            "message": f"Analyzing {len(uploads)} files...",
+            "files": [filename for _, filename, _ in uploads],
+        }
+
+        tasks = [asyncio.create_task(run(*upload)) for upload in uploads]
+        finished = asyncio.gather(*tasks)
+        finished.add_done_callback(lambda _: queue.put_nowait(None))
+        try:
+            while (event := await queue.get()) is not None:
+                yield event
+        finally:
+            finished.cancel()
+
+        try:
+            merged = merge_schedules([results[i] for i in sorted(results)])
+        except Exception as e:
+            print(f"Error merging batch results: {str(e)}")
+            yield {"status": "error", "message": f"Error merging results: {str(e)}"}
+            return
+        yield {"status": "complete", "data": merged}
+
+    return resumable_sse_response(generate_stream(), request)
@@ -0,0 +1,261 @@
+"""
+Calendar routes.
+
+"/calendar/import" imports an existing ICS calendar for use in chat.
+"/calendar/subscriptions" creates, updates and deletes subscribable calendars.
+"/calendar/{calendar_id}.ics" serves a subscribable calendar to calendar apps.
+"""
+
+import asyncio
+import hashlib
+import os
+from datetime import datetime, timedelta, tzinfo
+from typing import Any, Dict, Optional
+
+from fastapi import (
+    APIRouter,
+    File,
+    Form,
+    Header,
+    HTTPException,
+    Request,
+    Response,
+    UploadFile,
+)
+
+from app.core.limiter import limiter
+from app.core.responses import negotiate_encoding
+from app.services.ics_import import (
+    IMPORT_FUTURE_DAYS,
+    IMPORT_PAST_DAYS,
+    import_calendar,
+    resolve_zone,
+    save_import,
+)
+from app.services.subscriptions import (
+    etag_for,
+    get_subscription_store,
+    http_date,
+    not_modified,
+)
+
+router = APIRouter(prefix="/calendar", tags=["Calendars"])
+
+IMPORT_CHUNK_SIZE = 64 * 1024
+# Public origin for subscription URLs when running behind a proxy.
+SUBSCRIPTION_BASE_URL = os.getenv("SUBSCRIPTION_BASE_URL", "")
+FEED_MAX_AGE = int(os.getenv("CALENDAR_FEED_MAX_AGE", "300"))
+
+
+def _parse_day(value: str, name: str, zone: Optional[tzinfo]) -> datetime:
+    try:
+        day = datetime.fromisoformat(value)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400, detail=f"{name} must be an ISO 8601 date"
+        ) from e
+    if day.tzinfo is not None:
+        # Occurrences are naive: in ``zone``, or in each event's own zone
+        # when there is none, in which case the wall-clock time is kept.
+        if zone is not None:
+            day = day.astimezone(zone)
+        day = day.replace(tzinfo=None)
+    return day
+
+
+@limiter.limit("30/day")
+@router.post("/import")
+async def import_ics(
+    request: Request,
+    file: UploadFile = File(...),
+    timezone: str = Form(None),
+    start: str = Form(None),
+    end: str = Form(None),
+):
+    _ = request
+    """
+    Import an ICS export (Google Calendar, Outlook, Apple Calendar).
+
+    The multipart body is received in full first (Starlette spools uploads
+    to disk past 1MB); the spooled file is then parsed in chunks, so the
+    parser never holds the whole export, and recurring events are expanded
+    into the requested window. Pass the returned ``import_id`` to
+    /generate/chat to let the assistant see the relevant events.
+
+    Args:
+        file: ICS file
+        timezone: IANA zone to express event times in, defaults to each
+            event's own zone
+        start: Window start (ISO date), defaults to ``IMPORT_PAST_DAYS`` ago
+        end: Window end (ISO date), defaults to ``IMPORT_FUTURE_DAYS`` ahead
+
+    Returns:
+        Imported events in the /generate/generate-ics structure plus the
+        ``import_id``
+    """
+    zone = resolve_zone(timezone)
+    if timezone and zone is None:
+        raise HTTPException(status_code=400, detail=f"Unknown timezone: {timezone}")
+
+    today = datetime.combine(datetime.now(zone).date(), datetime.min.time())
+    window_start = today - timedelta(days=IMPORT_PAST_DAYS)
+    window_end = today + timedelta(days=IMPORT_FUTURE_DAYS)
+    if start:
+        window_start = _parse_day(start, "start", zone)
+    if end:
+        window_end = _parse_day(end, "end", zone)
+    if window_end <= window_start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+
+    # Same export and options give the same id, so re-imports are free.
+    digest = hashlib.sha256(
+        f"{timezone}|{window_start.isoformat()}|{window_end.isoformat()}".encode()
+    )
+
+    async def chunks():
+        while chunk := await file.read(IMPORT_CHUNK_SIZE):
+            digest.update(chunk)
+            yield chunk
+
+    try:
+        schedule = await import_calendar(chunks(), window_start, window_end, zone)
+    except ValueError as e:
+        print(f"Error importing calendar {file.filename}: {str(e)}")
+        raise HTTPException(status_code=400, detail=f"Invalid ICS file: {str(e)}")
+
+    import_id = save_import(schedule, digest.hexdigest())
+    print(
+        f"Imported {len(schedule['events'])} events from {file.filename} "
+        f"as {import_id}"
+    )
+    return {"import_id": import_id, **schedule}
+
+
+def _subscription_info(request: Request, record: Dict[str, Any]) -> Dict[str, Any]:
+    base_url = SUBSCRIPTION_BASE_URL or str(request.base_url)
+    url = f"{base_url.rstrip('/')}/calendar/{record['calendar_id']}.ics"
+    return {
+        "calendar_id": record["calendar_id"],
+        "url": url,
+        "webcal_url": "webcal://" + url.split("://", 1)[1],
+        "etag": etag_for(record["content_hash"]),
+        "event_count": len(record.get("events", [])),
+    }
+
+
+def _owned_calendar(calendar_id: str, token: str) -> Dict[str, Any]:
+    store = get_subscription_store()
+    record = store.load(calendar_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Calendar not found")
+    if not store.check_token(record, token):
+        raise HTTPException(status_code=403, detail="Invalid calendar token")
+    return record
+
+
+@limiter.limit("50/day")
+@router.post("/subscriptions", status_code=201)
+async def create_subscription(request: Request, events_data: Dict[str, Any]):
+    """
+    Create a subscribable calendar from events data.
+
+    Args:
+        events_data: Course and event information, as for
+            /generate/generate-ics
+
+    Returns:
+        The calendar's subscription URLs and the ``token`` needed to update
+        or delete it (only returned here)
+    """
+    record, token = await asyncio.to_thread(
+        get_subscription_store().save, events_data
+    )
+    return {**_subscription_info(request, record), "token": token}
+
+
+@limiter.limit("200/day")
+@router.put("/subscriptions/{calendar_id}")
+async def update_subscription(
+    request: Request,
+    calendar_id: str,
+    events_data: Dict[str, Any],
+    token: str = Header(None, alias="X-Calendar-Token"),
+):
+    """
+    Replace a calendar's events; subscribers pick them up on their next poll.
+
+    Args:
+        calendar_id: Calendar to update
+        events_data: Course and event information
+        token: Edit token returned on creation
+
+    Returns:
+        The calendar's subscription URLs
+    """
+    _owned_calendar(calendar_id, token)
+    record, _ = await asyncio.to_thread(
+        get_subscription_store().save, events_data, calendar_id
+    )
+    return _subscription_info(request, record)
+
+
+@limiter.limit("50/day")
+@router.delete("/subscriptions/{calendar_id}", status_code=204)
+async def delete_subscription(
+    request: Request,
+    calendar_id: str,
+    token: str = Header(None, alias="X-Calendar-Token"),
+):
+    _ = request
+    """Delete a calendar; its subscription URL starts returning 404."""
+    _owned_calendar(calendar_id, token)
+    get_subscription_store().delete(calendar_id)
+    return Response(status_code=204)
+
+
+@router.api_route("/{calendar_id}.ics", methods=["GET", "HEAD"])
+async def subscription_feed(request: Request, calendar_id: str):
+    """
+    Serve a subscribable calendar.
+
+    Not rate limited, since calendar apps poll it every few minutes. Polls
+    carrying a matching ``If-None-Match`` or ``If-Modified-Since`` get a 304;
+    others get the pre-rendered (and, if accepted, pre-gzipped) body.
+
+    Args:
+        calendar_id: Calendar to serve
+
+    Returns:
+        ICS body or 304 Not Modified
+    """
+    store = get_subscription_store()
+    record = store.load(calendar_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Calendar not found")
+
+    # Only a gzip variant is pre-rendered; other codings get the identity
+    # body, which the compression middleware leaves alone.
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"), ("gzip",))
+    headers = {
+        "ETag": etag_for(record["content_hash"], encoding),
+        "Last-Modified": http_date(record["updated_at"]),
+        "Cache-Control": f"max-age={FEED_MAX_AGE}",
+        "Vary": "Accept-Encoding",
+    }
+    if not_modified(
+        headers["ETag"],
+        record["updated_at"],
+        request.headers.get("if-none-match"),
+        request.headers.get("if-modified-since"),
+    ):
+        return Response(status_code=304, headers=headers)
+
+    rendered = store.rendered(record)
+    if encoding == "gzip":
+        headers["Content-Encoding"] = "gzip"
+        body = rendered.gzip_body
+    else:
+        body = rendered.body
+    return Response(
+        content=body, media_type="text/calendar; charset=utf-8", headers=headers
+    )
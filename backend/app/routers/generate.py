@@ -2,250 +2,54 @@
 AI generation routes.
 
 "/analyze-image" analyzes uploaded syllabus images and generates ICS files.
+"/analyze-image-stream" analyzes uploaded syllabus images using streaming.
 "/generate-ics" generates ICS calendar files from events data.
 "/generate-ics-selected" generates ICS calendar files from selected events only.
 "/chat" chat with the AI assistant for schedule management.
 "/chat-stream" chat with the AI assistant using streaming.
 """
 
+import asyncio
 import base64
 import json
 import re
 from datetime import datetime
-from typing import Dict, Any, AsyncGenerator
-
-import aiohttp
-from fastapi import APIRouter, UploadFile, File, HTTPException, Form, Request
-from fastapi.responses import StreamingResponse, Response
-
-from app.services.o4_mini_service import OpenAIo4Service
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, UploadFile, File, HTTPException, Form, Request, Depends
+from fastapi.responses import Response
+
+from app.services.o4_mini_service import OpenAIo4Service, get_o4_service
+from app.services.budgets import STREAM_RESTART
+from app.services.ics import generate_ics_file
+from app.services.ics_import import load_import, summarize_for_chat
+from app.services.image_tiles import EventMerger, split_image
+from app.services.chat_commands import (
+    fast_path_stats,
+    parse_schedule_field,
+    serve_locally,
+)
+from app.services.routing import ModelRoute
+from app.services.upstream import (
+    ScheduleEventExtractor,
+    analyze_tiles_stream,
+    call_o4_api_stream_hedged,
+    call_vision_api,
+    call_vision_api_stream,
+    parse_schedule_json,
+    plan_text_budget,
+)
 from app.prompts import (
     SYLLABUS_ANALYSIS_SYSTEM_PROMPT,
     SYLLABUS_ANALYSIS_USER_PROMPT,
     CHAT_SYSTEM_PROMPT,
 )
 from app.core.limiter import limiter
+from app.core.responses import FastJSONResponse
+from app.core.resumable import resumable_sse_response, resume_sse_response
 
 router = APIRouter(prefix="/generate", tags=["AI Generation"])
 
-o4_service = OpenAIo4Service()
-
-
-async def call_o4_api_stream(
-    system_prompt: str,
-    data: str,
-) -> AsyncGenerator[str, None]:
-    """
-    Asynchronously streams a response from the OpenAI o4-mini model using SSE.
-
-    This function sends a system prompt and a user-formatted message to the OpenAI
-    Chat Completions API with streaming enabled. It yields incremental chunks of
-    the model's response as they arrive.
-
-    Args:
-        system_prompt (str): The system-level instructions for the model.
-        data (str): Input string from client
-
-    Yields:
-        str: Chunks of the model's response text as they are received.
-    """
-    api_key = o4_service.api_key
-    model = o4_service.model
-    base_url = o4_service.base_url
-    reasoning_effort = o4_service.reasoning_effort
-
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {api_key}",
-    }
-
-    payload = {
-        "model": model,
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": data},
-        ],
-        "max_completion_tokens": 12000,
-        "stream": True,
-        "reasoning_effort": reasoning_effort,
-    }
-
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                base_url, headers=headers, json=payload
-            ) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    print(f"Error response: {error_text}")
-                    raise ValueError(
-                        f"OpenAI API returned status code {response.status}: {error_text}"
-                    )
-
-                line_count = 0
-                async for line in response.content:
-                    line = line.decode("utf-8").strip()
-                    if not line:
-                        continue
-
-                    line_count += 1
-
-                    if line.startswith("data: "):
-                        if line == "data: [DONE]":
-                            break
-                        try:
-                            data = json.loads(line[6:])
-                            content = (
-                                data.get("choices", [{}])[0]
-                                .get("delta", {})
-                                .get("content")
-                            )
-                            if content:
-                                yield content
-                        except json.JSONDecodeError as e:
-                            print(f"JSON decode error: {e} for line: {line}")
-                            continue
-
-                if line_count == 0:
-                    print("Warning: No lines received in stream response")
-
-    except aiohttp.ClientError as e:
-        print(f"Connection error: {str(e)}")
-        raise ValueError(f"Failed to connect to OpenAI API: {str(e)}") from e
-    except Exception as e:
-        print(f"Unexpected error in streaming API call: {str(e)}")
-        raise
-
-
-def call_vision_api(system_prompt: str, user_prompt: str, image_base64: str) -> str:
-    """
-    Call OpenAI Vision API to analyze images.
-
-    Args:
-        system_prompt: System instructions
-        user_prompt: User prompt
-        image_base64: Base64 encoded image
-
-    Returns:
-        AI response as string
-    """
-    try:
-        response = o4_service.default_client.chat.completions.create(
-            model="gpt-4o",  # use vision model
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": user_prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{image_base64}"
-                            },
-                        },
-                    ],
-                },
-            ],
-            max_tokens=4000,
-        )
-
-        if response.choices[0].message.content is None:
-            raise ValueError("No content returned from OpenAI Vision API")
-
-        return response.choices[0].message.content
-
-    except Exception as e:
-        print(f"Error in Vision API call: {str(e)}")
-        raise
-
-
-def generate_ics_file(schedule_data: Dict[str, Any]) -> str:
-    """
-    Generate ICS calendar file from schedule data.
-
-    Args:
-        schedule_data: Dictionary containing course and event information
-
-    Returns:
-        ICS file content as string
-    """
-    course_name = schedule_data.get("course_name", "Course")
-    course_code = schedule_data.get("course_code", "COURSE-101")
-    events = schedule_data.get("events", [])
-
-    # ICS file header
-    ics_content = [
-        "BEGIN:VCALENDAR",
-        "VERSION:2.0",
-        "PRODID:-//Syllendar//AI Generated Calendar//EN",
-        "CALSCALE:GREGORIAN",
-        "METHOD:PUBLISH",
-        f"X-WR-CALNAME:{course_name} ({course_code})",
-        "X-WR-TIMEZONE:UTC",
-    ]
-
-    # Add events
-    for event in events:
-        title = event.get("title", "Event")
-        start_time = event.get("start_time", "2024-01-15T10:00:00")
-        end_time = event.get("end_time", "2024-01-15T11:30:00")
-        location = event.get("location", "")
-        description = event.get("description", "")
-        recurrence = event.get("recurrence", "")
-        days = event.get("days", [])
-
-        # Convert to ICS format
-        start_dt = datetime.fromisoformat(start_time.replace("Z", "+00:00"))
-        end_dt = datetime.fromisoformat(end_time.replace("Z", "+00:00"))
-
-        # Format dates for ICS (using local time without timezone indicator)
-        start_ics = start_dt.strftime("%Y%m%dT%H%M%S")
-        end_ics = end_dt.strftime("%Y%m%dT%H%M%S")
-        created_ics = datetime.now().strftime("%Y%m%dT%H%M%SZ")
-
-        # Generate unique ID
-        uid = f"{course_code}-{title}-{start_ics}@syllendar.com"
-
-        # Add event
-        ics_content.extend(
-            [
-                "BEGIN:VEVENT",
-                f"UID:{uid}",
-                f"DTSTART:{start_ics}",
-                f"DTEND:{end_ics}",
-                f"DTSTAMP:{created_ics}",
-                f"SUMMARY:{title}",
-                f"DESCRIPTION:{description}",
-            ]
-        )
-
-        if location:
-            ics_content.append(f"LOCATION:{location}")
-
-        # Add recurrence rule if specified
-        if recurrence == "weekly" and days:
-            # Convert days to ICS format
-            day_map = {
-                "Monday": "MO",
-                "Tuesday": "TU",
-                "Wednesday": "WE",
-                "Thursday": "TH",
-                "Friday": "FR",
-                "Saturday": "SA",
-                "Sunday": "SU",
-            }
-            ics_days = [day_map.get(day, day) for day in days]
-            rrule = f"FREQ=WEEKLY;BYDAY={','.join(ics_days)};UNTIL=20251231T235959"
-            ics_content.append(f"RRULE:{rrule}")
-
-        ics_content.append("END:VEVENT")
-
-    # ICS file footer
-    ics_content.append("END:VCALENDAR")
-
-    return "\r\n".join(ics_content)
-
 
 @limiter.limit("50/day")
 @router.post("/analyze-image")
@@ -270,6 +74,13 @@ async def analyze_image(request: Request, file: UploadFile = File(...)):
         # Read image data
         image_data = await file.read()
 
+        # Tall or dense images are analyzed as overlapping tiles
+        tiles = await asyncio.to_thread(split_image, image_data)
+        if tiles:
+            async for event in analyze_tiles_stream(tiles):
+                if event["status"] == "complete":
+                    return FastJSONResponse(event["data"])
+
         # Convert to base64 for AI analysis
         image_base64 = base64.b64encode(image_data).decode("utf-8")
 
@@ -283,13 +94,7 @@ async def analyze_image(request: Request, file: UploadFile = File(...)):
 
         try:
 
-            # extract json
-            json_match = re.search(r"\{.*\}", ai_response, re.DOTALL)
-            if json_match:
-                json_str = json_match.group()
-                schedule_data = json.loads(json_str)
-            else:
-                schedule_data = json.loads(ai_response)
+            schedule_data = parse_schedule_json(ai_response)
 
             print(f"Parsed schedule data: {schedule_data}")
 
@@ -303,7 +108,98 @@ async def analyze_image(request: Request, file: UploadFile = File(...)):
             )
 
         # Return extracted events as JSON
-        return schedule_data
+        return FastJSONResponse(schedule_data)
+
+    except Exception as e:
+        print(f"Error processing image: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
+
+
+@limiter.limit("50/day")
+@router.post("/analyze-image-stream")
+async def analyze_image_stream(request: Request, file: UploadFile = File(None)):
+    """
+    Analyze uploaded syllabus image using streaming.
+
+    Events use the /pdf/analyze-stream vocabulary; "streaming" events also
+    carry the schedule ``events`` completed by their chunk, so clients can
+    show results before the response finishes. Reconnects carrying
+    ``Last-Event-ID`` resume the buffered stream, in which case the file may
+    be omitted.
+
+    Args:
+        file: Uploaded image file
+
+    Returns:
+        Streamed analysis response
+    """
+    try:
+        resumed = resume_sse_response(request)
+        if resumed is not None:
+            return resumed
+
+        # Validate file type
+        if file is None or not (file.content_type or "").startswith("image/"):
+            raise HTTPException(status_code=400, detail="File must be an image")
+
+        print(f"Received file: {file.filename}, content_type: {file.content_type}")
+
+        image_data = await file.read()
+        image_base64 = base64.b64encode(image_data).decode("utf-8")
+
+        async def generate_stream():
+            yield {"status": "analyzing", "message": "Analyzing image content..."}
+
+            try:
+                tiles = await asyncio.to_thread(split_image, image_data)
+                if tiles:
+                    yield {
+                        "status": "analyzing",
+                        "message": f"Analyzing image in {len(tiles)} sections...",
+                    }
+                    async for event in analyze_tiles_stream(tiles):
+                        yield event
+                    return
+
+                extractor = ScheduleEventExtractor()
+                merger = EventMerger()
+                async for chunk in call_vision_api_stream(
+                    SYLLABUS_ANALYSIS_SYSTEM_PROMPT,
+                    SYLLABUS_ANALYSIS_USER_PROMPT,
+                    image_base64,
+                ):
+                    if chunk is STREAM_RESTART:
+                        extractor = ScheduleEventExtractor()
+                        yield {
+                            "status": "analyzing",
+                            "message": "Response was cut off, retrying...",
+                        }
+                        continue
+                    event = {"status": "streaming", "chunk": chunk}
+                    events = [e for e in extractor.feed(chunk) if merger.add(e)]
+                    if events:
+                        event["events"] = events
+                    yield event
+                full_response = extractor.text
+
+                try:
+                    schedule_data = parse_schedule_json(full_response)
+                    print(f"Parsed schedule data: {schedule_data}")
+                    yield {"status": "complete", "data": schedule_data}
+
+                except json.JSONDecodeError as e:
+                    print(f"JSON decode error: {e}")
+                    print(f"Raw AI response: {full_response}")
+                    yield {
+                        "status": "error",
+                        "message": f"AI returned invalid JSON format. Response: {full_response[:200]}...",
+                    }
+
+            except Exception as e:
+                print(f"Error in streaming image analysis: {str(e)}")
+                yield {"status": "error", "message": f"Error analyzing image: {str(e)}"}
+
+        return resumable_sse_response(generate_stream(), request)
 
     except Exception as e:
         print(f"Error processing image: {str(e)}")
@@ -391,30 +287,72 @@ async def generate_ics_from_selected_events(
         )
 
 
+def imported_calendar_context(import_id: Optional[str], message: str) -> str:
+    """
+    Summarize the imported calendar events relevant to a chat message.
+
+    Args:
+        import_id: Id returned by /calendar/import
+        message: The user's message
+
+    Returns:
+        Token-budgeted summary to prepend to the conversation, or ""
+    """
+    imported = load_import(import_id) if import_id else None
+    if imported is None:
+        return ""
+    summary = summarize_for_chat(imported, message, get_o4_service().count_tokens)
+    return f"{summary}\n\n" if summary else ""
+
+
 @limiter.limit("50/day")
 @router.post("/chat")
 async def chat_with_assistant(
-    request: Request, message: str = Form(...), conversation_history: str = Form(None)
+    request: Request,
+    message: str = Form(...),
+    conversation_history: str = Form(None),
+    events: str = Form(None),
+    import_id: str = Form(None),
+    o4_service: OpenAIo4Service = Depends(get_o4_service),
 ):
     _ = request
     """
     Chat with the AI assistant for schedule management.
+
+    When the client sends its current schedule as ``events`` (``ics_data``
+    JSON), simple edits like "delete quiz 3" are applied locally without
+    calling the model. With an ``import_id`` from /calendar/import, the
+    imported events around the dates the message mentions are summarized
+    for the model.
     """
     try:
         # Build the conversation context
         conversation_context = ""
+        history = []
         if conversation_history:
             try:
                 history = json.loads(conversation_history)
-                for msg in history:
+                for msg in history if isinstance(history, list) else []:
+                    if not isinstance(msg, dict):
+                        continue
                     role = "User" if msg.get("isUser", False) else "Assistant"
                     conversation_context += f"{role}: {msg.get('text', '')}\n"
             except json.JSONDecodeError:
                 # if malformed data, just ignore
-                pass
+                history = []
+
+        local_reply = serve_locally(
+            message, parse_schedule_field(events), history, o4_service.model
+        )
+        if local_reply is not None:
+            return FastJSONResponse(local_reply)
+        fast_path_stats.record_upstream()
 
         # Add current message
         conversation_context += f"User: {message}\n"
+        conversation_context = (
+            imported_calendar_context(import_id, message) + conversation_context
+        )
 
         # Build system prompt with current datetime context to anchor relative dates
         now = datetime.now().astimezone()
@@ -428,21 +366,20 @@ async def chat_with_assistant(
         )
 
         # Call the AI service with the chat prompt and conversation context
-        response = o4_service.default_client.chat.completions.create(
-            model=o4_service.model,
-            messages=[
+        response = o4_service.complete(
+            [
                 {"role": "system", "content": system_prompt_with_now},
                 {"role": "user", "content": conversation_context},
             ],
-            max_completion_tokens=12000,
-            reasoning_effort=o4_service.reasoning_effort,
+            budget=plan_text_budget(
+                "chat",
+                system_prompt_with_now,
+                conversation_context,
+                o4_service.model,
+                o4_service.reasoning_effort,
+            ),
         )
 
-        if response.choices[0].message.content is None:
-            raise ValueError("No content returned from OpenAI o4-mini")
-
-        response = response.choices[0].message.content
-
         # Parse the JSON response
         try:
             parsed_response = json.loads(response)
@@ -454,16 +391,18 @@ async def chat_with_assistant(
                 ) == "generate_ics" and parsed_response.get("ics_data"):
                     result["action"] = "generate_ics"
                     result["ics_data"] = parsed_response["ics_data"]
-                return result
+                return FastJSONResponse(result)
             else:
                 # If no response field, return a clean error message
-                return {
-                    "action": "chat",
-                    "response": "I apologize, but I encountered an issue processing your request. Please try again.",
-                }
+                return FastJSONResponse(
+                    {
+                        "action": "chat",
+                        "response": "I apologize, but I encountered an issue processing your request. Please try again.",
+                    }
+                )
         except json.JSONDecodeError:
             # If it's not valid JSON, wrap the plain text response in JSON format
-            return {"action": "chat", "response": response}
+            return FastJSONResponse({"action": "chat", "response": response})
 
     except Exception as e:
         raise HTTPException(
@@ -474,27 +413,59 @@ async def chat_with_assistant(
 @limiter.limit("50/day")
 @router.post("/chat-stream")
 async def chat_with_assistant_stream(
-    request: Request, message: str = Form(...), conversation_history: str = Form(None)
+    request: Request,
+    message: str = Form(...),
+    conversation_history: str = Form(None),
+    events: str = Form(None),
+    import_id: str = Form(None),
 ):
-    _ = request
     """
     Chat with the AI assistant for schedule management using streaming.
+
+    Reconnects carrying ``Last-Event-ID`` resume the buffered stream. Simple
+    edits to a schedule sent as ``events`` are answered locally, and an
+    ``import_id`` adds imported events, as in /chat. When a reply cut off by
+    its output budget is retried, a ``reset`` event tells the client to
+    discard the text streamed so far.
     """
     try:
+        resumed = resume_sse_response(request)
+        if resumed is not None:
+            return resumed
+
         # Build the conversation context
         conversation_context = ""
+        history = []
         if conversation_history:
             try:
                 history = json.loads(conversation_history)
-                for msg in history:
+                for msg in history if isinstance(history, list) else []:
+                    if not isinstance(msg, dict):
+                        continue
                     role = "User" if msg.get("isUser", False) else "Assistant"
                     conversation_context += f"{role}: {msg.get('text', '')}\n"
             except json.JSONDecodeError:
                 # If history is malformed, ignore it
-                pass
+                history = []
+
+        local_reply = serve_locally(
+            message, parse_schedule_field(events), history, get_o4_service().model
+        )
+        if local_reply is not None:
+
+            async def local_stream():
+                yield {"chunk": local_reply["response"]}
+                yield {"ics_data": local_reply["ics_data"]}
+                yield {"done": True}
+
+            return resumable_sse_response(local_stream(), request)
+        fast_path_stats.record_upstream()
 
         # Add current message
         conversation_context += f"User: {message}\n"
+        conversation_context = (
+            imported_calendar_context(import_id, message) + conversation_context
+        )
 
         async def generate_stream():
             full_response = ""
@@ -516,9 +487,24 @@ async def chat_with_assistant_stream(
                     + "Interpret relative dates like 'today', 'tomorrow', and weekdays using this current datetime."
                 )
 
-                async for chunk in call_o4_api_stream(
-                    system_prompt_with_now, conversation_context
+                o4_service = get_o4_service()
+                route = ModelRoute(
+                    o4_service.model, o4_service.reasoning_effort, "chat"
+                )
+                async for chunk in call_o4_api_stream_hedged(
+                    system_prompt_with_now, conversation_context, route, "chat"
                 ):
+                    if chunk is STREAM_RESTART:
+                        # The retry is a new sample; tell the client to drop
+                        # the text it shows before streaming it.
+                        if last_emitted_index > response_start_index:
+                            yield {"reset": True}
+                        full_response = ""
+                        response_started = False
+                        response_closed = False
+                        response_start_index = -1
+                        last_emitted_index = -1
+                        continue
                     if not chunk:
                         continue
                     prev_len = len(full_response)
@@ -562,7 +548,7 @@ async def chat_with_assistant_stream(
                         if last_emitted_index != -1 and end_index > last_emitted_index:
                             new_text = full_response[last_emitted_index:end_index]
                             if new_text:
-                                yield f"data: {json.dumps({'chunk': new_text})}\n\n"
+                                yield {"chunk": new_text}
                                 last_emitted_index = end_index
 
                         if closing_pos is not None:
@@ -574,26 +560,18 @@ async def chat_with_assistant_stream(
                     if final_parsed.get(
                         "action"
                     ) == "generate_ics" and final_parsed.get("ics_data"):
-                        yield f"data: {json.dumps({'ics_data': final_parsed['ics_data']})}\n\n"
+                        yield {"ics_data": final_parsed["ics_data"]}
                 except json.JSONDecodeError:
                     # Ignore; model might have returned plain text
                     pass
 
-                yield f"data: {json.dumps({'done': True})}\n\n"
+                yield {"done": True}
 
             except Exception as e:
                 print(f"Error in streaming: {str(e)}")
-                yield f"data: {json.dumps({'error': str(e)})}\n\n"
-
-        return StreamingResponse(
-            generate_stream(),
-            media_type="text/event-stream",
-            headers={
-                "X-Accel-Buffering": "no",
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-            },
-        )
+                yield {"error": str(e)}
+
+        return resumable_sse_response(generate_stream(), request)
 
     except Exception as e:
         raise HTTPException(
@@ -0,0 +1,110 @@
+"""
+Background job routes.
+
+"/jobs/pdf" submits a PDF syllabus for background analysis.
+"/jobs/image" submits a syllabus image for background analysis.
+"/jobs/{job_id}" returns a job's status.
+"/jobs/{job_id}/result" returns a finished job's extracted events.
+"/jobs/{job_id}/events" streams a job's progress.
+"""
+
+from fastapi import APIRouter, Depends, File, HTTPException, Request, UploadFile
+from fastapi.responses import JSONResponse
+
+from app.core.limiter import limiter
+from app.core.sse import sse_response
+from app.services.jobs import Job, JobQueue, QueueFullError, get_job_queue
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+
+def _submit(job_queue: JobQueue, kind: str, data: bytes, filename: str):
+    try:
+        job = job_queue.submit(kind, data, filename or "")
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=503, detail=str(e), headers={"Retry-After": "30"}
+        ) from e
+    return JSONResponse(status_code=202, content=job.to_dict())
+
+
+def _get_job(job_queue: JobQueue, job_id: str) -> Job:
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@limiter.limit("25/day")
+@router.post("/pdf")
+async def submit_pdf_job(
+    request: Request,
+    file: UploadFile = File(...),
+    job_queue: JobQueue = Depends(get_job_queue),
+):
+    _ = request
+    """
+    Submit a PDF syllabus for background analysis.
+
+    Args:
+        file: Uploaded PDF file
+
+    Returns:
+        The queued (or deduplicated) job
+    """
+    if not file.content_type or file.content_type != "application/pdf":
+        raise HTTPException(status_code=400, detail="File must be a PDF")
+    return _submit(job_queue, "pdf", await file.read(), file.filename)
+
+
+@limiter.limit("50/day")
+@router.post("/image")
+async def submit_image_job(
+    request: Request,
+    file: UploadFile = File(...),
+    job_queue: JobQueue = Depends(get_job_queue),
+):
+    _ = request
+    """
+    Submit a syllabus image for background analysis.
+
+    Args:
+        file: Uploaded image file
+
+    Returns:
+        The queued (or deduplicated) job
+    """
+    if not file.content_type or not file.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="File must be an image")
+    return _submit(job_queue, "image", await file.read(), file.filename)
+
+
+@router.get("/{job_id}")
+async def get_job_status(job_id: str, job_queue: JobQueue = Depends(get_job_queue)):
+    """Return a job's status."""
+    job = _get_job(job_queue, job_id)
+    return {**job.to_dict(), "queued_jobs": job_queue.queued}
+
+
+@router.get("/{job_id}/result")
+async def get_job_result(job_id: str, job_queue: JobQueue = Depends(get_job_queue)):
+    """Return a finished job's extracted events."""
+    job = _get_job(job_queue, job_id)
+    if job.status == "error":
+        raise HTTPException(status_code=500, detail=job.error)
+    if job.status != "complete":
+        raise HTTPException(
+            status_code=409,
+            detail=f"Job is {job.status}",
+            headers={"Retry-After": "5"},
+        )
+    return job.result
+
+
+@router.get("/{job_id}/events")
+async def stream_job_events(
+    request: Request, job_id: str, job_queue: JobQueue = Depends(get_job_queue)
+):
+    """Stream a job's progress using the /pdf/analyze-stream event format."""
+    _get_job(job_queue, job_id)
+    return sse_response(job_queue.follow(job_id), request)
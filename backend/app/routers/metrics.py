@@ -0,0 +1,39 @@
+"""
+Metrics routes.
+
+"/metrics" reports this worker's load, latency and cache statistics.
+"""
+
+from fastapi import APIRouter
+
+from app.core.admission import admission
+from app.core.startup import timings
+from app.services.budgets import budget_stats
+from app.services.chat_commands import fast_path_stats
+from app.services.jobs import get_job_queue
+from app.services.routing import latency_tracker
+
+router = APIRouter(tags=["Metrics"])
+
+
+@router.get("/metrics")
+async def metrics():
+    """
+    Report the serving worker's current state.
+
+    Each uvicorn worker keeps its own counters, so successive requests may
+    be answered by different workers.
+
+    Returns:
+        Admission control state, upstream latency percentiles, startup
+        timings, chat fast-path, output budget and job queue statistics
+    """
+    job_queue = get_job_queue()
+    return {
+        "admission": admission.snapshot(),
+        "latency": latency_tracker.snapshot(),
+        "startup": timings.as_dict(),
+        "chat_fast_path": fast_path_stats.snapshot(),
+        "output_budgets": budget_stats.snapshot(),
+        "jobs": {"queued": job_queue.queued, "active": len(job_queue.jobs)},
+    }
@@ -5,50 +5,97 @@ PDF analysis routes.
 "/analyze-pdf-stream" analyzes uploaded PDF syllabi with streaming.
 """
 
-import io
+import asyncio
 import json
-import re
-
-import PyPDF2
-from fastapi import APIRouter, Request, UploadFile, File, HTTPException
-from fastapi.responses import StreamingResponse
-
-from app.services.o4_mini_service import OpenAIo4Service
-from app.prompts import PDF_EXAM_ANALYSIS_SYSTEM_PROMPT
-from app.routers.generate import call_o4_api_stream
+from typing import Any, AsyncGenerator, Dict, List, Tuple
+
+from fastapi import APIRouter, Request, UploadFile, File, HTTPException, Depends
+
+from app.services.o4_mini_service import OpenAIo4Service, get_o4_service
+from app.services.budgets import STREAM_RESTART
+from app.services.pdf_analysis import (
+    PdfAnalysisPlan,
+    analyze_scanned_pages,
+    merge_pdf_results,
+    plan_pdf_analysis,
+    remember_pdf_analysis,
+    scanned_page_events,
+    split_pdf_pages,
+)
+from app.services.upstream import (
+    call_o4_api_stream_hedged,
+    parse_schedule_json,
+    plan_text_budget,
+)
 from app.core.limiter import limiter
+from app.core.responses import FastJSONResponse
+from app.core.resumable import resumable_sse_response, resume_sse_response
 
 router = APIRouter(prefix="/pdf", tags=["PDF Analysis"])
 
-o4_service = OpenAIo4Service()
-
 
-def extract_text_from_pdf(pdf_data: bytes) -> str:
+async def analyze_pdf_text(
+    pdf_text: str, o4_service: OpenAIo4Service
+) -> Dict[str, Any]:
     """
-    Extract text content from PDF bytes.
+    Analyze a PDF's text layer, reusing past analyses where possible.
 
     Args:
-        pdf_data: PDF file as bytes
+        pdf_text: Extracted PDF text
+        o4_service: Service used for the completion
 
     Returns:
-        Extracted text content
+        Extracted exam events
     """
+    plan = plan_pdf_analysis(pdf_text)
+    if plan.cached_result is not None:
+        return plan.cached_result
+
+    budget = plan_text_budget(
+        plan.endpoint,
+        plan.system_prompt,
+        plan.user_content,
+        plan.route.model,
+        plan.route.reasoning_effort,
+    )
+    ai_response = await asyncio.to_thread(
+        o4_service.complete,
+        [
+            {"role": "system", "content": plan.system_prompt},
+            {"role": "user", "content": plan.user_content},
+        ],
+        plan.route.model,
+        budget,
+    )
+
+    print(f"AI Response: {ai_response}")
+
+    # Parse AI response (assuming it returns JSON)
     try:
-        pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_data))
-        text = ""
-
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
+        exam_data = parse_schedule_json(ai_response)
+
+        print(f"Parsed exam data: {exam_data}")
+        remember_pdf_analysis(pdf_text, exam_data)
+
+    except json.JSONDecodeError as e:
+        print(f"JSON decode error: {e}")
+        print(f"Raw AI response: {ai_response}")
+        # If AI doesn't return valid JSON, raise an error
+        raise HTTPException(
+            status_code=500,
+            detail=f"AI returned invalid JSON format. Response: {ai_response[:200]}...",
+        )
 
-        return text.strip()
-    except Exception as e:
-        print(f"Error extracting text from PDF: {str(e)}")
-        raise HTTPException(status_code=400, detail=f"Error reading PDF: {str(e)}")
+    return exam_data
 
 
 @limiter.limit("25/day")
 @router.post("/analyze")
-async def analyze_pdf(request: Request, file: UploadFile = File(...)):
+async def analyze_pdf(
+    request: Request,
+    file: UploadFile = File(...),
+    o4_service: OpenAIo4Service = Depends(get_o4_service),
+):
     _ = request
     """
     Analyze uploaded PDF syllabus and extract exam events.
@@ -68,66 +115,146 @@ async def analyze_pdf(request: Request, file: UploadFile = File(...)):
 
         # Read PDF data and extract text
         pdf_data = await file.read()
-        pdf_text = extract_text_from_pdf(pdf_data)
+        pdf_text, scanned, page_count = split_pdf_pages(pdf_data)
 
-        if not pdf_text.strip():
+        if not pdf_text and not scanned:
             raise HTTPException(status_code=400, detail="No text content found in PDF")
 
         print(f"Extracted PDF text length: {len(pdf_text)} characters")
 
-        response = o4_service.default_client.chat.completions.create(
-            model=o4_service.model,
-            messages=[
-                {"role": "system", "content": PDF_EXAM_ANALYSIS_SYSTEM_PROMPT},
-                {"role": "user", "content": pdf_text},
-            ],
-            max_completion_tokens=12000,
-            reasoning_effort=o4_service.reasoning_effort,
-        )
-
-        if response.choices[0].message.content is None:
-            raise ValueError("No content returned from OpenAI o4-mini")
-
-        ai_response = response.choices[0].message.content
-
-        print(f"AI Response: {ai_response}")
+        # Scanned pages are rasterized and analyzed alongside the text
+        pages_task = None
+        if scanned:
+            print(f"Rasterizing {len(scanned)} of {page_count} pages")
+            pages_task = asyncio.create_task(
+                analyze_scanned_pages(
+                    pdf_data, scanned, page_count, required=not pdf_text
+                )
+            )
 
-        # Parse AI response (assuming it returns JSON)
         try:
-            # Try to extract JSON from the response if it's wrapped in text
-            json_match = re.search(r"\{.*\}", ai_response, re.DOTALL)
-            if json_match:
-                json_str = json_match.group()
-                exam_data = json.loads(json_str)
-            else:
-                exam_data = json.loads(ai_response)
-
-            print(f"Parsed exam data: {exam_data}")
-
-        except json.JSONDecodeError as e:
-            print(f"JSON decode error: {e}")
-            print(f"Raw AI response: {ai_response}")
-            # If AI doesn't return valid JSON, raise an error
-            raise HTTPException(
-                status_code=500,
-                detail=f"AI returned invalid JSON format. Response: {ai_response[:200]}...",
-            )
+            results = []
+            if pdf_text:
+                results.append(await analyze_pdf_text(pdf_text, o4_service))
+            if pages_task is not None:
+                pages_result = await pages_task
+                if pages_result is not None:
+                    results.append(pages_result)
+        finally:
+            if pages_task is not None:
+                pages_task.cancel()
+
+        exam_data = merge_pdf_results(results)
 
         # Return extracted events as JSON
-        return exam_data
+        return FastJSONResponse(exam_data)
 
     except Exception as e:
         print(f"Error processing PDF: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing PDF: {str(e)}")
 
 
+async def pdf_text_events(
+    plan: PdfAnalysisPlan, pdf_text: str
+) -> AsyncGenerator[Dict[str, Any], None]:
+    """
+    Stream the analysis of a PDF's text layer.
+
+    Args:
+        plan: Analysis plan for the text
+        pdf_text: Extracted PDF text
+
+    Yields:
+        "streaming" chunks, then "complete" with the parsed result or
+        "error" if the response isn't valid JSON
+    """
+    if plan.cached_result is not None:
+        yield {"status": "complete", "data": plan.cached_result}
+        return
+
+    # Stream the AI analysis
+    chunks = []
+    async for chunk in call_o4_api_stream_hedged(
+        plan.system_prompt, plan.user_content, plan.route, plan.endpoint
+    ):
+        if chunk is STREAM_RESTART:
+            chunks.clear()
+            yield {
+                "status": "analyzing",
+                "message": "Response was cut off, retrying...",
+            }
+            continue
+        chunks.append(chunk)
+        yield {"status": "streaming", "chunk": chunk}
+    full_response = "".join(chunks)
+
+    # Parse the complete response
+    try:
+        exam_data = parse_schedule_json(full_response)
+
+        print(f"Parsed exam data: {exam_data}")
+        remember_pdf_analysis(pdf_text, exam_data)
+        yield {"status": "complete", "data": exam_data}
+
+    except json.JSONDecodeError as e:
+        print(f"JSON decode error: {e}")
+        print(f"Raw AI response: {full_response}")
+        yield {
+            "status": "error",
+            "message": f"AI returned invalid JSON format. Response: {full_response[:200]}...",
+        }
+
+
+async def interleave_streams(
+    streams: List[AsyncGenerator[Dict[str, Any], None]],
+) -> AsyncGenerator[Tuple[int, Dict[str, Any]], None]:
+    """
+    Run event streams concurrently.
+
+    Args:
+        streams: Event streams to run
+
+    Yields:
+        (stream index, event) pairs as events arrive; the first error
+        raised by any stream is re-raised
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def pump(index: int, stream: AsyncGenerator[Dict[str, Any], None]):
+        try:
+            async for event in stream:
+                queue.put_nowait((index, event))
+        except Exception as e:
+            queue.put_nowait((index, e))
+        finally:
+            queue.put_nowait((index, None))
+
+    tasks = [asyncio.create_task(pump(i, s)) for i, s in enumerate(streams)]
+    remaining = len(tasks)
+    try:
+        while remaining:
+            index, event = await queue.get()
+            if isinstance(event, Exception):
+                raise event
+            if event is None:
+                remaining -= 1
+            else:
+                yield index, event
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
 @limiter.limit("50/day")
 @router.post("/analyze-stream")
-async def analyze_pdf_stream(request: Request, file: UploadFile = File(...)):
-    _ = request
+async def analyze_pdf_stream(request: Request, file: UploadFile = File(None)):
     """
     Analyze uploaded PDF syllabus and extract exam events using streaming.
 
+    A request carrying the ``Last-Event-ID`` of a stream that is still
+    buffered resumes that stream instead of starting a new analysis, in
+    which case the file may be omitted.
+
     Args:
         file: Uploaded PDF file
 
@@ -135,67 +262,67 @@ async def analyze_pdf_stream(request: Request, file: UploadFile = File(...)):
         Streamed analysis response
     """
     try:
-        print(f"Received PDF file: {file.filename}, content_type: {file.content_type}")
+        resumed = resume_sse_response(request)
+        if resumed is not None:
+            return resumed
 
         # Validate file type
-        if not file.content_type or file.content_type != "application/pdf":
+        if file is None or file.content_type != "application/pdf":
             raise HTTPException(status_code=400, detail="File must be a PDF")
 
+        print(f"Received PDF file: {file.filename}, content_type: {file.content_type}")
+
         # Read PDF data
         pdf_data = await file.read()
 
-        # Extract text from PDF
-        pdf_text = extract_text_from_pdf(pdf_data)
+        # Extract text from PDF; scanned pages are rasterized instead
+        pdf_text, scanned, page_count = split_pdf_pages(pdf_data)
 
-        if not pdf_text.strip():
+        if not pdf_text and not scanned:
             raise HTTPException(status_code=400, detail="No text content found in PDF")
 
         print(f"Extracted PDF text length: {len(pdf_text)} characters")
 
+        plan = plan_pdf_analysis(pdf_text) if pdf_text else None
+
         async def generate_stream():
             # Send initial status
-            yield f"data: {json.dumps({'status': 'analyzing', 'message': 'Analyzing PDF content...'})}\n\n"
+            yield {"status": "analyzing", "message": "Analyzing PDF content..."}
 
             try:
-                # Stream the AI analysis
-                full_response = ""
-                async for chunk in call_o4_api_stream(
-                    PDF_EXAM_ANALYSIS_SYSTEM_PROMPT, pdf_text
-                ):
-                    full_response += chunk
-                    yield f"data: {json.dumps({'status': 'streaming', 'chunk': chunk})}\n\n"
-
-                # Parse the complete response
-                try:
-                    # Try to extract JSON from the response if it's wrapped in text
-                    json_match = re.search(r"\{.*\}", full_response, re.DOTALL)
-                    if json_match:
-                        json_str = json_match.group()
-                        exam_data = json.loads(json_str)
-                    else:
-                        exam_data = json.loads(full_response)
-
-                    print(f"Parsed exam data: {exam_data}")
-                    yield f"data: {json.dumps({'status': 'complete', 'data': exam_data})}\n\n"
-
-                except json.JSONDecodeError as e:
-                    print(f"JSON decode error: {e}")
-                    print(f"Raw AI response: {full_response}")
-                    yield f"data: {json.dumps({'status': 'error', 'message': f'AI returned invalid JSON format. Response: {full_response[:200]}...'})}\n\n"
+                streams = []
+                if plan is not None:
+                    streams.append(pdf_text_events(plan, pdf_text))
+                if scanned:
+                    print(f"Rasterizing {len(scanned)} of {page_count} pages")
+                    yield {
+                        "status": "analyzing",
+                        "message": f"Reading {len(scanned)} scanned pages...",
+                    }
+                    streams.append(
+                        scanned_page_events(
+                            pdf_data, scanned, page_count, required=plan is None
+                        )
+                    )
+
+                results = {}
+                async for index, event in interleave_streams(streams):
+                    if event["status"] == "complete":
+                        results[index] = event["data"]
+                        continue
+                    yield event
+                    if event["status"] == "error":
+                        return
+
+                # Text first, then scanned pages
+                merged = merge_pdf_results([results[i] for i in sorted(results)])
+                yield {"status": "complete", "data": merged}
 
             except Exception as e:
                 print(f"Error in streaming analysis: {str(e)}")
-                yield f"data: {json.dumps({'status': 'error', 'message': f'Error analyzing PDF: {str(e)}'})}\n\n"
-
-        return StreamingResponse(
-            generate_stream(),
-            media_type="text/event-stream",
-            headers={
-                "X-Accel-Buffering": "no",
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-            },
-        )
+                yield {"status": "error", "message": f"Error analyzing PDF: {str(e)}"}
+
+        return resumable_sse_response(generate_stream(), request)
 
     except Exception as e:
         print(f"Error processing PDF: {str(e)}")
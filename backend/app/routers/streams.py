@@ -0,0 +1,31 @@
+"""
+Stream resumption routes.
+
+"/streams/{stream_id}" resumes a buffered SSE stream, e.g. from an EventSource
+that reconnects with ``Last-Event-ID``.
+"""
+
+from fastapi import APIRouter, HTTPException, Request
+
+from app.core.resumable import resume_sse_response
+from app.core.limiter import limiter
+
+router = APIRouter(prefix="/streams", tags=["Streams"])
+
+
+@limiter.limit("200/day")
+@router.get("/{stream_id}")
+async def resume_stream(request: Request, stream_id: str):
+    """
+    Resume an active stream from the client's last seen event.
+
+    Args:
+        stream_id: Id from the ``X-Stream-Id`` header or event ids
+
+    Returns:
+        The remaining events of the stream
+    """
+    response = resume_sse_response(request, stream_id)
+    if response is None:
+        raise HTTPException(status_code=404, detail="Stream not found or expired")
+    return response
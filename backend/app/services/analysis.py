@@ -0,0 +1,128 @@
+"""
+Upload analyzers shared by background jobs and batch uploads.
+
+Each analyzer takes the raw uploaded bytes and a ``publish`` callback that
+receives progress events in the /pdf/analyze-stream vocabulary, and
+returns the parsed ``course_name``/``course_code``/``events`` result.
+"""
+
+import asyncio
+import base64
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.prompts import (
+    SYLLABUS_ANALYSIS_SYSTEM_PROMPT,
+    SYLLABUS_ANALYSIS_USER_PROMPT,
+)
+from app.services.budgets import STREAM_RESTART
+from app.services.image_tiles import split_image
+from app.services.pdf_analysis import (
+    analyze_scanned_pages,
+    merge_pdf_results,
+    plan_pdf_analysis,
+    remember_pdf_analysis,
+    split_pdf_pages,
+)
+from app.services.upstream import (
+    analyze_tiles_stream,
+    call_o4_api_stream,
+    call_vision_api,
+    parse_schedule_json,
+)
+
+Publish = Callable[[Dict[str, Any]], None]
+
+
+async def _analyze_pdf_text(pdf_text: str, publish: Publish) -> Dict[str, Any]:
+    plan = await asyncio.to_thread(plan_pdf_analysis, pdf_text)
+    if plan.cached_result is not None:
+        return plan.cached_result
+
+    chunks = []
+    async for chunk in call_o4_api_stream(
+        plan.system_prompt,
+        plan.user_content,
+        plan.route.model,
+        plan.route.reasoning_effort,
+        plan.endpoint,
+    ):
+        if chunk is STREAM_RESTART:
+            chunks.clear()
+            publish(
+                {"status": "analyzing", "message": "Response was cut off, retrying..."}
+            )
+            continue
+        chunks.append(chunk)
+        publish({"status": "streaming", "chunk": chunk})
+    result = parse_schedule_json("".join(chunks))
+    remember_pdf_analysis(pdf_text, result)
+    return result
+
+
+async def analyze_pdf_bytes(data: bytes, publish: Publish) -> Dict[str, Any]:
+    """
+    Extract a PDF's text and stream it through the exam analysis prompt.
+
+    Pages without a text layer are rasterized and sent through the vision
+    model concurrently.
+    """
+    pdf_text, scanned, page_count = await asyncio.to_thread(split_pdf_pages, data)
+    if not pdf_text and not scanned:
+        raise ValueError("No text content found in PDF")
+
+    publish({"status": "analyzing", "message": "Analyzing PDF content..."})
+    pages_task = None
+    if scanned:
+        pages_task = asyncio.create_task(
+            analyze_scanned_pages(
+                data, scanned, page_count, required=not pdf_text, publish=publish
+            )
+        )
+
+    try:
+        results = []
+        if pdf_text:
+            results.append(await _analyze_pdf_text(pdf_text, publish))
+        if pages_task is not None:
+            pages_result = await pages_task
+            if pages_result is not None:
+                results.append(pages_result)
+    finally:
+        if pages_task is not None:
+            pages_task.cancel()
+    return merge_pdf_results(results)
+
+
+async def analyze_image_bytes(data: bytes, publish: Publish) -> Dict[str, Any]:
+    """Send an image through the vision model, tiling tall or dense ones."""
+    publish({"status": "analyzing", "message": "Analyzing image content..."})
+    tiles = await asyncio.to_thread(split_image, data)
+    if tiles:
+        async for event in analyze_tiles_stream(tiles):
+            if event["status"] == "complete":
+                return event["data"]
+            publish(event)
+
+    image_base64 = base64.b64encode(data).decode("utf-8")
+    ai_response = await asyncio.to_thread(
+        call_vision_api,
+        SYLLABUS_ANALYSIS_SYSTEM_PROMPT,
+        SYLLABUS_ANALYSIS_USER_PROMPT,
+        image_base64,
+    )
+    return parse_schedule_json(ai_response)
+
+
+ANALYZERS: Dict[str, Callable[[bytes, Publish], Awaitable[Dict[str, Any]]]] = {
+    "pdf": analyze_pdf_bytes,
+    "image": analyze_image_bytes,
+}
+
+
+def upload_kind(content_type: Optional[str]) -> Optional[str]:
+    """Map an upload's content type to an analyzer name, or None if unsupported."""
+    if content_type == "application/pdf":
+        return "pdf"
+    if content_type and content_type.startswith("image/"):
+        return "image"
+    return None
@@ -0,0 +1,65 @@
+"""Merge per-file analysis results from a multi-file semester upload."""
+
+import re
+from typing import Any, Dict, List, Tuple
+
+from app.services.ics import generate_combined_ics_file
+
+
+def _normalize(value: Any) -> str:
+    return re.sub(r"\s+", " ", str(value or "")).strip().lower()
+
+
+def _course_key(schedule: Dict[str, Any]) -> str:
+    code = _normalize(schedule.get("course_code")).replace(" ", "")
+    if code and code not in ("events", "academic"):
+        return code
+    return _normalize(schedule.get("course_name")) or "events"
+
+
+def _event_key(event: Dict[str, Any]) -> Tuple[str, str]:
+    return _normalize(event.get("title")), str(event.get("start_time", ""))[:16]
+
+
+def merge_schedules(schedules: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Merge analysis results into one de-duplicated course/event set.
+
+    Results for the same course (e.g. a syllabus PDF and a photo of its
+    schedule) are combined, and events with the same title and start time
+    are kept once.
+
+    Args:
+        schedules: Parsed ``course_name``/``course_code``/``events`` results
+
+    Returns:
+        Dictionary with the merged ``courses``, total ``event_count`` and a
+        combined ``ics`` calendar
+    """
+    courses: Dict[str, Dict[str, Any]] = {}
+    seen: Dict[str, set] = {}
+
+    for schedule in schedules:
+        key = _course_key(schedule)
+        course = courses.get(key)
+        if course is None:
+            course = courses[key] = {
+                "course_name": schedule.get("course_name", "Events"),
+                "course_code": schedule.get("course_code", "EVENTS"),
+                "events": [],
+            }
+            seen[key] = set()
+
+        for event in schedule.get("events", []):
+            event_key = _event_key(event)
+            if event_key in seen[key]:
+                continue
+            seen[key].add(event_key)
+            course["events"].append(event)
+
+    merged = list(courses.values())
+    return {
+        "courses": merged,
+        "event_count": sum(len(course["events"]) for course in merged),
+        "ics": generate_combined_ics_file(merged),
+    }
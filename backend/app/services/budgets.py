@@ -0,0 +1,381 @@
+"""
+Output token budgets for model calls.
+
+Every call used to reserve 12000 completion tokens, whether it produced a
+one-line chat reply or a 40-event syllabus. Budgets are now estimated per
+call from the endpoint and its input: extraction prompts need about
+``TOKENS_PER_EVENT`` per event, and the number of date mentions in the
+input is a good proxy for the number of events. Reasoning models also
+spend part of the budget thinking, so an allowance for the reasoning
+effort is added, and the effort is lowered if the total would not fit in
+``OUTPUT_BUDGET_MAX``. A response cut off by its budget is retried once
+with a larger one.
+
+Every prompt answers with a single JSON object, so streams are also cut
+off as soon as that object closes rather than read until ``[DONE]``. To
+report what that saves, an ``EARLY_STOP_SAMPLE_RATE`` fraction of streams
+keep reading after the object closes and measure the tail that the other
+streams skip.
+"""
+
+import math
+import os
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.services.routing import count_dates, is_reasoning_model
+
+OUTPUT_BUDGET_MIN = 1024
+OUTPUT_BUDGET_MAX = int(os.getenv("OUTPUT_BUDGET_MAX", "12000"))
+OUTPUT_BUDGET_RETRY_MAX = int(os.getenv("OUTPUT_BUDGET_RETRY_MAX", "32000"))
+OUTPUT_BUDGET_MARGIN = float(os.getenv("OUTPUT_BUDGET_MARGIN", "1.25"))
+EARLY_STOP_SAMPLE_RATE = float(os.getenv("EARLY_STOP_SAMPLE_RATE", "0.05"))
+
+# One event object as the prompts ask for it, pretty-printed.
+TOKENS_PER_EVENT = 90
+# Course name and code, braces and a possible code fence.
+RESPONSE_OVERHEAD = 120
+CHAT_REPLY_TOKENS = 300
+
+# Events to plan for when the input can't be inspected (images) or has few
+# dates (recurring events, deadlines given by week number).
+EXPECTED_EVENTS = {
+    "chat": 0,
+    "image": 30,
+    "image_tile": 15,
+    "pdf_page": 20,
+}
+DEFAULT_EXPECTED_EVENTS = 10
+
+# Budgets each endpoint used before; savings are reported against these.
+FIXED_BUDGETS = {"image": 4000, "image_tile": 4000, "pdf_page": 4000}
+DEFAULT_FIXED_BUDGET = 12000
+
+# Reasoning tokens allowed per effort, plus a share of the input tokens.
+REASONING_ALLOWANCE = {"low": 2048, "medium": 6144, "high": 12288}
+REASONING_INPUT_SHARE = 0.05
+EFFORTS = ["low", "medium", "high"]
+
+
+class OutputBudget:
+    """The completion budget and reasoning effort chosen for one call."""
+
+    def __init__(
+        self,
+        endpoint: str,
+        max_completion_tokens: int,
+        reasoning_effort: Optional[str],
+        estimated_output: int,
+        attempt: int = 1,
+    ):
+        self.endpoint = endpoint
+        self.max_completion_tokens = max_completion_tokens
+        self.reasoning_effort = reasoning_effort
+        self.estimated_output = estimated_output
+        self.attempt = attempt
+
+    def params(self) -> Dict[str, Any]:
+        """Chat Completions parameters applying this budget."""
+        params: Dict[str, Any] = {"max_completion_tokens": self.max_completion_tokens}
+        if self.reasoning_effort:
+            params["reasoning_effort"] = self.reasoning_effort
+        return params
+
+    def retry(self) -> Optional["OutputBudget"]:
+        """
+        The budget for retrying a truncated response.
+
+        Returns:
+            At least double the budget and never less than the endpoint's
+            old fixed budget, or None if this already was the retry
+        """
+        if self.attempt > 1 or self.max_completion_tokens >= OUTPUT_BUDGET_RETRY_MAX:
+            return None
+        tokens = max(2 * self.max_completion_tokens, fixed_budget(self.endpoint))
+        return OutputBudget(
+            self.endpoint,
+            min(tokens, OUTPUT_BUDGET_RETRY_MAX),
+            self.reasoning_effort,
+            self.estimated_output,
+            attempt=self.attempt + 1,
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"OutputBudget({self.endpoint}, {self.max_completion_tokens}, "
+            f"{self.reasoning_effort}, attempt {self.attempt})"
+        )
+
+
+def fixed_budget(endpoint: str) -> int:
+    """The completion budget an endpoint used before budgets were estimated."""
+    return FIXED_BUDGETS.get(endpoint, DEFAULT_FIXED_BUDGET)
+
+
+def estimate_output_tokens(endpoint: str, text: str = "") -> int:
+    """
+    Estimate the visible output tokens a call needs.
+
+    Args:
+        endpoint: "pdf", "pdf_update", "chat", "image", "image_tile", ...
+        text: Text input of the call; previous results in it (as in
+            "pdf_update") count as events to reproduce
+
+    Returns:
+        Estimated output tokens, before the safety margin
+    """
+    events = count_dates(text) + text.count('"start_time"')
+    events = max(events, EXPECTED_EVENTS.get(endpoint, DEFAULT_EXPECTED_EVENTS))
+    overhead = CHAT_REPLY_TOKENS if endpoint == "chat" else 0
+    return RESPONSE_OVERHEAD + overhead + TOKENS_PER_EVENT * events
+
+
+def reasoning_allowance(reasoning_effort: Optional[str], input_tokens: int) -> int:
+    """Completion tokens to leave for reasoning at an effort level."""
+    if not reasoning_effort:
+        return 0
+    base = REASONING_ALLOWANCE.get(reasoning_effort, REASONING_ALLOWANCE["medium"])
+    return base + int(input_tokens * REASONING_INPUT_SHARE)
+
+
+def plan_budget(
+    endpoint: str,
+    model: str,
+    reasoning_effort: Optional[str] = None,
+    text: str = "",
+    input_tokens: int = 0,
+) -> OutputBudget:
+    """
+    Choose max_completion_tokens and reasoning effort for a call.
+
+    The effort is lowered while the estimate doesn't fit in
+    OUTPUT_BUDGET_MAX, so dense documents keep room for their events.
+
+    Args:
+        endpoint: Endpoint type, see estimate_output_tokens
+        model: Model the call goes to
+        reasoning_effort: Effort requested, e.g. by routing
+        text: Text input of the call
+        input_tokens: Prompt plus input token count
+
+    Returns:
+        The budget for the first attempt
+    """
+    output = estimate_output_tokens(endpoint, text)
+    visible = math.ceil(output * OUTPUT_BUDGET_MARGIN)
+    effort = reasoning_effort if is_reasoning_model(model) else None
+    while (
+        effort in EFFORTS[1:]
+        and visible + reasoning_allowance(effort, input_tokens) > OUTPUT_BUDGET_MAX
+    ):
+        effort = EFFORTS[EFFORTS.index(effort) - 1]
+    tokens = visible + reasoning_allowance(effort, input_tokens)
+    tokens = min(max(tokens, OUTPUT_BUDGET_MIN), OUTPUT_BUDGET_MAX)
+    return OutputBudget(endpoint, tokens, effort, output)
+
+
+class JsonEndTracker:
+    """
+    Finds where the top-level JSON object of a streamed response closes.
+
+    Only responses that start with the object (optionally inside a code
+    fence) are tracked; anything else is left alone.
+    """
+
+    def __init__(self):
+        self.closed = False
+        self.disabled = False
+        self._lead = ""
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: str) -> Optional[int]:
+        """
+        Scan the next chunk.
+
+        Returns:
+            Index in ``chunk`` just past the closing brace, or None if the
+            object hasn't closed in this chunk
+        """
+        if self.closed or self.disabled:
+            return None
+        start = 0
+        if not self._started:
+            brace = chunk.find("{")
+            self._lead += chunk if brace < 0 else chunk[:brace]
+            if not "```json".startswith(self._lead.strip()):
+                self.disabled = True
+                return None
+            if brace < 0:
+                return None
+            self._started = True
+            start = brace
+
+        for i in range(start, len(chunk)):
+            ch = chunk[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self.closed = True
+                    return i + 1
+        return None
+
+
+class _Restart(str):
+    pass
+
+
+# Yielded by budgeted streams before the chunks of a retry: consumers drop
+# what they accumulated so far. It is an empty string, so it is harmless to
+# code that only concatenates chunks.
+STREAM_RESTART = _Restart()
+
+
+class BudgetStats:
+    """Per-endpoint budget, early stop and truncation counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints: Dict[str, Counter] = defaultdict(Counter)
+
+    def record_request(self, budget: OutputBudget):
+        with self._lock:
+            counts = self._endpoints[budget.endpoint]
+            counts["requests"] += 1
+            counts["budget_tokens"] += budget.max_completion_tokens
+            counts["reserved_tokens_saved"] += (
+                fixed_budget(budget.endpoint) - budget.max_completion_tokens
+            )
+
+    def record_early_stop(self, endpoint: str):
+        with self._lock:
+            self._endpoints[endpoint]["early_stops"] += 1
+
+    def record_tail(self, endpoint: str, tokens: int, seconds: float):
+        with self._lock:
+            counts = self._endpoints[endpoint]
+            counts["tail_samples"] += 1
+            counts["tail_tokens"] += tokens
+            counts["tail_seconds"] += seconds
+
+    def record_truncation(self, endpoint: str):
+        with self._lock:
+            self._endpoints[endpoint]["truncated"] += 1
+
+    def record_retry(self, endpoint: str, seconds: float):
+        with self._lock:
+            counts = self._endpoints[endpoint]
+            counts["retries"] += 1
+            counts["retry_seconds"] += seconds
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Report the counters per endpoint.
+
+        ``tokens_saved`` and ``seconds_saved`` estimate what early stops
+        skipped, from the average tail of the sampled streams that kept
+        reading; they are None until a tail has been sampled.
+        ``reserved_tokens_saved`` compares budgets with the old fixed ones.
+        """
+        with self._lock:
+            report = {}
+            for endpoint, counts in sorted(self._endpoints.items()):
+                samples = counts["tail_samples"]
+                early_stops = counts["early_stops"]
+                requests = counts["requests"]
+                report[endpoint] = {
+                    "requests": requests,
+                    "average_budget_tokens": (
+                        round(counts["budget_tokens"] / requests) if requests else 0
+                    ),
+                    "reserved_tokens_saved": counts["reserved_tokens_saved"],
+                    "early_stops": early_stops,
+                    "tokens_saved": (
+                        round(early_stops * counts["tail_tokens"] / samples)
+                        if samples
+                        else None
+                    ),
+                    "seconds_saved": (
+                        round(early_stops * counts["tail_seconds"] / samples, 2)
+                        if samples
+                        else None
+                    ),
+                    "truncated": counts["truncated"],
+                    "retries": counts["retries"],
+                    "retry_seconds": round(counts["retry_seconds"], 2),
+                }
+            return report
+
+
+budget_stats = BudgetStats()
+
+
+class StreamMonitor:
+    """
+    Watches one streamed attempt within a budget.
+
+    Cuts the stream off once its JSON object closes (unless this stream was
+    sampled to measure the tail) and notes whether the budget truncated it.
+    """
+
+    def __init__(self, budget: OutputBudget):
+        self.budget = budget
+        self.tracker = JsonEndTracker()
+        self.finish_reason: Optional[str] = None
+        self.sampled = random.random() < EARLY_STOP_SAMPLE_RATE
+        self._tail = []
+        self._closed_at: Optional[float] = None
+
+    @property
+    def truncated(self) -> bool:
+        return self.finish_reason == "length" and not self.tracker.closed
+
+    def feed(self, content: str) -> Tuple[str, bool]:
+        """
+        Pass a content chunk through the monitor.
+
+        Returns:
+            (text to forward, whether to keep reading the stream)
+        """
+        if self.tracker.closed:
+            self._tail.append(content)
+            return "", True
+        end = self.tracker.feed(content)
+        if end is None:
+            return content, True
+        self._closed_at = time.perf_counter()
+        self._tail.append(content[end:])
+        return content[:end], self.sampled
+
+    def finish(self, count_tokens: Callable[[str], int]):
+        """Record the attempt once the stream has been read."""
+        endpoint = self.budget.endpoint
+        if self.truncated:
+            budget_stats.record_truncation(endpoint)
+        if self._closed_at is None:
+            return
+        if not self.sampled:
+            budget_stats.record_early_stop(endpoint)
+            return
+        tail = "".join(self._tail)
+        budget_stats.record_tail(
+            endpoint,
+            count_tokens(tail) if tail.strip() else 0,
+            time.perf_counter() - self._closed_at,
+        )
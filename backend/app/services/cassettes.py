@@ -0,0 +1,211 @@
+"""Record and replay upstream model responses to disk.
+
+Set ``SYLLENDAR_CASSETTE_MODE`` to ``record`` to capture every upstream
+completion into ``SYLLENDAR_CASSETTE_DIR`` (default ``cassettes/``), or to
+``replay`` to serve them back offline. Any other value disables cassettes.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import time
+from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
+
+CASSETTE_MODES = ("record", "replay")
+
+
+def cassette_key(payload: Dict[str, Any]) -> str:
+    """
+    Build a stable key for an upstream request payload.
+
+    Transport-only fields (``stream``) are ignored so a streamed recording
+    can be replayed for a non-streaming call with the same inputs.
+
+    Args:
+        payload: Chat Completions request body
+
+    Returns:
+        Hex digest identifying the request
+    """
+    material = {k: v for k, v in payload.items() if k != "stream"}
+    encoded = json.dumps(material, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """One recorded upstream response with per-chunk timing."""
+
+    def __init__(
+        self,
+        key: str,
+        model: str,
+        chunks: List[Tuple[float, str]],
+        total_seconds: float,
+    ):
+        self.key = key
+        self.model = model
+        self.chunks = chunks
+        self.total_seconds = total_seconds
+
+    @property
+    def content(self) -> str:
+        """Full response text."""
+        return "".join(text for _, text in self.chunks)
+
+    @property
+    def ttft_seconds(self) -> Optional[float]:
+        """Recorded time to first content chunk."""
+        return self.chunks[0][0] if self.chunks else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "key": self.key,
+            "model": self.model,
+            "total_seconds": self.total_seconds,
+            "chunks": [[offset, text] for offset, text in self.chunks],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Cassette":
+        return cls(
+            key=data["key"],
+            model=data.get("model", ""),
+            chunks=[(float(offset), text) for offset, text in data["chunks"]],
+            total_seconds=float(data.get("total_seconds", 0.0)),
+        )
+
+
+class CassetteRecorder:
+    """Collects chunks of a live upstream response for saving."""
+
+    def __init__(self, store: "CassetteStore", payload: Dict[str, Any]):
+        self.store = store
+        self.key = cassette_key(payload)
+        self.model = payload.get("model", "")
+        self.started = time.perf_counter()
+        self.chunks: List[Tuple[float, str]] = []
+
+    def add(self, text: str):
+        self.chunks.append((time.perf_counter() - self.started, text))
+
+    def save(self):
+        cassette = Cassette(
+            key=self.key,
+            model=self.model,
+            chunks=self.chunks,
+            total_seconds=time.perf_counter() - self.started,
+        )
+        self.store.save(cassette)
+
+
+class CassetteStore:
+    """Directory of recorded cassettes, one JSON file per request."""
+
+    def __init__(self, directory: str, mode: str, realtime: bool = False):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.directory = directory
+        self.mode = mode
+        self.realtime = realtime
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def load(self, payload: Dict[str, Any]) -> Cassette:
+        """
+        Load the cassette recorded for a request.
+
+        Args:
+            payload: Chat Completions request body
+
+        Returns:
+            The recorded cassette
+
+        Raises:
+            ValueError: If nothing was recorded for this request
+        """
+        key = cassette_key(payload)
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                return Cassette.from_dict(json.load(f))
+        except FileNotFoundError as e:
+            raise ValueError(
+                f"No cassette recorded for request {key[:12]} in {self.directory}"
+            ) from e
+
+    def save(self, cassette: Cassette):
+        path = self._path(cassette.key)
+        # A unique temp file per writer: concurrent recordings of the same
+        # request each replace the cassette whole.
+        with tempfile.NamedTemporaryFile(
+            "w", encoding="utf-8", dir=self.directory, suffix=".tmp", delete=False
+        ) as f:
+            json.dump(cassette.to_dict(), f)
+        os.replace(f.name, path)
+
+    def recorder(self, payload: Dict[str, Any]) -> CassetteRecorder:
+        return CassetteRecorder(self, payload)
+
+    async def replay_stream(
+        self, payload: Dict[str, Any]
+    ) -> AsyncGenerator[str, None]:
+        """
+        Yield the recorded chunks for a request.
+
+        When ``realtime`` is set, the original inter-chunk delays are kept.
+
+        Args:
+            payload: Chat Completions request body
+
+        Yields:
+            str: Recorded response chunks
+        """
+        cassette = self.load(payload)
+        previous = 0.0
+        for offset, text in cassette.chunks:
+            if self.realtime and offset > previous:
+                await asyncio.sleep(offset - previous)
+            previous = offset
+            yield text
+
+
+_store: Optional[CassetteStore] = None
+_store_loaded = False
+
+
+def get_cassette_store() -> Optional[CassetteStore]:
+    """
+    Return the process-wide cassette store configured from the environment.
+
+    Returns:
+        The store, or None when cassettes are disabled
+    """
+    global _store, _store_loaded
+    if not _store_loaded:
+        mode = os.getenv("SYLLENDAR_CASSETTE_MODE", "").strip().lower()
+        if mode in CASSETTE_MODES:
+            _store = CassetteStore(
+                os.getenv("SYLLENDAR_CASSETTE_DIR", "cassettes"),
+                mode,
+                realtime=os.getenv("SYLLENDAR_CASSETTE_REALTIME") == "1",
+            )
+        _store_loaded = True
+    return _store
+
+
+def set_cassette_store(store: Optional[CassetteStore]):
+    """Override the process-wide cassette store (used by the eval harness)."""
+    global _store, _store_loaded
+    _store = store
+    _store_loaded = True
@@ -0,0 +1,508 @@
+"""
+Local fast path for simple chat edits.
+
+Short, unambiguous edits to a schedule the client already holds ("move the
+midterm to Friday", "delete quiz 3", "make lectures end at 10:50", "yes,
+generate the file") are applied directly to the ``ics_data`` sent with the
+chat request instead of round-tripping through the model. Whenever a
+message can't be resolved to one clear edit, the engine returns None and
+the caller falls back to the model.
+"""
+
+import json
+import re
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.services.routing import latency_tracker
+
+_DAY_NAMES = [
+    ("monday", "mon"),
+    ("tuesday", "tue", "tues"),
+    ("wednesday", "wed"),
+    ("thursday", "thu", "thur", "thurs"),
+    ("friday", "fri"),
+    ("saturday", "sat"),
+    ("sunday", "sun"),
+]
+_MONTH_NAMES = [
+    ("january", "jan"),
+    ("february", "feb"),
+    ("march", "mar"),
+    ("april", "apr"),
+    ("may",),
+    ("june", "jun"),
+    ("july", "jul"),
+    ("august", "aug"),
+    ("september", "sept", "sep"),
+    ("october", "oct"),
+    ("november", "nov"),
+    ("december", "dec"),
+]
+WEEKDAYS = {name: i for i, names in enumerate(_DAY_NAMES) for name in names}
+MONTHS = {name: i for i, names in enumerate(_MONTH_NAMES, start=1) for name in names}
+
+_POLITE_PREFIX = re.compile(r"^(?:(?:please|pls|can you|could you|would you)\s+)+")
+_POLITE_SUFFIX = re.compile(r"(?:[\s,]+(?:please|pls|thanks|thank you))+$")
+_TARGET_PREFIX = re.compile(r"^(?:all\s+(?:of\s+)?)?(?:the|my|our)?\s*")
+
+_CONFIRM = re.compile(
+    r"^(?:(?:yes|yeah|yep|sure|ok|okay)\b[\s,!.]*)?(?:please\s+)?"
+    r"(?:generate|create|make|export|download|give me)\s+(?:me\s+)?"
+    r"(?:the\s+|an?\s+|my\s+)?(?:ics|calendar|file|ics file|calendar file)$"
+)
+_AFFIRM = re.compile(r"^(?:yes|yeah|yep|sure|ok|okay|do it|go ahead)(?:\s+please)?$")
+_FILE_OFFER = re.compile(
+    r"^(?:would you like|do you want|shall i|should i)(?:\s+me)?(?:\s+to)?\s+"
+    r"(?:generate|create|export)\s+(?:the\s+|an?\s+|your\s+)?"
+    r"(?:ics|calendar|ics file|calendar file)(?:\s+(?:now|for you))?$"
+)
+_SET_TIME_OF = re.compile(
+    r"^(?:change|set|move)\s+the\s+(?P<edge>start|end)(?:ing)?\s+time\s+"
+    r"(?:of|for)\s+(?P<target>.+?)\s+to\s+(?P<time>.+)$"
+)
+_SET_TIME = re.compile(
+    r"^(?:make|have|set)\s+(?P<target>.+?)\s+(?P<edge>start|end|finish)(?:s)?\s+"
+    r"(?:at|by|to)\s+(?P<time>.+)$"
+)
+_MOVE = re.compile(
+    r"^(?:move|reschedule|shift|push)\s+(?P<target>.+?)\s+to\s+(?P<when>.+)$"
+)
+_DELETE = re.compile(r"^(?:delete|remove|drop|cancel)\s+(?P<target>.+)$")
+_CLOCK = re.compile(
+    r"^(?P<hour>\d{1,2})(?::(?P<minute>\d{2}))?(?:\s*(?P<meridiem>[ap])\.?m\.?)?$"
+)
+_MONTH_DAY = re.compile(r"^(?P<month>[a-z]+)\.?\s+(?P<day>\d{1,2})(?:st|nd|rd|th)?$")
+_NUMERIC_DATE = re.compile(
+    r"^(?P<month>\d{1,2})/(?P<day>\d{1,2})(?:/(?P<year>\d{2,4}))?$"
+)
+_ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+class ChatCommand:
+    """One classified edit request."""
+
+    def __init__(
+        self,
+        intent: str,
+        target: str = "",
+        value: str = "",
+        edge: str = "",
+    ):
+        self.intent = intent
+        self.target = target
+        self.value = value
+        self.edge = edge
+
+    def __repr__(self) -> str:
+        return f"ChatCommand({self.intent}, {self.target!r}, {self.value!r})"
+
+
+def _normalize_message(message: str) -> str:
+    text = re.sub(r"\s+", " ", message.strip().lower())
+    text = text.rstrip(".!?").strip()
+    text = _POLITE_PREFIX.sub("", text)
+    return _POLITE_SUFFIX.sub("", text)
+
+
+def classify(message: str, history: Any = None) -> Optional[ChatCommand]:
+    """
+    Classify a chat message as a simple schedule edit.
+
+    Args:
+        message: The user's message
+        history: Earlier messages as sent by the client, used to tell a "yes"
+            that answers an offer to generate the file from other answers
+
+    Returns:
+        The command, or None if the message isn't a simple edit
+    """
+    text = _normalize_message(message)
+    if not text or " and " in text or ";" in text:
+        return None
+
+    if _CONFIRM.match(text) or _AFFIRM.match(text):
+        # Only a reply that offered nothing but the file leaves the client's
+        # schedule current; a proposed edit has to be applied by the model.
+        if _offers_file_only(history):
+            return ChatCommand("confirm")
+        return None
+
+    match = _SET_TIME_OF.match(text) or _SET_TIME.match(text)
+    if match:
+        edge = "start" if match["edge"] == "start" else "end"
+        return ChatCommand("set_time", match["target"], match["time"], edge)
+    match = _MOVE.match(text)
+    if match:
+        return ChatCommand("move", match["target"], match["when"])
+    match = _DELETE.match(text)
+    if match:
+        return ChatCommand("delete", match["target"])
+    return None
+
+
+def _offers_file_only(history: Any) -> bool:
+    """Whether the last assistant message only offered to generate the file."""
+    if not isinstance(history, list):
+        return False
+    for message in reversed(history):
+        if not isinstance(message, dict):
+            return False
+        if message.get("isUser"):
+            continue
+        reply = message.get("text")
+        if not isinstance(reply, str):
+            return False
+        sentences = [
+            re.sub(r"\s+", " ", sentence).strip()
+            for sentence in re.split(r"[.!?]+", reply.lower())
+        ]
+        sentences = [sentence for sentence in sentences if sentence]
+        return bool(sentences) and all(map(_FILE_OFFER.match, sentences))
+    return False
+
+
+def _singular(word: str) -> str:
+    if word.endswith("zzes"):
+        return word[:-3]
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def _words(text: str) -> List[str]:
+    return [_singular(word) for word in re.findall(r"[a-z0-9]+", text.lower())]
+
+
+def _is_plural(word: str, events: List[Dict[str, Any]]) -> bool:
+    singular = _singular(word)
+    if singular == word:
+        return False
+    vocabulary = set()
+    for event in events:
+        text = f"{event.get('title') or ''} {event.get('event_type') or ''}"
+        vocabulary.update(re.findall(r"[a-z0-9]+", text.lower()))
+    return singular in vocabulary and word not in vocabulary
+
+
+def find_events(events: List[Dict[str, Any]], target: str) -> Optional[List[int]]:
+    """
+    Resolve a target phrase ("the midterm", "quiz 3", "lectures") to events.
+
+    A singular target must match exactly one event; a plural or "all ..."
+    target may match several, preferring titles that are just the target
+    plus numbers ("Lecture 4" over "Lecture Lab"). A word only counts as
+    plural when the events use its singular and not the word itself, so
+    "thesis" is not read as "thesi"s.
+
+    Returns:
+        Indices of the matched events, or None if nothing or too much matched
+    """
+    target = target.strip()
+    cleaned = _TARGET_PREFIX.sub("", target).strip()
+    tokens = _words(cleaned)
+    if not tokens:
+        return None
+    last_word = re.findall(r"[a-z0-9]+", cleaned.lower())[-1]
+    plural = target.startswith("all ") or _is_plural(last_word, events)
+
+    matches = []
+    numbered = []
+    for index, event in enumerate(events):
+        title_words = _words(event.get("title") or "")
+        haystack = set(title_words) | set(_words(event.get("event_type") or ""))
+        if all(token in haystack for token in tokens):
+            matches.append(index)
+            if all(word in tokens or word.isdigit() for word in title_words):
+                numbered.append(index)
+
+    if len(matches) == 1:
+        return matches
+    if plural and matches:
+        return numbered or matches
+    return None
+
+
+def parse_clock(text: str, reference: datetime) -> Optional[Tuple[int, int]]:
+    """
+    Parse a time of day ("3pm", "10:50", "14:00", "noon").
+
+    Without am/pm, "10:50" means whichever of 10:50 and 22:50 is closer to
+    ``reference``'s time of day.
+
+    Returns:
+        (hour, minute), or None if ``text`` isn't a time
+    """
+    text = text.strip()
+    if text == "noon":
+        return 12, 0
+    match = _CLOCK.match(text)
+    if not match:
+        return None
+    hour = int(match["hour"])
+    minute = int(match["minute"] or 0)
+    if minute > 59:
+        return None
+
+    meridiem = match["meridiem"]
+    if meridiem:
+        if not 1 <= hour <= 12:
+            return None
+        return hour % 12 + (12 if meridiem == "p" else 0), minute
+    if hour > 23:
+        return None
+    if hour == 0 or hour > 12:
+        return hour, minute
+
+    ref_minutes = reference.hour * 60 + reference.minute
+    candidates = [hour % 12, hour % 12 + 12]
+    best = min(candidates, key=lambda h: abs(h * 60 + minute - ref_minutes))
+    return best, minute
+
+
+def parse_day(text: str, reference: datetime, now: datetime) -> Optional[date]:
+    """
+    Parse the day an event moves to.
+
+    Weekdays ("friday", "this fri") mean that day of the event's own week;
+    "next friday" is left to the model since it is read both ways.
+
+    Returns:
+        The date, or None if ``text`` isn't a day this engine understands
+    """
+    text = text.strip()
+    if text == "today":
+        return now.date()
+    if text == "tomorrow":
+        return now.date() + timedelta(days=1)
+
+    weekday = WEEKDAYS.get(re.sub(r"^(?:this|on)\s+", "", text))
+    if weekday is not None:
+        monday = reference.date() - timedelta(days=reference.weekday())
+        return monday + timedelta(days=weekday)
+
+    try:
+        if _ISO_DATE.match(text):
+            return date.fromisoformat(text)
+        match = _MONTH_DAY.match(text)
+        if match and match["month"] in MONTHS:
+            return date(reference.year, MONTHS[match["month"]], int(match["day"]))
+        match = _NUMERIC_DATE.match(text)
+        if match:
+            year = int(match["year"]) if match["year"] else reference.year
+            if year < 100:
+                year += 2000
+            return date(year, int(match["month"]), int(match["day"]))
+    except ValueError:
+        return None
+    return None
+
+
+def _parse_time(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def _format_time(value: datetime) -> str:
+    if value.tzinfo is not None:
+        return value.isoformat()
+    return value.strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def _clock(value: datetime) -> str:
+    return value.strftime("%I:%M %p").lstrip("0")
+
+
+def _describe(value: datetime) -> str:
+    return f"{value:%a, %b} {value.day} at {_clock(value)}"
+
+
+def _titles(events: List[Dict[str, Any]]) -> str:
+    titles = [event.get("title") or "Event" for event in events]
+    if len(titles) <= 3:
+        return ", ".join(titles)
+    return f"{len(titles)} events ({', '.join(titles[:2])}, ...)"
+
+
+def apply_command(
+    command: ChatCommand, schedule: Dict[str, Any], now: Optional[datetime] = None
+) -> Optional[Tuple[Dict[str, Any], str]]:
+    """
+    Apply a command to a schedule without mutating it.
+
+    Args:
+        command: Classified command
+        schedule: ``ics_data``-shaped schedule held by the client
+        now: Current datetime for "today"/"tomorrow"
+
+    Returns:
+        (updated schedule, reply text), or None if the edit is ambiguous
+    """
+    events = [dict(event) for event in schedule.get("events", [])]
+    if not events:
+        return None
+    updated = {**schedule, "events": events}
+    now = now or datetime.now()
+
+    if command.intent == "confirm":
+        return updated, "Here's your calendar file."
+
+    indices = find_events(events, command.target)
+    if indices is None:
+        return None
+    matched = [events[i] for i in indices]
+
+    if command.intent == "delete":
+        updated["events"] = [e for i, e in enumerate(events) if i not in indices]
+        return updated, f"Removed {_titles(matched)} from your calendar."
+
+    try:
+        spans = [
+            (_parse_time(e["start_time"]), _parse_time(e["end_time"])) for e in matched
+        ]
+    except (KeyError, TypeError, ValueError):
+        return None
+
+    if command.intent == "set_time":
+        for event, (start, end) in zip(matched, spans):
+            reference = start if command.edge == "start" else end
+            clock = parse_clock(command.value, reference)
+            if clock is None:
+                return None
+            moved = reference.replace(hour=clock[0], minute=clock[1], second=0)
+            if command.edge == "start":
+                # Keep the duration, like moving the event.
+                event["start_time"] = _format_time(moved)
+                event["end_time"] = _format_time(moved + (end - start))
+            elif moved <= start:
+                return None
+            else:
+                event["end_time"] = _format_time(moved)
+        return updated, (
+            f"Updated {_titles(matched)} to {command.edge} at {_clock(moved)}."
+        )
+
+    # Moving several events, or a recurring one, to one day is rarely what
+    # was meant.
+    if len(matched) != 1 or matched[0].get("recurrence"):
+        return None
+    start, end = spans[0]
+    when = re.match(r"^(?P<day>.+?)(?:\s+at\s+(?P<time>.+))?$", command.value)
+    day_text, time_text = when["day"], when["time"]
+    if time_text is None and parse_clock(day_text, start) is not None:
+        day_text, time_text = "", day_text
+
+    day = parse_day(day_text, start, now) if day_text else start.date()
+    clock = parse_clock(time_text, start) if time_text else (start.hour, start.minute)
+    if day is None or clock is None:
+        return None
+    new_start = start.replace(
+        year=day.year, month=day.month, day=day.day, hour=clock[0], minute=clock[1]
+    )
+    matched[0]["start_time"] = _format_time(new_start)
+    matched[0]["end_time"] = _format_time(new_start + (end - start))
+    return updated, f"Moved {_titles(matched)} to {_describe(new_start)}."
+
+
+def parse_schedule_field(raw: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    Parse the ``events`` form field of a chat request.
+
+    Accepts an ``ics_data`` object or a bare list of events.
+    """
+    if not raw:
+        return None
+    try:
+        data = json.loads(raw)
+    except json.JSONDecodeError:
+        return None
+    if isinstance(data, list):
+        data = {
+            "course_name": "Custom Schedule",
+            "course_code": "CUSTOM",
+            "events": data,
+        }
+    if not isinstance(data, dict) or not isinstance(data.get("events"), list):
+        return None
+    return data
+
+
+class FastPathStats:
+    """Counts chat turns served locally and the upstream latency they saved."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.local = 0
+        self.upstream = 0
+        self.latency_saved = 0.0
+        self.intents: Counter = Counter()
+
+    def record_local(
+        self, intent: str, elapsed: float, upstream_estimate: Optional[float]
+    ):
+        with self._lock:
+            self.local += 1
+            self.intents[intent] += 1
+            if upstream_estimate is not None:
+                self.latency_saved += max(upstream_estimate - elapsed, 0.0)
+
+    def record_upstream(self):
+        with self._lock:
+            self.upstream += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.local + self.upstream
+            return {
+                "served_locally": self.local,
+                "served_upstream": self.upstream,
+                "local_fraction": round(self.local / total, 3) if total else 0.0,
+                "latency_saved_seconds": round(self.latency_saved, 2),
+                "intents": dict(self.intents),
+            }
+
+
+fast_path_stats = FastPathStats()
+
+
+def serve_locally(
+    message: str,
+    schedule: Optional[Dict[str, Any]],
+    history: Any,
+    model: str,
+) -> Optional[Dict[str, Any]]:
+    """
+    Answer a chat turn without calling the model when it is a simple edit.
+
+    Args:
+        message: The user's message
+        schedule: Schedule sent with the request, if any
+        history: Earlier messages as sent by the client
+        model: Chat model, whose median latency is counted as saved
+
+    Returns:
+        A ``{"action", "response", "ics_data"}`` reply, or None to fall back
+        to the model
+    """
+    if not schedule:
+        return None
+    started = time.perf_counter()
+    command = classify(message, history)
+    applied = apply_command(command, schedule) if command else None
+    if applied is None:
+        return None
+
+    updated, reply = applied
+    elapsed = time.perf_counter() - started
+    fast_path_stats.record_local(
+        command.intent, elapsed, latency_tracker.percentile(model, "total", 50)
+    )
+    stats = fast_path_stats.snapshot()
+    print(
+        f"Chat {command.intent} served locally in {elapsed * 1000:.1f}ms "
+        f"({stats['served_locally']} local / {stats['served_upstream']} upstream, "
+        f"~{stats['latency_saved_seconds']}s saved)"
+    )
+    return {"action": "generate_ics", "response": reply, "ics_data": updated}
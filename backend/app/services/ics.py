@@ -0,0 +1,131 @@
+"""ICS calendar files built from analyzed schedules."""
+
+from datetime import datetime
+from typing import Any, Dict, List
+
+
+ICS_DAY_MAP = {
+    "Monday": "MO",
+    "Tuesday": "TU",
+    "Wednesday": "WE",
+    "Thursday": "TH",
+    "Friday": "FR",
+    "Saturday": "SA",
+    "Sunday": "SU",
+}
+
+
+def ics_calendar_header(calendar_name: str) -> List[str]:
+    """ICS lines opening a calendar named ``calendar_name``."""
+    return [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//Syllendar//AI Generated Calendar//EN",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        f"X-WR-CALNAME:{calendar_name}",
+        "X-WR-TIMEZONE:UTC",
+    ]
+
+
+def ics_event_lines(event: Dict[str, Any], course_code: str) -> List[str]:
+    """
+    Build the VEVENT lines for one event.
+
+    Args:
+        event: Event dictionary as returned by the analysis endpoints
+        course_code: Course code used in the event UID
+
+    Returns:
+        ICS lines from BEGIN:VEVENT to END:VEVENT
+    """
+    title = event.get("title", "Event")
+    start_time = event.get("start_time", "2024-01-15T10:00:00")
+    end_time = event.get("end_time", "2024-01-15T11:30:00")
+    location = event.get("location", "")
+    description = event.get("description", "")
+    recurrence = event.get("recurrence", "")
+    days = event.get("days", [])
+
+    # Convert to ICS format
+    start_dt = datetime.fromisoformat(start_time.replace("Z", "+00:00"))
+    end_dt = datetime.fromisoformat(end_time.replace("Z", "+00:00"))
+
+    # Format dates for ICS (using local time without timezone indicator)
+    start_ics = start_dt.strftime("%Y%m%dT%H%M%S")
+    end_ics = end_dt.strftime("%Y%m%dT%H%M%S")
+    created_ics = datetime.now().strftime("%Y%m%dT%H%M%SZ")
+
+    # Generate unique ID
+    uid = f"{course_code}-{title}-{start_ics}@syllendar.com"
+
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:{uid}",
+        f"DTSTART:{start_ics}",
+        f"DTEND:{end_ics}",
+        f"DTSTAMP:{created_ics}",
+        f"SUMMARY:{title}",
+        f"DESCRIPTION:{description}",
+    ]
+
+    if location:
+        lines.append(f"LOCATION:{location}")
+
+    # Add recurrence rule if specified
+    if recurrence == "weekly" and days:
+        ics_days = [ICS_DAY_MAP.get(day, day) for day in days]
+        rrule = f"FREQ=WEEKLY;BYDAY={','.join(ics_days)};UNTIL=20251231T235959"
+        lines.append(f"RRULE:{rrule}")
+
+    lines.append("END:VEVENT")
+    return lines
+
+
+def generate_ics_file(schedule_data: Dict[str, Any]) -> str:
+    """
+    Generate ICS calendar file from schedule data.
+
+    Args:
+        schedule_data: Dictionary containing course and event information
+
+    Returns:
+        ICS file content as string
+    """
+    course_name = schedule_data.get("course_name", "Course")
+    course_code = schedule_data.get("course_code", "COURSE-101")
+    events = schedule_data.get("events", [])
+
+    ics_content = ics_calendar_header(f"{course_name} ({course_code})")
+    for event in events:
+        ics_content.extend(ics_event_lines(event, course_code))
+    ics_content.append("END:VCALENDAR")
+
+    return "\r\n".join(ics_content)
+
+
+def generate_combined_ics_file(
+    schedules: List[Dict[str, Any]], calendar_name: str = "Semester Schedule"
+) -> str:
+    """
+    Generate one ICS calendar file covering several courses.
+
+    Args:
+        schedules: Schedule dictionaries, one per course
+        calendar_name: Name of the combined calendar
+
+    Returns:
+        ICS file content as string; events without valid start and end
+        times are logged and left out
+    """
+    ics_content = ics_calendar_header(calendar_name)
+    for schedule_data in schedules:
+        course_code = schedule_data.get("course_code", "COURSE-101")
+        for event in schedule_data.get("events", []):
+            try:
+                ics_content.extend(ics_event_lines(event, course_code))
+            except (AttributeError, TypeError, ValueError) as e:
+                print(f"Skipping invalid event {event!r}: {str(e)}")
+    ics_content.append("END:VCALENDAR")
+
+    return "\r\n".join(ics_content)
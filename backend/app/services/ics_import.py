@@ -0,0 +1,670 @@
+"""
+Streaming RFC 5545 (ICS) import.
+
+Exports are read chunk by chunk: folded lines are unfolded incrementally,
+each VEVENT is turned into the event dictionaries ``generate_ics_file``
+consumes as soon as its END:VEVENT arrives, and recurring events are
+expanded lazily into the requested window. Only recurring masters and
+their overridden instances are held until the end of the file, since
+overrides may appear after the event they modify.
+
+Imported calendars are stored under ``IMPORTS_DIR`` by content hash so
+chat requests can reference them by id and receive a compact summary of
+the relevant events instead of the raw calendar.
+"""
+
+import asyncio
+import calendar
+import json
+import os
+import re
+from bisect import bisect_left
+from datetime import date, datetime, timedelta, timezone, tzinfo
+from functools import lru_cache
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from app.services.chat_commands import MONTHS, WEEKDAYS
+
+IMPORTS_DIR = os.getenv("IMPORTS_DIR", "imports")
+IMPORT_MAX_EVENTS = int(os.getenv("IMPORT_MAX_EVENTS", "5000"))
+IMPORT_PAST_DAYS = int(os.getenv("IMPORT_PAST_DAYS", "30"))
+IMPORT_FUTURE_DAYS = int(os.getenv("IMPORT_FUTURE_DAYS", "365"))
+CHAT_CALENDAR_TOKEN_BUDGET = int(os.getenv("CHAT_CALENDAR_TOKEN_BUDGET", "600"))
+CHAT_CALENDAR_DAYS = 14
+
+MAX_LINE_BYTES = 1 << 20
+# Bounds the work spent on rules that rarely or never produce an instance.
+MAX_RRULE_PERIODS = 10000
+ICS_WEEKDAYS = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
+
+_TEXT_ESCAPES = re.compile(r"\\([\\;,nN])")
+_DURATION = re.compile(
+    r"^(?P<sign>[+-])?P(?:(?P<weeks>\d+)W)?(?:(?P<days>\d+)D)?"
+    r"(?:T(?:(?P<hours>\d+)H)?(?:(?P<minutes>\d+)M)?(?:(?P<seconds>\d+)S)?)?$"
+)
+_BYDAY = re.compile(r"^(?P<ordinal>[+-]?\d{1,2})?(?P<weekday>MO|TU|WE|TH|FR|SA|SU)$")
+_IMPORT_ID = re.compile(r"^[0-9a-f]{24}$")
+
+Property = Tuple[Dict[str, str], str]
+RawEvent = Dict[str, List[Property]]
+
+
+class LineUnfolder:
+    """Turns byte chunks into unfolded content lines."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._current: Optional[bytearray] = None
+
+    def feed(self, data: bytes) -> List[str]:
+        """Add a chunk and return the lines it completed."""
+        self._buffer += data
+        end = self._buffer.rfind(b"\n")
+        if end == -1:
+            if len(self._buffer) > MAX_LINE_BYTES:
+                raise ValueError("ICS line too long")
+            return []
+        physical = self._buffer[:end].split(b"\n")
+        del self._buffer[: end + 1]
+        return self._unfold(physical)
+
+    def close(self) -> List[str]:
+        """Return the remaining lines at the end of the input."""
+        lines = self._unfold([self._buffer] if self._buffer else [])
+        self._buffer = bytearray()
+        if self._current is not None:
+            lines.append(self._current.decode("utf-8", errors="replace"))
+            self._current = None
+        return lines
+
+    def _unfold(self, physical: List[bytearray]) -> List[str]:
+        lines = []
+        for raw in physical:
+            if raw.endswith(b"\r"):
+                raw = raw[:-1]
+            # A line starting with a space or tab continues the previous one.
+            # Joining bytes before decoding keeps split UTF-8 sequences intact.
+            if raw[:1] in (b" ", b"\t") and self._current is not None:
+                self._current += raw[1:]
+                continue
+            if self._current is not None:
+                lines.append(self._current.decode("utf-8", errors="replace"))
+            self._current = bytearray(raw) if raw else None
+        return lines
+
+
+def parse_content_line(line: str) -> Optional[Tuple[str, Dict[str, str], str]]:
+    """
+    Split a content line into name, parameters and value.
+
+    Returns:
+        (NAME, {PARAM: value}, value), or None for malformed lines
+    """
+    in_quotes = False
+    for index, char in enumerate(line):
+        if char == '"':
+            in_quotes = not in_quotes
+        elif char == ":" and not in_quotes:
+            break
+    else:
+        return None
+
+    head, value = line[:index], line[index + 1 :]
+    parts = re.findall(r'(?:[^;"]|"[^"]*")+', head)
+    if not parts:
+        return None
+    params = {}
+    for part in parts[1:]:
+        key, _, param_value = part.partition("=")
+        params[key.upper()] = param_value.strip('"')
+    return parts[0].upper(), params, value
+
+
+def unescape_text(value: str) -> str:
+    return _TEXT_ESCAPES.sub(
+        lambda m: "\n" if m.group(1) in "nN" else m.group(1), value
+    )
+
+
+def parse_duration(value: str) -> Optional[timedelta]:
+    """Parse an RFC 5545 duration such as "PT1H30M" or "P1D"."""
+    match = _DURATION.match(value.strip())
+    if not match:
+        return None
+    parts = {k: int(v) for k, v in match.groupdict().items() if v and k != "sign"}
+    duration = timedelta(
+        weeks=parts.get("weeks", 0),
+        days=parts.get("days", 0),
+        hours=parts.get("hours", 0),
+        minutes=parts.get("minutes", 0),
+        seconds=parts.get("seconds", 0),
+    )
+    return -duration if match["sign"] == "-" else duration
+
+
+@lru_cache(maxsize=64)
+def resolve_zone(name: Optional[str]) -> Optional[tzinfo]:
+    """Look up a zone by IANA name, or None if it is missing or unknown."""
+    if not name:
+        return None
+    if name.upper() in ("UTC", "Z", "GMT"):
+        return timezone.utc
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        # Non-IANA names (e.g. from Outlook) are treated as floating time.
+        return None
+
+
+class CalendarTime:
+    """A DTSTART-style value: wall-clock time plus its zone, if any."""
+
+    def __init__(self, wall: datetime, zone: Optional[tzinfo], all_day: bool):
+        self.wall = wall
+        self.zone = zone
+        self.all_day = all_day
+
+    @classmethod
+    def parse(cls, prop: Property) -> "CalendarTime":
+        params, value = prop
+        value = value.strip()
+        if params.get("VALUE") == "DATE" or len(value) == 8:
+            return cls(datetime.strptime(value[:8], "%Y%m%d"), None, True)
+        if value.endswith("Z"):
+            wall = datetime.strptime(value[:-1], "%Y%m%dT%H%M%S")
+            return cls(wall, timezone.utc, False)
+        wall = datetime.strptime(value, "%Y%m%dT%H%M%S")
+        return cls(wall, resolve_zone(params.get("TZID")), False)
+
+    def wall_in(self, zone: Optional[tzinfo]) -> datetime:
+        """This time's wall-clock time in another zone."""
+        if self.zone is None or zone is None or self.zone is zone:
+            return self.wall
+        local = self.wall.replace(tzinfo=self.zone).astimezone(zone)
+        return local.replace(tzinfo=None)
+
+
+def _first(raw: RawEvent, name: str) -> Optional[Property]:
+    values = raw.get(name)
+    return values[0] if values else None
+
+
+def _text(raw: RawEvent, name: str) -> str:
+    prop = _first(raw, name)
+    return unescape_text(prop[1]) if prop else ""
+
+
+def _format_time(value: datetime) -> str:
+    return value.strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def parse_rrule(value: str) -> Dict[str, str]:
+    rule = {}
+    for part in value.split(";"):
+        key, _, part_value = part.partition("=")
+        if key:
+            rule[key.upper()] = part_value.upper()
+    return rule
+
+
+def _weekdays_in_month(year: int, month: int, weekday: int) -> List[int]:
+    first_weekday, days = calendar.monthrange(year, month)
+    first = 1 + (weekday - first_weekday) % 7
+    return list(range(first, days + 1, 7))
+
+
+def _month_days(
+    rule: Dict[str, str], year: int, month: int, start: datetime
+) -> List[int]:
+    days_in_month = calendar.monthrange(year, month)[1]
+    days = set()
+    for item in filter(None, rule.get("BYMONTHDAY", "").split(",")):
+        day = int(item)
+        day = day if day > 0 else days_in_month + day + 1
+        if 1 <= day <= days_in_month:
+            days.add(day)
+    for item in filter(None, rule.get("BYDAY", "").split(",")):
+        match = _BYDAY.match(item)
+        if not match:
+            continue
+        weekday = ICS_WEEKDAYS.index(match["weekday"])
+        candidates = _weekdays_in_month(year, month, weekday)
+        if match["ordinal"]:
+            ordinal = int(match["ordinal"])
+            index = ordinal - 1 if ordinal > 0 else ordinal
+            if -len(candidates) <= index < len(candidates):
+                days.add(candidates[index])
+        else:
+            days.update(candidates)
+    if not days and start.day <= days_in_month:
+        days.add(start.day)
+    return sorted(days)
+
+
+def _rule_periods(rule: Dict[str, str], start: datetime) -> Iterator[List[datetime]]:
+    """Yield candidate instance times, one sorted list per FREQ period."""
+    freq = rule.get("FREQ", "DAILY")
+    interval = max(int(rule.get("INTERVAL", "1") or 1), 1)
+    clock = start.time()
+
+    if freq == "DAILY":
+        for period in range(MAX_RRULE_PERIODS):
+            yield [start + timedelta(days=period * interval)]
+    elif freq == "WEEKLY":
+        weekdays = sorted(
+            ICS_WEEKDAYS.index(m["weekday"])
+            for m in map(_BYDAY.match, rule.get("BYDAY", "").split(","))
+            if m
+        ) or [start.weekday()]
+        monday = start - timedelta(days=start.weekday())
+        for period in range(MAX_RRULE_PERIODS):
+            week = monday + timedelta(weeks=period * interval)
+            yield [week + timedelta(days=weekday) for weekday in weekdays]
+    elif freq == "MONTHLY":
+        for period in range(MAX_RRULE_PERIODS):
+            year, month = divmod(start.month - 1 + period * interval, 12)
+            year, month = start.year + year, month + 1
+            yield [
+                datetime.combine(date(year, month, day), clock)
+                for day in _month_days(rule, year, month, start)
+            ]
+    elif freq == "YEARLY":
+        months = [int(m) for m in rule.get("BYMONTH", "").split(",") if m] or [
+            start.month
+        ]
+        for period in range(MAX_RRULE_PERIODS):
+            year = start.year + period * interval
+            yield [
+                datetime.combine(date(year, month, day), clock)
+                for month in sorted(months)
+                for day in _month_days(rule, year, month, start)
+            ]
+
+
+def expand_rrule(
+    rule: Dict[str, str],
+    start: datetime,
+    until: Optional[datetime] = None,
+    zone: Optional[tzinfo] = None,
+) -> Iterator[datetime]:
+    """
+    Lazily yield the wall-clock start times of a recurrence.
+
+    Supports FREQ=DAILY/WEEKLY/MONTHLY/YEARLY with INTERVAL, COUNT, UNTIL,
+    BYDAY (with ordinals for monthly/yearly), BYMONTHDAY and BYMONTH. Other
+    BY* parts are ignored.
+
+    Args:
+        rule: Parsed RRULE parts
+        start: Wall-clock DTSTART, always the first instance
+        until: Stop after this time (the caller's window end)
+        zone: Zone of ``start``, used to read a UTC ``UNTIL``
+
+    Yields:
+        Instance start times in order
+    """
+    remaining = int(rule["COUNT"]) if rule.get("COUNT", "").isdigit() else None
+    if "UNTIL" in rule:
+        rule_until = CalendarTime.parse(({}, rule["UNTIL"]))
+        rule_end = rule_until.wall_in(zone)
+        if rule_until.all_day:
+            rule_end += timedelta(days=1)
+        until = min(until, rule_end) if until else rule_end
+
+    for period in _rule_periods(rule, start):
+        for instance in period:
+            if instance < start:
+                continue
+            if until is not None and instance > until:
+                return
+            yield instance
+            if remaining is not None:
+                remaining -= 1
+                if remaining <= 0:
+                    return
+
+
+class CalendarImporter:
+    """
+    Incremental ICS parser producing windowed event dictionaries.
+
+    Feed it byte chunks; every call returns the events completed so far.
+    """
+
+    def __init__(
+        self,
+        window_start: datetime,
+        window_end: datetime,
+        zone: Optional[tzinfo] = None,
+    ):
+        self.window_start = window_start
+        self.window_end = window_end
+        self.zone = zone
+        self.calendar_name = ""
+        self.event_count = 0
+        self._unfolder = LineUnfolder()
+        self._depth: List[str] = []
+        self._raw: Optional[RawEvent] = None
+        self._masters: List[RawEvent] = []
+        self._overrides: Dict[Tuple[str, datetime], RawEvent] = {}
+
+    def feed(self, data: bytes) -> List[Dict[str, Any]]:
+        return self._parse_lines(self._unfolder.feed(data))
+
+    def close(self) -> List[Dict[str, Any]]:
+        """Finish the input and expand the recurring events."""
+        events = self._parse_lines(self._unfolder.close())
+        for raw in self._masters:
+            try:
+                events.extend(self._expand(raw))
+            except ValueError as e:
+                print(f"Skipping malformed recurring VEVENT: {str(e)}")
+        self._masters = []
+        return events
+
+    def _parse_lines(self, lines: List[str]) -> List[Dict[str, Any]]:
+        events = []
+        for line in lines:
+            parsed = parse_content_line(line)
+            if parsed is None:
+                continue
+            name, params, value = parsed
+            if name == "BEGIN":
+                self._depth.append(value.upper())
+                if self._depth == ["VCALENDAR", "VEVENT"]:
+                    self._raw = {}
+            elif name == "END":
+                if self._depth == ["VCALENDAR", "VEVENT"] and self._raw is not None:
+                    try:
+                        events.extend(self._finish_event(self._raw))
+                    except ValueError as e:
+                        print(f"Skipping malformed VEVENT: {str(e)}")
+                    self._raw = None
+                if self._depth:
+                    self._depth.pop()
+            elif self._depth == ["VCALENDAR", "VEVENT"] and self._raw is not None:
+                # Properties of nested components (VALARM) are skipped above.
+                self._raw.setdefault(name, []).append((params, value))
+            elif self._depth == ["VCALENDAR"] and name == "X-WR-CALNAME":
+                self.calendar_name = unescape_text(value)
+        return events
+
+    def _finish_event(self, raw: RawEvent) -> List[Dict[str, Any]]:
+        if _first(raw, "DTSTART") is None:
+            return []
+        if "RECURRENCE-ID" in raw:
+            start = CalendarTime.parse(raw["RECURRENCE-ID"][0])
+            self._overrides[(_text(raw, "UID"), start.wall)] = raw
+            event = self._build_event(raw, CalendarTime.parse(raw["DTSTART"][0]))
+            return [event] if event else []
+        if "RRULE" in raw:
+            self._masters.append(raw)
+            return []
+        event = self._build_event(raw, CalendarTime.parse(raw["DTSTART"][0]))
+        return [event] if event else []
+
+    def _duration(self, raw: RawEvent, start: CalendarTime) -> timedelta:
+        end_prop = _first(raw, "DTEND")
+        if end_prop is not None:
+            end = CalendarTime.parse(end_prop)
+            return end.wall_in(start.zone) - start.wall
+        duration_prop = _first(raw, "DURATION")
+        duration = parse_duration(duration_prop[1]) if duration_prop else None
+        if duration is not None:
+            return duration
+        return timedelta(days=1) if start.all_day else timedelta()
+
+    def _build_event(
+        self,
+        raw: RawEvent,
+        start: CalendarTime,
+        duration: Optional[timedelta] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """Build one windowed event, or None if it is outside the window."""
+        if _text(raw, "STATUS").upper() == "CANCELLED":
+            return None
+        if self.event_count >= IMPORT_MAX_EVENTS:
+            return None
+        if duration is None:
+            duration = self._duration(raw, start)
+        begin = start.wall if start.all_day else start.wall_in(self.zone)
+        end = begin + duration
+        if end < self.window_start or begin >= self.window_end:
+            return None
+
+        self.event_count += 1
+        return {
+            "title": _text(raw, "SUMMARY") or "Event",
+            "start_time": _format_time(begin),
+            "end_time": _format_time(end),
+            "location": _text(raw, "LOCATION"),
+            "description": _text(raw, "DESCRIPTION"),
+            "event_type": "All-day Event" if start.all_day else "Imported Event",
+        }
+
+    def _expand(self, raw: RawEvent) -> Iterator[Dict[str, Any]]:
+        start = CalendarTime.parse(raw["DTSTART"][0])
+        duration = self._duration(raw, start)
+        uid = _text(raw, "UID")
+        excluded = set()
+        for params, value in raw.get("EXDATE", []):
+            for item in value.split(","):
+                try:
+                    exdate = CalendarTime.parse((params, item))
+                    excluded.add(exdate.wall_in(start.zone))
+                except ValueError:
+                    continue
+
+        # Instances are generated in the event's own zone (so DST shifts keep
+        # the wall-clock time) and converted afterwards; widen by a day so the
+        # conversion can't push instances out of the window.
+        until = self.window_end + timedelta(days=1)
+        if start.zone is not None and self.zone is not None:
+            until = (
+                self.window_end.replace(tzinfo=self.zone)
+                .astimezone(start.zone)
+                .replace(tzinfo=None)
+                + timedelta(days=1)
+            )
+        rule = parse_rrule(raw["RRULE"][0][1])
+        for wall in expand_rrule(rule, start.wall, until, start.zone):
+            if wall in excluded or (uid, wall) in self._overrides:
+                continue
+            event = self._build_event(
+                raw, CalendarTime(wall, start.zone, start.all_day), duration
+            )
+            if event:
+                yield event
+            if self.event_count >= IMPORT_MAX_EVENTS:
+                return
+
+
+async def import_calendar(
+    chunks: AsyncIterator[bytes],
+    window_start: datetime,
+    window_end: datetime,
+    zone: Optional[tzinfo] = None,
+) -> Dict[str, Any]:
+    """
+    Parse an ICS upload into the schedule structure ``generate_ics_file`` uses.
+
+    Args:
+        chunks: The export's bytes, in chunks
+        window_start: Drop events ending before this wall-clock time
+        window_end: Drop events starting at or after this time
+        zone: Zone to express event times in, defaults to their own
+
+    Returns:
+        Schedule with ``events`` sorted by start time and a ``truncated``
+        flag set when ``IMPORT_MAX_EVENTS`` was reached
+    """
+    importer = CalendarImporter(window_start, window_end, zone)
+    events = []
+    # Parsing is CPU-bound; keep the event loop free between chunks.
+    async for chunk in chunks:
+        events.extend(await asyncio.to_thread(importer.feed, chunk))
+    events.extend(await asyncio.to_thread(importer.close))
+    events.sort(key=lambda event: event["start_time"])
+    return {
+        "course_name": importer.calendar_name or "Imported Calendar",
+        "course_code": "IMPORTED",
+        "events": events,
+        "truncated": importer.event_count >= IMPORT_MAX_EVENTS,
+    }
+
+
+def save_import(schedule: Dict[str, Any], content_hash: str) -> str:
+    """
+    Store an imported schedule and return its id.
+
+    Args:
+        schedule: Result of import_calendar
+        content_hash: Hash of the upload plus the import options, so
+            re-importing the same export is a no-op
+
+    Returns:
+        Import id
+    """
+    import_id = content_hash[:24]
+    os.makedirs(IMPORTS_DIR, exist_ok=True)
+    path = os.path.join(IMPORTS_DIR, f"{import_id}.json")
+    if not os.path.exists(path):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(schedule, f)
+        os.replace(tmp_path, path)
+    return import_id
+
+
+@lru_cache(maxsize=32)
+def load_import(import_id: str) -> Optional[Dict[str, Any]]:
+    """Load a stored import; stored imports never change, so they're cached."""
+    if not _IMPORT_ID.match(import_id or ""):
+        return None
+    path = os.path.join(IMPORTS_DIR, f"{import_id}.json")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+_DAY_MENTION = re.compile(
+    r"\b(?P<month>[a-z]+)\.?\s+(?P<day>\d{1,2})(?:st|nd|rd|th)?\b"
+)
+_NUMERIC_MENTION = re.compile(r"\b(?P<month>\d{1,2})/(?P<day>\d{1,2})\b")
+
+
+def relevant_window(message: str, now: datetime) -> Tuple[datetime, datetime]:
+    """
+    Pick the window of the calendar a chat message is likely about.
+
+    Dates and weekdays mentioned in the message widen the window around
+    them; otherwise it covers the next ``CHAT_CALENDAR_DAYS`` days.
+    """
+    text = message.lower()
+    today = now.date()
+    days: List[date] = []
+    for match in _DAY_MENTION.finditer(text):
+        if match["month"] in MONTHS:
+            try:
+                month = MONTHS[match["month"]]
+                days.append(date(today.year, month, int(match["day"])))
+            except ValueError:
+                pass
+    for match in _NUMERIC_MENTION.finditer(text):
+        try:
+            days.append(date(today.year, int(match["month"]), int(match["day"])))
+        except ValueError:
+            pass
+    for word in re.findall(r"[a-z]+", text):
+        if word.endswith("day") and word in WEEKDAYS:
+            ahead = (WEEKDAYS[word] - today.weekday()) % 7
+            days.append(today + timedelta(days=ahead))
+        elif word == "tomorrow":
+            days.append(today + timedelta(days=1))
+        elif word == "today":
+            days.append(today)
+    if "next week" in text:
+        monday = today + timedelta(days=7 - today.weekday())
+        days.extend([monday, monday + timedelta(days=6)])
+
+    if not days:
+        start = datetime.combine(today, datetime.min.time())
+        return start, start + timedelta(days=CHAT_CALENDAR_DAYS)
+    start = datetime.combine(min(days) - timedelta(days=1), datetime.min.time())
+    end = datetime.combine(max(days) + timedelta(days=2), datetime.min.time())
+    return start, end
+
+
+def summarize_for_chat(
+    schedule: Dict[str, Any],
+    message: str,
+    count_tokens: Callable[[str], int],
+    budget: int = CHAT_CALENDAR_TOKEN_BUDGET,
+    now: Optional[datetime] = None,
+) -> str:
+    """
+    Summarize the imported events relevant to a chat message.
+
+    One short line per event in the relevant window, stopping once the
+    token budget is spent.
+
+    Args:
+        schedule: Stored import
+        message: The user's message
+        count_tokens: Tokenizer for the budget
+        budget: Maximum tokens for the summary
+        now: Current datetime
+
+    Returns:
+        Summary text, empty if no imported events fall in the window
+    """
+    start, end = relevant_window(message, now or datetime.now())
+    events = schedule.get("events", [])
+    # Events are sorted by start time and every event lasts under a day or
+    # so, so starting a day early catches ones still running at the start.
+    starts = [event["start_time"] for event in events]
+    first = bisect_left(starts, _format_time(start - timedelta(days=1)))
+    window = [
+        event
+        for event in events[first : bisect_left(starts, _format_time(end))]
+        if event["end_time"] > _format_time(start)
+    ]
+    if not window:
+        return ""
+
+    header = (
+        f"Existing calendar ({schedule.get('course_name', 'Imported Calendar')}), "
+        f"events from {start:%b %d} to {end - timedelta(days=1):%b %d}:"
+    )
+    lines = [header]
+    used = count_tokens(header)
+    for index, event in enumerate(window):
+        begin = datetime.fromisoformat(event["start_time"])
+        finish = datetime.fromisoformat(event["end_time"])
+        when = (
+            f"{begin:%a %b %d}"
+            if event.get("event_type") == "All-day Event"
+            else f"{begin:%a %b %d %H:%M}-{finish:%H:%M}"
+        )
+        line = f"- {when} {event['title']}"
+        if event.get("location"):
+            line += f" @ {event['location']}"
+        cost = count_tokens(line) + 1
+        if used + cost > budget:
+            lines.append(f"- ... {len(window) - index} more not shown")
+            break
+        lines.append(line)
+        used += cost
+    return "\n".join(lines)
@@ -0,0 +1,222 @@
+"""
+Tiling for tall or dense images.
+
+In high detail the vision model fits an image into 2048x2048 and then
+scales its short side down to 768px, so a long phone screenshot of a whole
+semester ends up a few hundred pixels wide and its small print unreadable.
+Images the model would shrink below ``IMAGE_TILE_MIN_SCALE`` are split into
+overlapping tiles sized so each one reaches the model at (or near) its
+native resolution; the routers analyze the tiles concurrently and merge
+their results here.
+
+Rows cut off at a tile edge appear whole in the neighbouring tile thanks to
+the overlap, and events seen by two tiles are deduplicated.
+"""
+
+import asyncio
+import base64
+import io
+import math
+import os
+import re
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - Pillow is in requirements.txt
+    Image = None
+
+from app.core.admission import MAX_UPSTREAM
+
+VISION_LONG_SIDE = 2048
+VISION_SHORT_SIDE = 768
+TILE_MIN_SCALE = float(os.getenv("IMAGE_TILE_MIN_SCALE", "0.5"))
+TILE_OVERLAP = float(os.getenv("IMAGE_TILE_OVERLAP", "0.15"))
+MAX_TILES = int(os.getenv("IMAGE_MAX_TILES", "12"))
+TILE_CONCURRENCY = max(
+    1, min(int(os.getenv("IMAGE_TILE_CONCURRENCY", "4")), MAX_UPSTREAM)
+)
+TILE_JPEG_QUALITY = 90
+
+# Shared by every tile and scanned page in the process, so concurrent
+# requests together stay within TILE_CONCURRENCY upstream calls.
+tile_slots = asyncio.Semaphore(TILE_CONCURRENCY)
+
+# A tile this size reaches the model at TILE_MIN_SCALE at worst.
+TILE_SIDE = int(VISION_SHORT_SIDE / TILE_MIN_SCALE)
+
+DEFAULT_COURSE_NAME = "Events"
+DEFAULT_COURSE_CODE = "EVENTS"
+
+
+def model_scale(width: int, height: int) -> float:
+    """Linear scale the vision model applies to an image in high detail."""
+    fit = min(1.0, VISION_LONG_SIDE / max(width, height))
+    return fit * min(1.0, VISION_SHORT_SIDE / (min(width, height) * fit))
+
+
+def _spans(length: int, side: int) -> List[Tuple[int, int]]:
+    """Evenly spaced (start, size) spans covering ``length`` with overlap."""
+    if length <= side:
+        return [(0, length)]
+    overlap = int(side * TILE_OVERLAP)
+    count = math.ceil((length - overlap) / (side - overlap))
+    step = (length - side) / (count - 1)
+    return [(round(i * step), side) for i in range(count)]
+
+
+def tile_boxes(width: int, height: int) -> List[Tuple[int, int, int, int]]:
+    """
+    Plan tile crop boxes for an image.
+
+    Args:
+        width: Image width in pixels
+        height: Image height in pixels
+
+    Returns:
+        (left, top, right, bottom) boxes, or an empty list when the model
+        would see the whole image at a readable scale
+    """
+    if model_scale(width, height) >= TILE_MIN_SCALE:
+        return []
+    side = TILE_SIDE
+    while True:
+        columns = _spans(width, side)
+        rows = _spans(height, side)
+        if len(columns) * len(rows) <= MAX_TILES:
+            break
+        # Too many tiles: trade some resolution for fewer calls.
+        side = int(side * 1.25)
+    return [
+        (left, top, left + tile_width, top + tile_height)
+        for top, tile_height in rows
+        for left, tile_width in columns
+    ]
+
+
+def _encode_tile(tile) -> str:
+    scale = VISION_SHORT_SIDE / min(tile.size)
+    if scale < 1:
+        size = (round(tile.width * scale), round(tile.height * scale))
+        tile = tile.resize(size, Image.LANCZOS)
+    buffer = io.BytesIO()
+    tile.save(buffer, format="JPEG", quality=TILE_JPEG_QUALITY)
+    return base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+
+def split_image(image_data: bytes) -> List[str]:
+    """
+    Split an image into base64 JPEG tiles if it is too tall or dense.
+
+    CPU bound; call it off the event loop.
+
+    Args:
+        image_data: Uploaded image bytes
+
+    Returns:
+        Tiles top to bottom, left to right, or an empty list when the image
+        should be sent whole (including when it can't be decoded or Pillow
+        is unavailable)
+    """
+    if Image is None:
+        return []
+    try:
+        with Image.open(io.BytesIO(image_data)) as image:
+            image = ImageOps.exif_transpose(image)
+            boxes = tile_boxes(image.width, image.height)
+            if not boxes:
+                return []
+            image = image.convert("RGB")
+            tiles = [_encode_tile(image.crop(box)) for box in boxes]
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        print(f"Could not tile image: {str(e)}")
+        return []
+    print(f"Split {image.width}x{image.height} image into {len(tiles)} tiles")
+    return tiles
+
+
+def _normalize_title(title: Any) -> str:
+    return re.sub(r"[^a-z0-9]+", " ", str(title or "").lower()).strip()
+
+
+def same_event(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+    """
+    Whether two tiles' events are the same one.
+
+    They must start at the same time, not disagree on the end time, and
+    have titles where one contains the other (an edge can clip a title).
+    """
+    if a.get("start_time") != b.get("start_time"):
+        return False
+    if a.get("end_time") and b.get("end_time") and a["end_time"] != b["end_time"]:
+        return False
+    title_a = _normalize_title(a.get("title"))
+    title_b = _normalize_title(b.get("title"))
+    if not title_a or not title_b:
+        return title_a == title_b
+    return title_a in title_b or title_b in title_a
+
+
+def _richness(event: Dict[str, Any]) -> Tuple[int, int]:
+    filled = sum(1 for value in event.values() if value)
+    return filled, len(str(event.get("title") or ""))
+
+
+class EventMerger:
+    """Deduplicates events found by overlapping tiles, keeping the fullest."""
+
+    def __init__(self):
+        self.events: List[Dict[str, Any]] = []
+        self._by_start: Dict[Optional[str], List[int]] = {}
+
+    def add(self, event: Dict[str, Any]) -> bool:
+        """Add an event; returns False if it duplicates one already added."""
+        start = event.get("start_time")
+        indexes = self._by_start.setdefault(start, [])
+        for index in indexes:
+            if same_event(self.events[index], event):
+                if _richness(event) > _richness(self.events[index]):
+                    self.events[index] = event
+                return False
+        indexes.append(len(self.events))
+        self.events.append(event)
+        return True
+
+
+def _most_common(values: Iterable[Any], default: str) -> str:
+    counts = Counter(v for v in values if v and v != default)
+    return counts.most_common(1)[0][0] if counts else default
+
+
+def merge_tile_results(
+    results: List[Dict[str, Any]],
+    default_course_name: str = DEFAULT_COURSE_NAME,
+    default_course_code: str = DEFAULT_COURSE_CODE,
+) -> Dict[str, Any]:
+    """
+    Merge per-tile analyses into one schedule.
+
+    Args:
+        results: Parsed tile analyses, in tile order
+        default_course_name: Placeholder the prompt uses when no course shows
+        default_course_code: Placeholder the prompt uses when no code shows
+
+    Returns:
+        ``course_name``/``course_code``/``events`` result, events in tile
+        order; the course comes from whichever tiles actually showed one
+    """
+    merger = EventMerger()
+    for result in results:
+        for event in result.get("events") or []:
+            if isinstance(event, dict):
+                merger.add(event)
+    return {
+        "course_name": _most_common(
+            (r.get("course_name") for r in results), default_course_name
+        ),
+        "course_code": _most_common(
+            (r.get("course_code") for r in results), default_course_code
+        ),
+        "events": merger.events,
+    }
@@ -0,0 +1,321 @@
+"""
+Background analysis jobs.
+
+Heavy PDF and image analyses can be submitted as jobs instead of holding an
+HTTP connection open for the whole model call. Jobs go through a bounded
+in-process queue served by ``JOB_WORKERS`` workers, identical submissions
+are deduplicated by content hash, and results are persisted as JSON files
+under ``JOBS_DIR`` so they survive a restart.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+from app.core.admission import admission
+from app.services.analysis import ANALYZERS
+
+JOBS_DIR = os.getenv("JOBS_DIR", "jobs")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "32"))
+JOB_EVENT_BUFFER_SIZE = 512
+
+FINISHED = ("complete", "error")
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue has no room for another submission."""
+
+
+class Job:
+    """One submitted analysis and its progress events."""
+
+    def __init__(self, job_id: str, kind: str, filename: str):
+        self.id = job_id
+        self.kind = kind
+        self.filename = filename
+        self.status = "queued"
+        self.owner_pid = os.getpid()
+        self.owner_started = _process_started(self.owner_pid)
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.events: Deque[Dict[str, Any]] = deque(maxlen=JOB_EVENT_BUFFER_SIZE)
+        self.published = 0
+        self._published = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+    def publish(self, event: Dict[str, Any]):
+        self.events.append(event)
+        self.published += 1
+        self._published.set()
+        self._published = asyncio.Event()
+
+    async def follow(self) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield buffered and future progress events until the job finishes.
+
+        Yields:
+            dict: Events in the same vocabulary as /pdf/analyze-stream
+        """
+        if self.finished and not self.events:
+            yield self._final_event()
+            return
+
+        seen = self.published - len(self.events)
+        while True:
+            published = self._published
+            backlog = self.published - seen
+            for event in list(self.events)[-backlog:] if backlog else []:
+                yield event
+            seen = self.published
+            if self.finished:
+                return
+            await published.wait()
+
+    def _final_event(self) -> Dict[str, Any]:
+        if self.status == "complete":
+            return {"status": "complete", "data": self.result}
+        return {"status": "error", "message": self.error}
+
+    def to_dict(self, include_result: bool = False) -> Dict[str, Any]:
+        data = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "filename": self.filename,
+            "status": self.status,
+            "owner_pid": self.owner_pid,
+            "owner_started": self.owner_started,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+        }
+        if include_result:
+            data["result"] = self.result
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Job":
+        job = cls(data["job_id"], data["kind"], data.get("filename", ""))
+        job.status = data["status"]
+        job.owner_pid = data.get("owner_pid", 0)
+        job.owner_started = data.get("owner_started")
+        job.created_at = data.get("created_at", job.created_at)
+        job.started_at = data.get("started_at")
+        job.finished_at = data.get("finished_at")
+        job.result = data.get("result")
+        job.error = data.get("error")
+        return job
+
+
+class JobStore:
+    """Persists finished jobs as one JSON file each."""
+
+    def __init__(self, directory: str = JOBS_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def save(self, job: Job):
+        path = self._path(job.id)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(job.to_dict(include_result=True), f)
+        os.replace(tmp_path, path)
+
+    def load(self, job_id: str) -> Optional[Job]:
+        try:
+            with open(self._path(job_id), "r", encoding="utf-8") as f:
+                job = Job.from_dict(json.load(f))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if not job.finished and not _process_alive(
+            job.owner_pid, job.owner_started
+        ):
+            # The worker process that owned this job is gone.
+            job.status = "error"
+            job.error = "Job was interrupted by a server restart"
+        return job
+
+
+def _process_started(pid: int) -> Optional[int]:
+    """Start time of a process in clock ticks after boot, where /proc has it."""
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            stat = f.read()
+        # The command name may contain spaces, so count fields after its ")".
+        return int(stat.rsplit(b")", 1)[1].split()[19])
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def _process_alive(pid: int, started: Optional[int] = None) -> bool:
+    """
+    Whether the process that owned a job still runs.
+
+    PIDs are small and reused in containers, so a PID alone may name an
+    unrelated process after a restart; the start time recorded with the
+    job tells the two apart.
+    """
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        pass
+    return started is None or _process_started(pid) == started
+
+
+class JobQueue:
+    """Bounded queue of jobs served by a fixed pool of worker tasks."""
+
+    def __init__(
+        self,
+        store: JobStore,
+        workers: int = JOB_WORKERS,
+        maxsize: int = JOB_QUEUE_SIZE,
+    ):
+        self.store = store
+        self.worker_count = workers
+        self.maxsize = maxsize
+        self.jobs: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: list[asyncio.Task] = []
+
+    @property
+    def queued(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    def _ensure_workers(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.maxsize)
+        if not self._workers:
+            self._workers = [
+                asyncio.create_task(self._work(), name=f"job-worker-{i}")
+                for i in range(self.worker_count)
+            ]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        job = self.jobs.get(job_id)
+        if job is None:
+            job = self.store.load(job_id)
+        return job
+
+    async def follow(self, job_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield a job's progress events.
+
+        Jobs owned by another worker process only have their persisted
+        status, so those are polled from the store until they finish.
+
+        Yields:
+            dict: Progress events
+        """
+        job = self.jobs.get(job_id)
+        if job is not None:
+            async for event in job.follow():
+                yield event
+            return
+
+        status = None
+        while True:
+            job = self.store.load(job_id)
+            if job is None:
+                return
+            if job.finished:
+                yield job._final_event()
+                return
+            if job.status != status:
+                status = job.status
+                yield {"status": job.status, "message": f"Job is {job.status}"}
+            await asyncio.sleep(1)
+
+    def submit(self, kind: str, data: bytes, filename: str = "") -> Job:
+        """
+        Queue an analysis, or return the existing job for identical input.
+
+        Args:
+            kind: "pdf" or "image"
+            data: Uploaded file bytes
+            filename: Original file name, for display
+
+        Returns:
+            The new or deduplicated job
+
+        Raises:
+            QueueFullError: If the queue is at capacity
+        """
+        if kind not in ANALYZERS:
+            raise ValueError(f"Unknown job kind: {kind}")
+
+        job_id = hashlib.sha256(kind.encode() + b"\0" + data).hexdigest()[:32]
+        existing = self.get(job_id)
+        if existing is not None and existing.status != "error":
+            return existing
+
+        self._ensure_workers()
+        job = Job(job_id, kind, filename)
+        try:
+            self._queue.put_nowait((job, data))
+        except asyncio.QueueFull as e:
+            raise QueueFullError("Job queue is full, try again later") from e
+
+        self.jobs[job_id] = job
+        self.store.save(job)
+        return job
+
+    async def _work(self):
+        while True:
+            # Under load, leave jobs queued instead of adding to the pressure.
+            await admission.wait_for_capacity(include_queue=False)
+            job, data = await self._queue.get()
+            try:
+                await self._run(job, data)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Job, data: bytes):
+        job.status = "running"
+        job.started_at = time.time()
+        self.store.save(job)
+        try:
+            job.result = await ANALYZERS[job.kind](data, job.publish)
+            job.status = "complete"
+        except Exception as e:
+            print(f"Error in {job.kind} job {job.id}: {str(e)}")
+            job.error = str(e)
+            job.status = "error"
+        job.finished_at = time.time()
+        job.publish(job._final_event())
+        self.store.save(job)
+        # Finished jobs are served from the store from now on.
+        self.jobs.pop(job.id, None)
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+
+@lru_cache(maxsize=1)
+def get_job_queue() -> JobQueue:
+    """Returns the process-wide job queue, creating it on first use."""
+    queue = JobQueue(JobStore())
+    admission.watch_queue(lambda: queue.queued)
+    return queue
@@ -0,0 +1,308 @@
+"""
+Near-duplicate syllabus index.
+
+Every analyzed PDF is fingerprinted with a 64-bit SimHash over word
+shingles and stored in a compact append-only index (24 bytes per document)
+plus one small JSON record holding its passages, their hashes and result.
+
+Lookups split the fingerprint into four 16-bit bands (LSH). Documents
+within 3 bits of each other always share a band (four bands can't all
+contain a differing bit), so a lookup is four dict probes and a handful
+of Hamming-distance checks regardless of how many documents are stored.
+Each worker holds the index in flat arrays (about 40 bytes per document)
+and reads only the records other workers appended since its last lookup.
+Raising ``NEAR_DUP_MAX_DISTANCE`` above 3 only finds the farther documents
+that happen to share a band.
+"""
+
+import hashlib
+import json
+import os
+import re
+import struct
+import threading
+from array import array
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+NEAR_DUP_DIR = os.getenv("NEAR_DUP_DIR", "near_duplicates")
+SIMILAR_MAX_DISTANCE = int(os.getenv("NEAR_DUP_MAX_DISTANCE", "3"))
+# Above this share of changed passages a full analysis is cheaper and safer.
+MAX_CHANGED_FRACTION = 0.5
+
+SHINGLE_SIZE = 3
+BANDS = 4
+BAND_BITS = 64 // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+ID_BYTES = 16
+_RECORD = struct.Struct(f"<Q{ID_BYTES}s")
+_WORD = re.compile(r"\w+")
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(
+        hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "little"
+    )
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def simhash(text: str) -> int:
+    """
+    64-bit SimHash of a text's word shingles.
+
+    Args:
+        text: Document text
+
+    Returns:
+        Fingerprint as an unsigned 64-bit integer
+    """
+    words = _WORD.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        words = words or [""]
+        shingles = [" ".join(words)]
+    else:
+        shingles = [
+            " ".join(words[i : i + SHINGLE_SIZE])
+            for i in range(len(words) - SHINGLE_SIZE + 1)
+        ]
+
+    # Count set bits per position byte-column-wise: Counter over a bytes
+    # slice runs in C, so cost is dominated by hashing the shingles.
+    blob = b"".join(
+        hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest()
+        for shingle in shingles
+    )
+    fingerprint = 0
+    for byte_index in range(8):
+        ones = [0] * 8
+        for value, count in Counter(blob[byte_index::8]).items():
+            for bit in range(8):
+                if value >> bit & 1:
+                    ones[bit] += count
+        for bit in range(8):
+            if ones[bit] * 2 > len(shingles):
+                fingerprint |= 1 << (byte_index * 8 + bit)
+    return fingerprint
+
+
+def split_passages(text: str) -> List[str]:
+    """
+    Split a document into passages for change detection.
+
+    Uses blank-line paragraphs when present, otherwise groups of five lines
+    (PyPDF2 output often has no blank lines).
+    """
+    paragraphs = [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
+    if len(paragraphs) > 1:
+        return paragraphs
+    lines = [line for line in text.splitlines() if line.strip()]
+    return ["\n".join(lines[i : i + 5]) for i in range(0, len(lines), 5)]
+
+
+class NearDuplicateMatch:
+    """Result of looking a document up in the index."""
+
+    def __init__(
+        self,
+        doc_id: str,
+        distance: int,
+        result: Dict[str, Any],
+        changed_passages: List[str],
+        passage_count: int,
+        removed_passages: Optional[List[str]] = None,
+    ):
+        self.doc_id = doc_id
+        self.distance = distance
+        self.result = result
+        self.changed_passages = changed_passages
+        self.passage_count = passage_count
+        self.removed_passages = removed_passages or []
+
+    @property
+    def unchanged(self) -> bool:
+        return not self.changed_passages and not self.removed_passages
+
+    @property
+    def changed_fraction(self) -> float:
+        changes = len(self.changed_passages) + len(self.removed_passages)
+        return changes / max(self.passage_count + len(self.removed_passages), 1)
+
+
+class NearDuplicateIndex:
+    """SimHash/LSH index of analyzed documents, persisted under a directory."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.docs_dir = os.path.join(directory, "docs")
+        self.index_path = os.path.join(directory, "index.bin")
+        os.makedirs(self.docs_dir, exist_ok=True)
+        self._fingerprints = array("Q")
+        # Raw document ids, concatenated in position order.
+        self._ids = bytearray()
+        # Per band, linked lists in flat arrays: the newest position for each
+        # band key, and for each position the previous one with the same key.
+        self._heads = [array("i", [-1]) * (BAND_MASK + 1) for _ in range(BANDS)]
+        self._chains = [array("i") for _ in range(BANDS)]
+        self._offset = 0
+        self._lock = threading.Lock()
+        self._refresh()
+
+    def __len__(self) -> int:
+        return len(self._fingerprints)
+
+    def _refresh(self):
+        """Pick up records appended since the last read, e.g. by another worker."""
+        try:
+            size = os.stat(self.index_path).st_size
+            if size - self._offset < _RECORD.size:
+                return
+            with open(self.index_path, "rb") as f:
+                f.seek(self._offset)
+                data = f.read(size - self._offset)
+        except FileNotFoundError:
+            return
+        usable = len(data) - len(data) % _RECORD.size
+        for fingerprint, raw_id in _RECORD.iter_unpack(data[:usable]):
+            self._insert(fingerprint, raw_id)
+        self._offset += usable
+
+    def _insert(self, fingerprint: int, raw_id: bytes):
+        position = len(self._fingerprints)
+        self._fingerprints.append(fingerprint)
+        self._ids += raw_id
+        for band in range(BANDS):
+            key = fingerprint >> (band * BAND_BITS) & BAND_MASK
+            self._chains[band].append(self._heads[band][key])
+            self._heads[band][key] = position
+
+    def _doc_path(self, doc_id: str) -> str:
+        return os.path.join(self.docs_dir, f"{doc_id}.json")
+
+    def _load_doc(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._doc_path(doc_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    @staticmethod
+    def doc_id(text: str) -> str:
+        return hashlib.sha256(_normalize(text).encode("utf-8")).hexdigest()[:32]
+
+    def nearest(self, fingerprint: int) -> Optional[tuple]:
+        """
+        Find the closest stored fingerprint sharing at least one band.
+
+        Returns:
+            (doc_id, hamming distance), or None if nothing is close enough
+        """
+        with self._lock:
+            self._refresh()
+            candidates = set()
+            for band in range(BANDS):
+                key = fingerprint >> (band * BAND_BITS) & BAND_MASK
+                position = self._heads[band][key]
+                while position >= 0:
+                    candidates.add(position)
+                    position = self._chains[band][position]
+            best = None
+            for position in candidates:
+                distance = (fingerprint ^ self._fingerprints[position]).bit_count()
+                if distance <= SIMILAR_MAX_DISTANCE and (
+                    best is None or distance < best[1]
+                ):
+                    best = (position, distance)
+            if best is None:
+                return None
+            start = best[0] * ID_BYTES
+            return self._ids[start : start + ID_BYTES].hex(), best[1]
+
+    def lookup(self, text: str) -> Optional[NearDuplicateMatch]:
+        """
+        Look up a previously analyzed document identical or similar to ``text``.
+
+        Args:
+            text: Extracted document text
+
+        Returns:
+            The match with its stored result, the passages of ``text``
+            missing from it and its passages missing from ``text``, or None
+        """
+        passages = split_passages(text)
+        exact = self._load_doc(self.doc_id(text))
+        if exact is not None:
+            return NearDuplicateMatch(
+                self.doc_id(text), 0, exact["result"], [], len(passages)
+            )
+
+        nearest = self.nearest(simhash(text))
+        if nearest is None:
+            return None
+        doc_id, distance = nearest
+        doc = self._load_doc(doc_id)
+        if doc is None:
+            return None
+
+        hashes = [_hash64(_normalize(p)) for p in passages]
+        known = set(doc["passage_hashes"])
+        changed = [p for p, h in zip(passages, hashes) if h not in known]
+        current = set(hashes)
+        removed_hashes = [h for h in doc["passage_hashes"] if h not in current]
+        old_passages = doc.get("passages")
+        if removed_hashes and old_passages is None:
+            # Older records only kept hashes: the removed text can't be shown
+            # to the update prompt, so analyze the document in full.
+            return None
+        removed = [
+            p
+            for p, h in zip(old_passages or [], doc["passage_hashes"])
+            if h not in current
+        ]
+        return NearDuplicateMatch(
+            doc_id, distance, doc["result"], changed, len(passages), removed
+        )
+
+    def add(self, text: str, result: Dict[str, Any]):
+        """
+        Store a document's analysis result.
+
+        Args:
+            text: Extracted document text
+            result: Parsed analysis result
+        """
+        doc_id = self.doc_id(text)
+        passages = split_passages(text)
+        record = {
+            "passages": passages,
+            "passage_hashes": [_hash64(_normalize(p)) for p in passages],
+            "result": result,
+        }
+        path = self._doc_path(doc_id)
+        is_new = not os.path.exists(path)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(record, f)
+        os.replace(tmp_path, path)
+
+        if is_new:
+            with self._lock:
+                # One small O_APPEND write, so concurrent workers don't interleave.
+                with open(self.index_path, "ab") as f:
+                    f.write(_RECORD.pack(simhash(text), bytes.fromhex(doc_id)))
+                self._refresh()
+
+
+_indexes: Dict[str, NearDuplicateIndex] = {}
+
+
+def get_near_duplicate_index(namespace: str) -> NearDuplicateIndex:
+    """
+    Return the index for a namespace, typically a prompt digest so results
+    from an older prompt version are never reused.
+    """
+    if namespace not in _indexes:
+        _indexes[namespace] = NearDuplicateIndex(os.path.join(NEAR_DUP_DIR, namespace))
+    return _indexes[namespace]
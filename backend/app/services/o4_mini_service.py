@@ -1,23 +1,66 @@
 """Initialize our GPT object to make API calls."""
 
 import os
-import tiktoken
-from openai import OpenAI
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
 from dotenv import load_dotenv
 
+from app.core.admission import admission
+from app.services.budgets import OutputBudget, budget_stats
+from app.services.cassettes import get_cassette_store
+from app.services.routing import DEFAULT_MODEL, latency_tracker
+
 load_dotenv()
 
+TOKENIZER_ENCODING = "o200k_base"
+
 
 class OpenAIo4Service:
-    """Defines the OpenAI 4o object."""
+    """
+    Defines the OpenAI 4o object.
+
+    The OpenAI client and the tiktoken encoding are built on first use so
+    importing the app stays cheap on a cold start.
+    """
 
     def __init__(self):
-        self.default_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        self.model = "o4-mini-2025-04-16"
-        self.encoding = tiktoken.get_encoding("o200k_base")
+        self.model = DEFAULT_MODEL
         self.api_key = os.getenv("OPENAI_API_KEY")
         self.base_url = "https://api.openai.com/v1/chat/completions"
         self.reasoning_effort = "low"
+        self._default_client = None
+        self._encoding = None
+        self._lock = threading.Lock()
+
+    @property
+    def default_client(self):
+        """Synchronous OpenAI client, created on first access."""
+        if self._default_client is None:
+            with self._lock:
+                if self._default_client is None:
+                    from openai import OpenAI
+
+                    self._default_client = OpenAI(api_key=self.api_key)
+        return self._default_client
+
+    @property
+    def encoding(self):
+        """tiktoken encoding, loaded on first access."""
+        if self._encoding is None:
+            with self._lock:
+                if self._encoding is None:
+                    import tiktoken
+
+                    self._encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+        return self._encoding
+
+    def preload(self):
+        """Eagerly load the tokenizer and client, e.g. from a warm-up thread."""
+        _ = self.encoding
+        _ = self.default_client
 
     def count_tokens(self, prompt: str) -> int:
         """
@@ -31,3 +74,83 @@ class OpenAIo4Service:
         """
         num_tokens = len(self.encoding.encode(prompt))
         return num_tokens
+
+    def complete(
+        self,
+        messages: List[Dict[str, Any]],
+        model: str | None = None,
+        budget: Optional[OutputBudget] = None,
+        **params,
+    ) -> str:
+        """
+        Runs a non-streaming chat completion and returns its text.
+
+        Goes through the cassette store when one is configured, so the call
+        can be recorded or replayed offline.
+
+        Args:
+            messages (list): Chat messages to send
+            model (str): Model override, defaults to the service model
+            budget (OutputBudget): Completion budget from plan_budget; a
+                response it cuts off is retried once with a larger one
+            **params: Extra Chat Completions parameters
+
+        Returns:
+            str: The model's response text
+        """
+        payload = {"model": model or self.model, "messages": messages, **params}
+        if budget is None:
+            return self._complete(payload)[0]
+
+        budget_stats.record_request(budget)
+        content, finish_reason = self._complete({**payload, **budget.params()})
+        if finish_reason != "length":
+            return content
+        budget_stats.record_truncation(budget.endpoint)
+        larger = budget.retry()
+        if larger is None:
+            return content
+
+        print(
+            f"{budget.endpoint} response hit its {budget.max_completion_tokens}"
+            f"-token budget; retrying with {larger.max_completion_tokens}"
+        )
+        started = time.perf_counter()
+        content, _ = self._complete({**payload, **larger.params()})
+        budget_stats.record_retry(budget.endpoint, time.perf_counter() - started)
+        return content
+
+    def _complete(self, payload: Dict[str, Any]) -> Tuple[str, Optional[str]]:
+        """Send one request; returns its content and finish reason."""
+        cassette = get_cassette_store()
+        if cassette and cassette.replaying:
+            return cassette.load(payload).content, None
+
+        recorder = cassette.recorder(payload) if cassette else None
+        started = time.perf_counter()
+        with admission.upstream_request():
+            response = self.default_client.chat.completions.create(**payload)
+        choice = response.choices[0]
+        content = choice.message.content
+        if content is None and choice.finish_reason != "length":
+            raise ValueError(f"No content returned from OpenAI {payload['model']}")
+        # A reasoning model can spend the whole budget before answering.
+        content = content or ""
+
+        elapsed = time.perf_counter() - started
+        latency_tracker.record_total(payload["model"], elapsed)
+
+        if recorder:
+            recorder.add(content)
+            recorder.save()
+        return content, choice.finish_reason
+
+
+@lru_cache(maxsize=1)
+def get_o4_service() -> OpenAIo4Service:
+    """
+    Returns the process-wide OpenAIo4Service, creating it on first use.
+
+    Use as a FastAPI dependency: ``o4_service = Depends(get_o4_service)``.
+    """
+    return OpenAIo4Service()
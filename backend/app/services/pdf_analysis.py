@@ -0,0 +1,266 @@
+"""
+PDF analysis shared by the PDF routes, jobs and the prompt eval harness.
+
+The text layer is analyzed as text, reusing or incrementally updating the
+analysis of a near-duplicate document where one exists; pages without a
+text layer are rasterized and analyzed with the vision model.
+"""
+
+import hashlib
+import io
+import json
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional, Tuple
+
+from app.services.o4_mini_service import get_o4_service
+from app.prompts import (
+    PDF_EXAM_ANALYSIS_SYSTEM_PROMPT,
+    PDF_EXAM_UPDATE_SYSTEM_PROMPT,
+    PDF_PAGE_USER_PROMPT,
+)
+from app.services.image_tiles import merge_tile_results
+from app.services.pdf_pages import rasterize_pages, scanned_pages
+from app.services.routing import ModelRoute, choose_pdf_route, document_complexity
+from app.services.near_duplicates import (
+    MAX_CHANGED_FRACTION,
+    get_near_duplicate_index,
+)
+from app.services.upstream import analyze_images_stream
+
+
+def extract_pages_from_pdf(pdf_data: bytes) -> List[str]:
+    """
+    Extract the text content of each page from PDF bytes.
+
+    Args:
+        pdf_data: PDF file as bytes
+
+    Returns:
+        Extracted text of each page, empty for pages without a text layer
+
+    Raises:
+        ValueError: If the PDF can't be read
+    """
+    import PyPDF2  # deferred: only needed once a PDF is uploaded
+
+    try:
+        pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_data))
+        return [page.extract_text() or "" for page in pdf_reader.pages]
+    except Exception as e:
+        print(f"Error extracting text from PDF: {str(e)}")
+        raise ValueError(f"Error reading PDF: {str(e)}") from e
+
+
+def extract_text_from_pdf(pdf_data: bytes) -> str:
+    """
+    Extract text content from PDF bytes.
+
+    Args:
+        pdf_data: PDF file as bytes
+
+    Returns:
+        Extracted text content
+    """
+    return "\n".join(extract_pages_from_pdf(pdf_data)).strip()
+
+
+def split_pdf_pages(pdf_data: bytes) -> Tuple[str, List[int], int]:
+    """
+    Separate a PDF's text layer from the pages that need rasterizing.
+
+    Args:
+        pdf_data: PDF file as bytes
+
+    Returns:
+        (text of the pages that have some, indexes of scanned pages to
+        rasterize, page count)
+    """
+    page_texts = extract_pages_from_pdf(pdf_data)
+    scanned = scanned_pages(page_texts)
+    skipped = set(scanned)
+    text = "\n".join(
+        page_text
+        for index, page_text in enumerate(page_texts)
+        if index not in skipped
+    )
+    return text.strip(), scanned, len(page_texts)
+
+
+def merge_pdf_results(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Merge the text-layer analysis and per-page analyses of one PDF."""
+    if len(results) == 1:
+        return results[0]
+    return merge_tile_results(
+        results, default_course_name="Academic Events", default_course_code="ACADEMIC"
+    )
+
+
+async def scanned_page_events(
+    pdf_data: bytes, scanned: List[int], page_count: int, required: bool = True
+) -> AsyncGenerator[Dict[str, Any], None]:
+    """
+    Analyze scanned pages with the vision model as they are rasterized.
+
+    Args:
+        pdf_data: PDF file as bytes
+        scanned: Indexes of pages to rasterize
+        page_count: Total pages, for the prompt
+        required: Whether failure is an error; otherwise it is logged and
+            the stream ends without a "complete" event
+
+    Yields:
+        "streaming" events carrying newly found ``events``, then a
+        "complete" event with the merged per-page result
+    """
+
+    async def pages():
+        async for index, image in rasterize_pages(pdf_data, scanned):
+            user_prompt = PDF_PAGE_USER_PROMPT.format(page=index + 1, count=page_count)
+            yield index, user_prompt, image
+
+    try:
+        async for event in analyze_images_stream(
+            pages(), PDF_EXAM_ANALYSIS_SYSTEM_PROMPT, merge_pdf_results, "pdf_page"
+        ):
+            yield event
+    except Exception as e:
+        if required:
+            raise
+        print(f"Error analyzing scanned pages: {str(e)}")
+
+
+async def analyze_scanned_pages(
+    pdf_data: bytes,
+    scanned: List[int],
+    page_count: int,
+    required: bool = True,
+    publish: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Run scanned_page_events to completion.
+
+    Args:
+        pdf_data: PDF file as bytes
+        scanned: Indexes of pages to rasterize
+        page_count: Total pages, for the prompt
+        required: Passed to scanned_page_events
+        publish: Receives the progress events
+
+    Returns:
+        Merged per-page result, or None if optional analysis failed
+    """
+    async for event in scanned_page_events(pdf_data, scanned, page_count, required):
+        if event["status"] == "complete":
+            return event["data"]
+        if publish is not None:
+            publish(event)
+    return None
+
+
+def route_pdf_analysis(
+    pdf_text: str, system_prompt: str = PDF_EXAM_ANALYSIS_SYSTEM_PROMPT
+) -> ModelRoute:
+    """
+    Pick the model and reasoning effort for analyzing a PDF's text.
+
+    Args:
+        pdf_text: Extracted PDF text (or the user content sent in its place)
+        system_prompt: System prompt the request will use
+
+    Returns:
+        Routing decision based on input tokens and document complexity
+    """
+    o4_service = get_o4_service()
+    input_tokens = o4_service.count_tokens(system_prompt) + o4_service.count_tokens(
+        pdf_text
+    )
+    route = choose_pdf_route(input_tokens, document_complexity(pdf_text))
+    print(f"Routing PDF analysis ({input_tokens} input tokens) to {route}")
+    return route
+
+
+# Results are namespaced by prompt so a prompt change never reuses stale ones;
+# both prompts produce stored results.
+_PROMPT_NAMESPACE = hashlib.sha256(
+    (PDF_EXAM_ANALYSIS_SYSTEM_PROMPT + "\0" + PDF_EXAM_UPDATE_SYSTEM_PROMPT).encode(
+        "utf-8"
+    )
+).hexdigest()[:12]
+
+
+class PdfAnalysisPlan:
+    """
+    How to analyze one PDF.
+
+    ``mode`` is "reuse" when an identical or unchanged document was analyzed
+    before (``cached_result`` is set), "update" when a near-duplicate exists
+    and only its changed passages are sent along with the previous events,
+    and "full" otherwise.
+    """
+
+    def __init__(
+        self,
+        mode: str,
+        system_prompt: str,
+        user_content: str,
+        cached_result: Optional[Dict[str, Any]] = None,
+    ):
+        self.mode = mode
+        self.system_prompt = system_prompt
+        self.user_content = user_content
+        self.cached_result = cached_result
+        # Output budgets are estimated per endpoint type.
+        self.endpoint = "pdf_update" if mode == "update" else "pdf"
+        self.route = (
+            route_pdf_analysis(user_content, system_prompt)
+            if cached_result is None
+            else None
+        )
+
+
+def plan_pdf_analysis(pdf_text: str) -> PdfAnalysisPlan:
+    """
+    Decide whether a PDF can reuse or incrementally update a past analysis.
+
+    Args:
+        pdf_text: Extracted PDF text
+
+    Returns:
+        The analysis plan
+    """
+    full = PdfAnalysisPlan("full", PDF_EXAM_ANALYSIS_SYSTEM_PROMPT, pdf_text)
+    try:
+        match = get_near_duplicate_index(_PROMPT_NAMESPACE).lookup(pdf_text)
+    except OSError as e:
+        print(f"Near-duplicate lookup failed: {str(e)}")
+        return full
+
+    if match is None:
+        return full
+    if match.unchanged:
+        print(f"Reusing analysis of unchanged document {match.doc_id}")
+        return PdfAnalysisPlan("reuse", "", "", cached_result=match.result)
+    if match.changed_fraction > MAX_CHANGED_FRACTION:
+        return full
+
+    print(
+        f"Updating analysis of {match.doc_id} (distance {match.distance}, "
+        f"{len(match.changed_passages)}/{match.passage_count} passages changed, "
+        f"{len(match.removed_passages)} removed)"
+    )
+    user_content = (
+        "Previous result:\n"
+        + json.dumps(match.result)
+        + "\n\nChanged passages:\n"
+        + ("\n---\n".join(match.changed_passages) or "(none)")
+        + "\n\nRemoved passages:\n"
+        + ("\n---\n".join(match.removed_passages) or "(none)")
+    )
+    return PdfAnalysisPlan("update", PDF_EXAM_UPDATE_SYSTEM_PROMPT, user_content)
+
+
+def remember_pdf_analysis(pdf_text: str, result: Dict[str, Any]):
+    """Store a finished analysis so later near-duplicates can reuse it."""
+    try:
+        get_near_duplicate_index(_PROMPT_NAMESPACE).add(pdf_text, result)
+    except OSError as e:
+        print(f"Failed to store near-duplicate record: {str(e)}")
@@ -0,0 +1,149 @@
+"""
+Rasterizing PDF pages that have no text layer.
+
+Scanned syllabi have pages PyPDF2 can't read. Those pages (and only those)
+are rendered to JPEG at ``PDF_RASTER_DPI`` by a pool of worker processes
+(pdfium isn't thread-safe) and handed to the vision model as each one is
+ready, so model calls overlap with rendering the remaining pages.
+
+Worker processes are spawned and import this module, so it stays free of
+app imports.
+"""
+
+import asyncio
+import base64
+import importlib.util
+import io
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from typing import AsyncIterator, List, Tuple
+
+PDF_RASTER_DPI = int(os.getenv("PDF_RASTER_DPI", "150"))
+PDF_RASTER_MAX_SIDE = int(os.getenv("PDF_RASTER_MAX_SIDE", "2048"))
+PDF_RASTER_WORKERS = int(os.getenv("PDF_RASTER_WORKERS", "2"))
+PDF_MAX_SCANNED_PAGES = int(os.getenv("PDF_MAX_SCANNED_PAGES", "30"))
+SCANNED_PAGE_MIN_CHARS = int(os.getenv("PDF_SCANNED_PAGE_MIN_CHARS", "20"))
+RASTER_JPEG_QUALITY = 85
+
+# Worker-side: the document most recently opened by this worker process.
+_open_document: Tuple[str, object] = ("", None)
+
+
+@lru_cache(maxsize=1)
+def _pdfium_installed() -> bool:
+    # Checked without importing: pdfium is only loaded in the workers.
+    return importlib.util.find_spec("pypdfium2") is not None
+
+
+def can_rasterize() -> bool:
+    """Whether scanned pages can be rendered; set PDF_RASTER_WORKERS=0 to disable."""
+    return PDF_RASTER_WORKERS > 0 and _pdfium_installed()
+
+
+def scanned_pages(page_texts: List[str]) -> List[int]:
+    """
+    Pick the pages to rasterize.
+
+    Args:
+        page_texts: Extracted text of each page
+
+    Returns:
+        Indexes of pages with (next to) no text layer, at most
+        PDF_MAX_SCANNED_PAGES of them; empty if rasterizing is unavailable
+    """
+    if not can_rasterize():
+        return []
+    pages = [
+        index
+        for index, text in enumerate(page_texts)
+        if len(text.strip()) < SCANNED_PAGE_MIN_CHARS
+    ]
+    return pages[:PDF_MAX_SCANNED_PAGES]
+
+
+def render_page(path: str, index: int) -> Tuple[int, str]:
+    """
+    Render one page to a base64 JPEG. Runs in a raster worker process.
+
+    Args:
+        path: PDF file shared with the workers
+        index: Zero-based page index
+
+    Returns:
+        (index, image) pair
+    """
+    import pypdfium2 as pdfium
+
+    global _open_document
+    if _open_document[0] != path:
+        _open_document = (path, pdfium.PdfDocument(path))
+    page = _open_document[1][index]
+    try:
+        width, height = page.get_size()
+        scale = min(PDF_RASTER_DPI / 72, PDF_RASTER_MAX_SIDE / max(width, height))
+        image = page.render(scale=scale).to_pil().convert("RGB")
+    finally:
+        page.close()
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=RASTER_JPEG_QUALITY)
+    return index, base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+
+@lru_cache(maxsize=1)
+def get_raster_pool() -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(
+        max_workers=PDF_RASTER_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+
+
+def shutdown_raster_pool():
+    """Stop the raster workers, if any were started."""
+    if get_raster_pool.cache_info().currsize:
+        get_raster_pool().shutdown(cancel_futures=True)
+        get_raster_pool.cache_clear()
+
+
+def _write_temp(pdf_data: bytes) -> str:
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+        f.write(pdf_data)
+        return f.name
+
+
+async def rasterize_pages(
+    pdf_data: bytes, indexes: List[int]
+) -> AsyncIterator[Tuple[int, str]]:
+    """
+    Render pages in the raster pool.
+
+    Args:
+        pdf_data: PDF file as bytes
+        indexes: Pages to render
+
+    Yields:
+        (index, base64 JPEG) pairs as each page is ready, in completion
+        order; pages that fail to render are skipped
+    """
+    # Workers read the PDF from disk rather than being sent a copy per page.
+    path = await asyncio.to_thread(_write_temp, pdf_data)
+    loop = asyncio.get_running_loop()
+    pool = get_raster_pool()
+    futures = [loop.run_in_executor(pool, render_page, path, i) for i in indexes]
+    try:
+        for future in asyncio.as_completed(futures):
+            try:
+                yield await future
+            except BrokenProcessPool as e:
+                print(f"Raster pool failed: {str(e)}")
+                get_raster_pool.cache_clear()
+                return
+            except Exception as e:
+                print(f"Error rendering PDF page: {str(e)}")
+    finally:
+        for future in futures:
+            future.cancel()
+        os.remove(path)
@@ -0,0 +1,201 @@
+"""
+Prompt evaluation harness.
+
+Runs a corpus of syllabi through one or more prompt versions and compares
+input/output tokens, latency and extraction accuracy. Combine with
+cassettes to run offline:
+
+    SYLLENDAR_CASSETTE_MODE=record python -m app.services.prompt_eval corpus/
+    SYLLENDAR_CASSETTE_MODE=replay python -m app.services.prompt_eval corpus/
+
+The corpus is a directory of ``.pdf`` or ``.txt`` syllabi. An optional
+``<stem>.expected.json`` next to each file holds the expected ``events``
+used for scoring.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from app.services.o4_mini_service import OpenAIo4Service, get_o4_service
+from app.services.budgets import STREAM_RESTART
+from app.services.prompt_registry import PromptVersion, build_prompt_registry
+from app.services.cassettes import get_cassette_store
+from app.services.pdf_analysis import extract_text_from_pdf
+from app.services.upstream import (
+    build_stream_payload,
+    call_o4_api_stream,
+    parse_schedule_json,
+)
+
+
+def load_corpus(directory: str) -> List[Tuple[str, str, Optional[List[dict]]]]:
+    """
+    Load syllabus texts and expected events from a corpus directory.
+
+    Returns:
+        List of (name, text, expected events or None)
+    """
+    corpus = []
+    for filename in sorted(os.listdir(directory)):
+        stem, ext = os.path.splitext(filename)
+        path = os.path.join(directory, filename)
+        if ext == ".pdf":
+            with open(path, "rb") as f:
+                text = extract_text_from_pdf(f.read())
+        elif ext == ".txt":
+            with open(path, encoding="utf-8") as f:
+                text = f.read()
+        else:
+            continue
+
+        expected = None
+        expected_path = os.path.join(directory, f"{stem}.expected.json")
+        if os.path.exists(expected_path):
+            with open(expected_path, encoding="utf-8") as f:
+                expected = json.load(f).get("events", [])
+        corpus.append((stem, text, expected))
+    return corpus
+
+
+def _event_key(event: Dict[str, Any]) -> Tuple[str, str]:
+    title = re.sub(r"\W+", " ", str(event.get("title", ""))).strip().lower()
+    return title, str(event.get("start_time", ""))[:10]
+
+
+def score_events(
+    predicted: List[dict], expected: List[dict]
+) -> Dict[str, float]:
+    """
+    Score extracted events against expected ones by (title, start date).
+
+    Returns:
+        Precision, recall and F1
+    """
+    predicted_keys: Set[Tuple[str, str]] = {_event_key(e) for e in predicted}
+    expected_keys: Set[Tuple[str, str]] = {_event_key(e) for e in expected}
+    matched = len(predicted_keys & expected_keys)
+    precision = matched / len(predicted_keys) if predicted_keys else 0.0
+    recall = matched / len(expected_keys) if expected_keys else 0.0
+    f1 = (
+        2 * precision * recall / (precision + recall)
+        if precision + recall
+        else 0.0
+    )
+    return {"precision": precision, "recall": recall, "f1": f1}
+
+
+async def evaluate_document(
+    service: OpenAIo4Service,
+    prompt: PromptVersion,
+    name: str,
+    text: str,
+    expected: Optional[List[dict]],
+) -> Dict[str, Any]:
+    """Run one document through one prompt version and collect metrics."""
+    started = time.perf_counter()
+    ttft = None
+    response = ""
+    async for chunk in call_o4_api_stream(prompt.text, text):
+        if chunk is STREAM_RESTART:
+            response = ""
+            continue
+        if ttft is None:
+            ttft = time.perf_counter() - started
+        response += chunk
+    elapsed = time.perf_counter() - started
+
+    # Replays are instant, so report the latency observed when recording.
+    cassette = get_cassette_store()
+    if cassette and cassette.replaying:
+        recorded = cassette.load(build_stream_payload(prompt.text, text))
+        ttft, elapsed = recorded.ttft_seconds, recorded.total_seconds
+
+    result: Dict[str, Any] = {
+        "document": name,
+        "prompt": prompt.name,
+        "version": prompt.version,
+        "input_tokens": prompt.token_count + service.count_tokens(text),
+        "output_tokens": service.count_tokens(response),
+        "ttft_seconds": ttft,
+        "latency_seconds": elapsed,
+    }
+
+    try:
+        events = parse_schedule_json(response).get("events", [])
+        result["events"] = len(events)
+        if expected is not None:
+            result.update(score_events(events, expected))
+    except json.JSONDecodeError:
+        result["events"] = None
+        result["error"] = "invalid JSON"
+    return result
+
+
+async def evaluate(
+    corpus_dir: str, prompt_name: str, versions: Optional[List[str]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Evaluate prompt versions over a corpus.
+
+    Args:
+        corpus_dir: Directory of syllabi
+        prompt_name: Registered prompt name
+        versions: Versions to compare, defaults to all registered versions
+
+    Returns:
+        One result dict per (version, document)
+    """
+    service = get_o4_service()
+    registry = build_prompt_registry(service.count_tokens)
+    prompts = (
+        [registry.get(prompt_name, v) for v in versions]
+        if versions
+        else registry.versions(prompt_name)
+    )
+    corpus = load_corpus(corpus_dir)
+
+    results = []
+    for prompt in prompts:
+        for name, text, expected in corpus:
+            results.append(
+                await evaluate_document(service, prompt, name, text, expected)
+            )
+    return results
+
+
+def summarize(results: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    """Average the per-document metrics for each prompt version."""
+    summary: Dict[str, Dict[str, float]] = {}
+    metrics = ("input_tokens", "output_tokens", "latency_seconds", "f1")
+    for version in sorted({r["version"] for r in results}):
+        rows = [r for r in results if r["version"] == version]
+        summary[version] = {}
+        for metric in metrics:
+            values = [r[metric] for r in rows if r.get(metric) is not None]
+            if values:
+                summary[version][metric] = sum(values) / len(values)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare prompt versions over a syllabus corpus."
+    )
+    parser.add_argument("corpus", help="Directory of .pdf/.txt syllabi")
+    parser.add_argument("--prompt", default="pdf_exam_analysis")
+    parser.add_argument("--versions", nargs="*", help="Versions to compare")
+    args = parser.parse_args()
+
+    results = asyncio.run(evaluate(args.corpus, args.prompt, args.versions))
+    for result in results:
+        print(json.dumps(result))
+    print(json.dumps({"summary": summarize(results)}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Versioned registry of system prompts with precomputed token counts."""
+
+import hashlib
+import os
+import re
+from typing import Callable, Dict, List, Optional, Union
+
+from app import prompts
+
+
+def version_key(version: str) -> List[Union[str, int]]:
+    """Sort key ordering version labels numerically, so "v10" follows "v2"."""
+    parts = re.split(r"(\d+)", version)
+    return [int(part) if part.isdigit() else part for part in parts]
+
+
+class PromptVersion:
+    """One immutable version of a named prompt."""
+
+    def __init__(self, name: str, version: str, text: str, token_count: int):
+        self.name = name
+        self.version = version
+        self.text = text
+        self.token_count = token_count
+        self.digest = hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+
+    def __repr__(self) -> str:
+        return (
+            f"PromptVersion({self.name}@{self.version}, "
+            f"{self.token_count} tokens, {self.digest})"
+        )
+
+
+class PromptRegistry:
+    """
+    Keeps every registered version of each prompt.
+
+    Token counts are computed once at registration so comparisons between
+    versions don't re-tokenize the prompt on every request.
+    """
+
+    def __init__(self, count_tokens: Callable[[str], int]):
+        self.count_tokens = count_tokens
+        self._prompts: Dict[str, Dict[str, PromptVersion]] = {}
+        self._latest: Dict[str, str] = {}
+
+    def register(self, name: str, version: str, text: str) -> PromptVersion:
+        """
+        Register a prompt version; the highest version is the latest one.
+
+        Args:
+            name: Prompt name, e.g. "pdf_exam_analysis"
+            version: Version label, e.g. "v1"
+
+        Returns:
+            The registered prompt version
+        """
+        versions = self._prompts.setdefault(name, {})
+        existing = versions.get(version)
+        if existing is not None and existing.text != text:
+            raise ValueError(f"Prompt {name}@{version} is already registered")
+
+        prompt = existing or PromptVersion(name, version, text, self.count_tokens(text))
+        versions[version] = prompt
+        latest = self._latest.get(name)
+        if latest is None or version_key(version) >= version_key(latest):
+            self._latest[name] = version
+        return prompt
+
+    def get(self, name: str, version: Optional[str] = None) -> PromptVersion:
+        """
+        Look up a prompt version, defaulting to the latest one.
+
+        Raises:
+            KeyError: If the prompt or version is unknown
+        """
+        if name not in self._prompts:
+            raise KeyError(f"Unknown prompt: {name}")
+        version = version or self._latest[name]
+        if version not in self._prompts[name]:
+            raise KeyError(f"Unknown version {version} for prompt {name}")
+        return self._prompts[name][version]
+
+    def names(self) -> List[str]:
+        return sorted(self._prompts)
+
+    def versions(self, name: str) -> List[PromptVersion]:
+        return list(self._prompts.get(name, {}).values())
+
+    def load_directory(self, directory: str):
+        """
+        Register prompt variants stored as ``<directory>/<name>/<version>.txt``.
+
+        Args:
+            directory: Root directory of prompt variants
+        """
+        if not os.path.isdir(directory):
+            return
+        for name in sorted(os.listdir(directory)):
+            prompt_dir = os.path.join(directory, name)
+            if not os.path.isdir(prompt_dir):
+                continue
+            for filename in sorted(os.listdir(prompt_dir), key=version_key):
+                version, ext = os.path.splitext(filename)
+                if ext != ".txt":
+                    continue
+                with open(os.path.join(prompt_dir, filename), encoding="utf-8") as f:
+                    self.register(name, version, f.read())
+
+
+# Baseline versions of the prompts shipped in app/prompts.py.
+BUILTIN_PROMPTS = {
+    "pdf_exam_analysis": prompts.PDF_EXAM_ANALYSIS_SYSTEM_PROMPT,
+    "pdf_exam_update": prompts.PDF_EXAM_UPDATE_SYSTEM_PROMPT,
+    "syllabus_analysis": prompts.SYLLABUS_ANALYSIS_SYSTEM_PROMPT,
+    "chat": prompts.CHAT_SYSTEM_PROMPT,
+}
+
+
+def build_prompt_registry(
+    count_tokens: Callable[[str], int], variants_dir: Optional[str] = None
+) -> PromptRegistry:
+    """
+    Build a registry with the built-in prompts as "v1" plus any variants.
+
+    Args:
+        count_tokens: Tokenizer used to precompute prompt sizes
+        variants_dir: Directory of extra versions, defaults to
+            ``SYLLENDAR_PROMPT_VARIANTS_DIR``
+
+    Returns:
+        The populated registry
+    """
+    registry = PromptRegistry(count_tokens)
+    for name, text in BUILTIN_PROMPTS.items():
+        registry.register(name, "v1", text)
+
+    variants_dir = variants_dir or os.getenv("SYLLENDAR_PROMPT_VARIANTS_DIR")
+    if variants_dir:
+        registry.load_directory(variants_dir)
+    return registry
@@ -0,0 +1,202 @@
+"""
+Latency-aware model routing.
+
+Picks the model and reasoning effort for a request from its input size and
+document complexity, and keeps rolling per-model TTFT/latency samples used
+to decide when an interactive request should be hedged.
+
+Tiers are configurable through the environment:
+
+- ``ROUTE_FAST_MODEL``: model for short, simple documents (off by default)
+- ``ROUTE_FAST_MAX_TOKENS``: input size limit for the fast tier
+- ``ROUTE_LARGE_MIN_TOKENS``: input size above which reasoning effort rises
+- ``ROUTE_VISION_MODEL`` / ``ROUTE_FAST_VISION_MODEL``: image models
+- ``HEDGE_REQUESTS``: set to "1" to enable hedged streaming requests
+"""
+
+import os
+import re
+import threading
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, Optional
+
+DEFAULT_MODEL = "o4-mini-2025-04-16"
+# Off by default: a cheaper model needs accuracy evidence before it gets traffic.
+FAST_MODEL = os.getenv("ROUTE_FAST_MODEL", "")
+FAST_MAX_TOKENS = int(os.getenv("ROUTE_FAST_MAX_TOKENS", "2000"))
+LARGE_MIN_TOKENS = int(os.getenv("ROUTE_LARGE_MIN_TOKENS", "30000"))
+VISION_MODEL = os.getenv("ROUTE_VISION_MODEL", "gpt-4o")
+# Off by default: small images are not necessarily easy to read.
+FAST_VISION_MODEL = os.getenv("ROUTE_FAST_VISION_MODEL", "")
+FAST_VISION_MAX_BYTES = int(os.getenv("ROUTE_FAST_VISION_MAX_BYTES", "200000"))
+
+HEDGE_REQUESTS = os.getenv("HEDGE_REQUESTS") == "1"
+HEDGE_PERCENTILE = 95
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MAX_FRACTION = float(os.getenv("HEDGE_MAX_FRACTION", "0.1"))
+LATENCY_WINDOW = 200
+
+_DATE_PATTERN = re.compile(
+    r"\b(?:\d{1,2}/\d{1,2}(?:/\d{2,4})?|\d{4}-\d{2}-\d{2}|"
+    r"(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?\s+\d{1,2})\b",
+    re.IGNORECASE,
+)
+
+
+def is_reasoning_model(model: str) -> bool:
+    """Whether a model accepts ``reasoning_effort`` (the o-series)."""
+    return re.match(r"o\d", model) is not None
+
+
+class ModelRoute:
+    """The model and reasoning effort chosen for one request."""
+
+    def __init__(self, model: str, reasoning_effort: Optional[str], reason: str):
+        self.model = model
+        self.reasoning_effort = reasoning_effort if is_reasoning_model(model) else None
+        self.reason = reason
+
+    def params(self) -> Dict[str, str]:
+        """Chat Completions parameters selecting this route."""
+        params = {"model": self.model}
+        if self.reasoning_effort:
+            params["reasoning_effort"] = self.reasoning_effort
+        return params
+
+    def __repr__(self) -> str:
+        return f"ModelRoute({self.model}, {self.reasoning_effort}, {self.reason})"
+
+
+def count_dates(text: str) -> int:
+    """Number of date mentions (9/14, 2025-09-14, Sept 14) in a text."""
+    return len(_DATE_PATTERN.findall(text))
+
+
+def document_complexity(text: str) -> float:
+    """
+    Rough 0-1 score of how hard a syllabus is to extract events from.
+
+    Dense schedules (many dates, table-like rows) score high; prose with a
+    handful of deadlines scores low.
+
+    Args:
+        text: Extracted document text
+
+    Returns:
+        Complexity score between 0 and 1
+    """
+    lines = [line for line in text.splitlines() if line.strip()]
+    if not lines:
+        return 0.0
+    dates = count_dates(text)
+    table_rows = sum(1 for line in lines if len(re.findall(r"\d+", line)) >= 3)
+    date_density = min(dates / 40, 1.0)
+    table_density = min(table_rows / len(lines) * 2, 1.0)
+    return round(0.6 * date_density + 0.4 * table_density, 3)
+
+
+def choose_pdf_route(input_tokens: int, complexity: float) -> ModelRoute:
+    """
+    Route a text analysis by input size and complexity.
+
+    Args:
+        input_tokens: Prompt plus document token count
+        complexity: Score from document_complexity
+
+    Returns:
+        The chosen route
+    """
+    if FAST_MODEL and input_tokens <= FAST_MAX_TOKENS and complexity < 0.3:
+        return ModelRoute(FAST_MODEL, None, "short simple document")
+    if input_tokens >= LARGE_MIN_TOKENS or complexity >= 0.8:
+        return ModelRoute(DEFAULT_MODEL, "medium", "large or dense document")
+    return ModelRoute(DEFAULT_MODEL, "low", "default")
+
+
+def choose_vision_route(image_bytes: int) -> ModelRoute:
+    """Route an image analysis by upload size."""
+    if FAST_VISION_MODEL and image_bytes <= FAST_VISION_MAX_BYTES:
+        return ModelRoute(FAST_VISION_MODEL, None, "small image")
+    return ModelRoute(VISION_MODEL, None, "default")
+
+
+class LatencyTracker:
+    """Rolling per-model TTFT and total latency samples."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self._lock = threading.Lock()
+        self._ttft: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=window))
+        self._total: Dict[str, Deque[float]] = defaultdict(
+            lambda: deque(maxlen=window)
+        )
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def record(self, model: str, ttft: float, total: float):
+        with self._lock:
+            self._ttft[model].append(ttft)
+            self._total[model].append(total)
+
+    def record_total(self, model: str, total: float):
+        """Record a non-streamed call, which has no separate first token."""
+        with self._lock:
+            self._total[model].append(total)
+
+    def percentile(self, model: str, metric: str, pct: float) -> Optional[float]:
+        """
+        Return a latency percentile for a model.
+
+        Args:
+            model: Model name
+            metric: "ttft" or "total"
+            pct: Percentile between 0 and 100
+
+        Returns:
+            Seconds, or None without samples
+        """
+        samples = self._ttft if metric == "ttft" else self._total
+        with self._lock:
+            values = sorted(samples.get(model, ()))
+        if not values:
+            return None
+        index = min(int(len(values) * pct / 100), len(values) - 1)
+        return values[index]
+
+    def hedge_threshold(self, model: str) -> Optional[float]:
+        """
+        TTFT after which a request to ``model`` should be hedged.
+
+        Returns None when hedging is disabled, there are too few samples, or
+        hedges already exceed ``HEDGE_MAX_FRACTION`` of requests.
+        """
+        with self._lock:
+            self.requests += 1
+            samples = len(self._ttft.get(model, ()))
+            over_budget = self.hedges >= self.requests * HEDGE_MAX_FRACTION
+        if not HEDGE_REQUESTS or samples < HEDGE_MIN_SAMPLES or over_budget:
+            return None
+        return self.percentile(model, "ttft", HEDGE_PERCENTILE)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current p50/p95 TTFT and latency per model."""
+        with self._lock:
+            models = list(self._total)
+        stats = {
+            model: {
+                "ttft_p50": self.percentile(model, "ttft", 50),
+                "ttft_p95": self.percentile(model, "ttft", 95),
+                "latency_p50": self.percentile(model, "total", 50),
+                "latency_p95": self.percentile(model, "total", 95),
+            }
+            for model in models
+        }
+        return {
+            "models": stats,
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+        }
+
+
+latency_tracker = LatencyTracker()
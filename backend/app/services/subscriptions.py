@@ -0,0 +1,268 @@
+"""
+Subscribable calendars.
+
+Each calendar is a JSON record under ``CALENDARS_DIR`` addressed by an
+unguessable id; calendar apps subscribe to its webcal URL and poll it.
+Rendered ICS bodies are content-addressed by a hash of the event set, so
+the body and its gzip variant are rendered once per change (and shared by
+identical calendars) and every poll is a stat, a dict lookup and usually a
+304.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
+
+from app.services.ics import ics_calendar_header, ics_event_lines
+
+CALENDARS_DIR = os.getenv("CALENDARS_DIR", "calendars")
+CALENDAR_REFRESH_INTERVAL = os.getenv("CALENDAR_REFRESH_INTERVAL", "PT1H")
+RENDERED_CACHE_SIZE = 256
+
+_CALENDAR_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class RenderedCalendar:
+    """An ICS body with its precomputed gzip variant and validators."""
+
+    def __init__(self, content_hash: str, body: bytes, gzip_body: bytes):
+        self.content_hash = content_hash
+        self.body = body
+        self.gzip_body = gzip_body
+        self.etag = etag_for(content_hash)
+
+    @classmethod
+    def render(cls, schedule: Dict[str, Any], digest: str) -> "RenderedCalendar":
+        body = render_calendar(schedule)
+        return cls(digest, body, gzip.compress(body, compresslevel=9, mtime=0))
+
+
+def etag_for(digest: str, encoding: Optional[str] = None) -> str:
+    """Strong ETag of a calendar body; each content coding gets its own."""
+    suffix = "-gz" if encoding == "gzip" else ""
+    return f'"{digest[:32]}{suffix}"'
+
+
+def content_hash(schedule: Dict[str, Any]) -> str:
+    """Hash of the parts of a schedule that end up in its ICS body."""
+    canonical = {
+        "course_name": schedule.get("course_name", "Course"),
+        "course_code": schedule.get("course_code", "COURSE-101"),
+        "events": schedule.get("events", []),
+    }
+    encoded = json.dumps(canonical, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def render_calendar(schedule: Dict[str, Any]) -> bytes:
+    """
+    Render a subscription body.
+
+    Like generate_ics_file, plus refresh hints for subscribing apps. Events
+    without valid start and end times are logged and left out, as in
+    generate_combined_ics_file.
+    """
+    course_name = schedule.get("course_name", "Course")
+    course_code = schedule.get("course_code", "COURSE-101")
+    lines = ics_calendar_header(f"{course_name} ({course_code})")
+    lines.append(f"REFRESH-INTERVAL;VALUE=DURATION:{CALENDAR_REFRESH_INTERVAL}")
+    lines.append(f"X-PUBLISHED-TTL:{CALENDAR_REFRESH_INTERVAL}")
+    for event in schedule.get("events", []):
+        try:
+            lines.extend(ics_event_lines(event, course_code))
+        except (AttributeError, TypeError, ValueError) as e:
+            print(f"Skipping invalid event {event!r}: {str(e)}")
+    lines.append("END:VCALENDAR")
+    return "\r\n".join(lines).encode("utf-8")
+
+
+def http_date(timestamp: float) -> str:
+    return formatdate(timestamp, usegmt=True)
+
+
+def not_modified(
+    etag: str,
+    last_modified: float,
+    if_none_match: Optional[str],
+    if_modified_since: Optional[str],
+) -> bool:
+    """
+    Evaluate conditional request headers (RFC 9110 section 13.2.2).
+
+    If-None-Match takes precedence; If-Modified-Since is only used without it.
+    """
+    if if_none_match:
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in candidates or any(
+            tag.removeprefix("W/") == etag for tag in candidates
+        )
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(last_modified) <= since
+    return False
+
+
+class SubscriptionStore:
+    """Calendar records plus a content-addressed cache of rendered bodies."""
+
+    def __init__(self, directory: str = CALENDARS_DIR):
+        self.directory = directory
+        self.bodies_dir = os.path.join(directory, "bodies")
+        os.makedirs(self.bodies_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        # calendar_id -> (record mtime, record)
+        self._records: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+        self._rendered: "OrderedDict[str, RenderedCalendar]" = OrderedDict()
+
+    def _path(self, calendar_id: str) -> str:
+        return os.path.join(self.directory, f"{calendar_id}.json")
+
+    def _write(self, path: str, data: bytes):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _remember(self, rendered: RenderedCalendar) -> RenderedCalendar:
+        with self._lock:
+            self._rendered[rendered.content_hash] = rendered
+            self._rendered.move_to_end(rendered.content_hash)
+            while len(self._rendered) > RENDERED_CACHE_SIZE:
+                self._rendered.popitem(last=False)
+        return rendered
+
+    def _body_path(self, digest: str) -> str:
+        return os.path.join(self.bodies_dir, f"{digest}.ics")
+
+    def _persist(self, rendered: RenderedCalendar):
+        body_path = self._body_path(rendered.content_hash)
+        # The gzip variant goes first: a body on disk implies both exist.
+        self._write(f"{body_path}.gz", rendered.gzip_body)
+        self._write(body_path, rendered.body)
+
+    def _store_body(self, schedule: Dict[str, Any], digest: str):
+        """Render and persist a body and its gzip variant, once per content hash."""
+        if os.path.exists(self._body_path(digest)):
+            return
+        rendered = RenderedCalendar.render(schedule, digest)
+        self._persist(rendered)
+        self._remember(rendered)
+
+    def save(
+        self, schedule: Dict[str, Any], calendar_id: Optional[str] = None
+    ) -> Tuple[Dict[str, Any], Optional[str]]:
+        """
+        Create a calendar or replace an existing one's events.
+
+        Args:
+            schedule: Course and event information
+            calendar_id: Existing calendar to update
+
+        Returns:
+            (record, token), where token is the new calendar's edit token
+            and None for updates
+        """
+        digest = content_hash(schedule)
+        self._store_body(schedule, digest)
+
+        token = None
+        if calendar_id is None:
+            calendar_id = secrets.token_hex(16)
+            token = secrets.token_urlsafe(24)
+            record = {
+                "calendar_id": calendar_id,
+                "token_hash": hashlib.sha256(token.encode()).hexdigest(),
+                "created_at": time.time(),
+            }
+        else:
+            record = dict(self.load(calendar_id) or {})
+
+        if record.get("content_hash") != digest:
+            # Only real changes move Last-Modified, so polls keep getting 304s.
+            record["updated_at"] = time.time()
+        record.update(
+            {
+                "course_name": schedule.get("course_name", "Course"),
+                "course_code": schedule.get("course_code", "COURSE-101"),
+                "events": schedule.get("events", []),
+                "content_hash": digest,
+            }
+        )
+        self._write(self._path(calendar_id), json.dumps(record).encode("utf-8"))
+        return record, token
+
+    def load(self, calendar_id: str) -> Optional[Dict[str, Any]]:
+        """Load a calendar record, re-reading it only when the file changed."""
+        if not _CALENDAR_ID.match(calendar_id or ""):
+            return None
+        path = self._path(calendar_id)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            with self._lock:
+                self._records.pop(calendar_id, None)
+            return None
+
+        cached = self._records.get(calendar_id)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                record = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        with self._lock:
+            self._records[calendar_id] = (mtime, record)
+        return record
+
+    def check_token(self, record: Dict[str, Any], token: Optional[str]) -> bool:
+        if not token:
+            return False
+        digest = hashlib.sha256(token.encode()).hexdigest()
+        return secrets.compare_digest(digest, record.get("token_hash", ""))
+
+    def delete(self, calendar_id: str):
+        try:
+            os.remove(self._path(calendar_id))
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            self._records.pop(calendar_id, None)
+
+    def rendered(self, record: Dict[str, Any]) -> RenderedCalendar:
+        """Return a record's rendered body, from memory, disk, or rendering it."""
+        digest = record["content_hash"]
+        with self._lock:
+            cached = self._rendered.get(digest)
+            if cached is not None:
+                self._rendered.move_to_end(digest)
+                return cached
+
+        body_path = self._body_path(digest)
+        try:
+            with open(body_path, "rb") as f:
+                body = f.read()
+            with open(f"{body_path}.gz", "rb") as f:
+                gzip_body = f.read()
+        except FileNotFoundError:
+            rendered = RenderedCalendar.render(record, digest)
+            self._persist(rendered)
+            return self._remember(rendered)
+        return self._remember(RenderedCalendar(digest, body, gzip_body))
+
+
+@lru_cache(maxsize=1)
+def get_subscription_store() -> SubscriptionStore:
+    return SubscriptionStore()
@@ -0,0 +1,658 @@
+"""
+Model calls shared by the analysis routes, jobs and batch uploads.
+
+Text requests stream from the Chat Completions API within an output
+budget, optionally hedged when the first token is slow; images go to the
+vision model, whole or as tiles and scanned pages analyzed concurrently.
+"""
+
+import asyncio
+import json
+import re
+import time
+from typing import (
+    Any,
+    AsyncGenerator,
+    AsyncIterator,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+
+import aiohttp
+
+from app.services.o4_mini_service import get_o4_service
+from app.services.budgets import (
+    STREAM_RESTART,
+    OutputBudget,
+    StreamMonitor,
+    budget_stats,
+    plan_budget,
+)
+from app.services.cassettes import get_cassette_store
+from app.services.image_tiles import EventMerger, merge_tile_results, tile_slots
+from app.services.routing import (
+    ModelRoute,
+    choose_vision_route,
+    is_reasoning_model,
+    latency_tracker,
+)
+from app.prompts import SYLLABUS_ANALYSIS_SYSTEM_PROMPT, SYLLABUS_TILE_USER_PROMPT
+from app.core.admission import admission
+
+
+def plan_text_budget(
+    endpoint: str,
+    system_prompt: str,
+    data: str,
+    model: str,
+    reasoning_effort: Optional[str] = None,
+) -> OutputBudget:
+    """
+    Plan the output budget of a text request from its input.
+
+    Args:
+        endpoint: Endpoint type, e.g. "pdf" or "chat"
+        system_prompt: System instructions
+        data: Input string from client
+        model: Model the request goes to
+        reasoning_effort: Requested effort for reasoning models
+
+    Returns:
+        Budget for the first attempt
+    """
+    o4_service = get_o4_service()
+    input_tokens = o4_service.count_tokens(system_prompt) + o4_service.count_tokens(
+        data
+    )
+    return plan_budget(endpoint, model, reasoning_effort, data, input_tokens)
+
+
+def stream_request(
+    system_prompt: str,
+    data: str,
+    model: Optional[str] = None,
+    reasoning_effort: Optional[str] = None,
+    endpoint: str = "pdf",
+) -> Tuple[Dict[str, Any], OutputBudget]:
+    """
+    Build a streaming request body and the budget it was planned with.
+
+    Args:
+        system_prompt: System instructions
+        data: Input string from client
+        model: Model override, defaults to the service model
+        reasoning_effort: Effort override for reasoning models
+        endpoint: Endpoint type the output budget is estimated for
+
+    Returns:
+        (payload, budget) pair
+    """
+    o4_service = get_o4_service()
+    model = model or o4_service.model
+    if is_reasoning_model(model):
+        reasoning_effort = reasoning_effort or o4_service.reasoning_effort
+    budget = plan_text_budget(endpoint, system_prompt, data, model, reasoning_effort)
+    payload = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": data},
+        ],
+        **budget.params(),
+        "stream": True,
+    }
+    return payload, budget
+
+
+def build_stream_payload(
+    system_prompt: str,
+    data: str,
+    model: Optional[str] = None,
+    reasoning_effort: Optional[str] = None,
+    endpoint: str = "pdf",
+) -> Dict[str, Any]:
+    """
+    Build the Chat Completions request body used by call_o4_api_stream.
+
+    Args:
+        system_prompt: System instructions
+        data: Input string from client
+        model: Model override, defaults to the service model
+        reasoning_effort: Effort override for reasoning models
+        endpoint: Endpoint type the output budget is estimated for
+
+    Returns:
+        Request payload with streaming enabled
+    """
+    return stream_request(system_prompt, data, model, reasoning_effort, endpoint)[0]
+
+
+async def call_o4_api_stream(
+    system_prompt: str,
+    data: str,
+    model: Optional[str] = None,
+    reasoning_effort: Optional[str] = None,
+    endpoint: str = "pdf",
+) -> AsyncGenerator[str, None]:
+    """
+    Asynchronously streams a response from the OpenAI o4-mini model using SSE.
+
+    This function sends a system prompt and a user-formatted message to the OpenAI
+    Chat Completions API with streaming enabled. It yields incremental chunks of
+    the model's response as they arrive.
+
+    Args:
+        system_prompt (str): The system-level instructions for the model.
+        data (str): Input string from client
+        model (str): Model override, e.g. from a routing decision
+        reasoning_effort (str): Effort override for reasoning models
+        endpoint (str): Endpoint type the output budget is estimated for
+
+    Yields:
+        str: Chunks of the model's response text as they are received, see
+        budgeted_stream
+    """
+    payload, budget = stream_request(
+        system_prompt, data, model, reasoning_effort, endpoint
+    )
+    async for chunk in budgeted_stream(payload, budget):
+        yield chunk
+
+
+async def budgeted_stream(
+    payload: Dict[str, Any], budget: OutputBudget
+) -> AsyncGenerator[str, None]:
+    """
+    Stream a payload within an output budget, retrying once if it is cut off.
+
+    Args:
+        payload: Request body with streaming enabled
+        budget: Budget planned for the request
+
+    Yields:
+        str: Chunks of the response up to the end of its JSON object. If
+        the budget cut the response off, STREAM_RESTART follows and then
+        the chunks of a retry with a larger budget.
+    """
+    budget_stats.record_request(budget)
+    monitor = StreamMonitor(budget)
+    async for chunk in stream_chat_completion({**payload, **budget.params()}, monitor):
+        yield chunk
+    larger = budget.retry() if monitor.truncated else None
+    if larger is None:
+        return
+
+    print(
+        f"{budget.endpoint} response hit its {budget.max_completion_tokens}"
+        f"-token budget; retrying with {larger.max_completion_tokens}"
+    )
+    started = time.perf_counter()
+    yield STREAM_RESTART
+    async for chunk in stream_chat_completion(
+        {**payload, **larger.params()}, StreamMonitor(larger)
+    ):
+        yield chunk
+    budget_stats.record_retry(budget.endpoint, time.perf_counter() - started)
+
+
+async def stream_chat_completion(
+    payload: Dict[str, Any], monitor: Optional[StreamMonitor] = None
+) -> AsyncGenerator[str, None]:
+    """
+    POST a streaming Chat Completions payload and yield its content chunks.
+
+    Replays and records cassettes, counts the request against admission
+    control and records its latency.
+
+    Args:
+        payload: Request body with streaming enabled
+        monitor: Stops the stream once its JSON object closes and notes
+            whether the budget truncated it
+
+    Yields:
+        str: Chunks of the model's response text as they are received.
+    """
+    o4_service = get_o4_service()
+    api_key = o4_service.api_key
+    base_url = o4_service.base_url
+
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key}",
+    }
+
+    cassette = get_cassette_store()
+    if cassette and cassette.replaying:
+        async for chunk in cassette.replay_stream(payload):
+            text, more = monitor.feed(chunk) if monitor else (chunk, True)
+            if text:
+                yield text
+            if not more:
+                break
+        return
+
+    recorder = cassette.recorder(payload) if cassette else None
+    started = time.perf_counter()
+    ttft = None
+
+    try:
+        with admission.upstream_request():
+            async with aiohttp.ClientSession() as session:
+                async with session.post(
+                    base_url, headers=headers, json=payload
+                ) as response:
+                    if response.status != 200:
+                        error_text = await response.text()
+                        print(f"Error response: {error_text}")
+                        raise ValueError(
+                            f"OpenAI API returned status code {response.status}: {error_text}"
+                        )
+
+                    line_count = 0
+                    async for line in response.content:
+                        line = line.decode("utf-8").strip()
+                        if not line:
+                            continue
+
+                        line_count += 1
+
+                        if line.startswith("data: "):
+                            if line == "data: [DONE]":
+                                break
+                            try:
+                                data = json.loads(line[6:])
+                            except json.JSONDecodeError as e:
+                                print(f"JSON decode error: {e} for line: {line}")
+                                continue
+                            choice = (data.get("choices") or [{}])[0]
+                            if monitor and choice.get("finish_reason"):
+                                monitor.finish_reason = choice["finish_reason"]
+                            content = choice.get("delta", {}).get("content")
+                            if content:
+                                if ttft is None:
+                                    ttft = time.perf_counter() - started
+                                if recorder:
+                                    recorder.add(content)
+                                text, more = (
+                                    monitor.feed(content)
+                                    if monitor
+                                    else (content, True)
+                                )
+                                if text:
+                                    yield text
+                                if not more:
+                                    # The JSON object is complete; closing the
+                                    # connection stops generation upstream.
+                                    break
+
+                    if line_count == 0:
+                        print("Warning: No lines received in stream response")
+                    elif recorder:
+                        recorder.save()
+                    if monitor:
+                        monitor.finish(o4_service.count_tokens)
+
+                    if ttft is not None:
+                        latency_tracker.record(
+                            payload["model"], ttft, time.perf_counter() - started
+                        )
+
+    except aiohttp.ClientError as e:
+        print(f"Connection error: {str(e)}")
+        raise ValueError(f"Failed to connect to OpenAI API: {str(e)}") from e
+    except Exception as e:
+        print(f"Unexpected error in streaming API call: {str(e)}")
+        raise
+
+
+async def call_o4_api_stream_hedged(
+    system_prompt: str, data: str, route: ModelRoute, endpoint: str = "pdf"
+) -> AsyncGenerator[str, None]:
+    """
+    Stream a routed request, hedging it when the first token is slow.
+
+    If the first chunk hasn't arrived by the model's rolling p95 TTFT, a
+    second identical request is fired and whichever produces a chunk first
+    is kept; the other is cancelled. Hedging is skipped when disabled, when
+    there are too few latency samples, or when the hedge budget is spent.
+
+    Args:
+        system_prompt: System instructions
+        data: Input string from client
+        route: Routing decision for the request
+        endpoint: Endpoint type the output budget is estimated for
+
+    Yields:
+        str: Chunks of the winning response
+    """
+    threshold = latency_tracker.hedge_threshold(route.model)
+    primary = call_o4_api_stream(
+        system_prompt, data, route.model, route.reasoning_effort, endpoint
+    )
+    streams = {}
+    try:
+        if threshold is None:
+            async for chunk in primary:
+                yield chunk
+            return
+
+        streams[asyncio.ensure_future(anext(primary))] = primary
+        done, _ = await asyncio.wait(streams, timeout=threshold)
+        if not done:
+            print(
+                f"Hedging {route.model} request after {threshold:.2f}s without a token"
+            )
+            latency_tracker.hedges += 1
+            backup = call_o4_api_stream(
+                system_prompt, data, route.model, route.reasoning_effort, endpoint
+            )
+            streams[asyncio.ensure_future(anext(backup))] = backup
+
+        pending = set(streams)
+        winner = None
+        while pending and winner is None:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                error = task.exception()
+                if winner is None and (
+                    error is None or isinstance(error, StopAsyncIteration)
+                ):
+                    winner = task
+            if winner is None and not pending:
+                # Every request failed: surface the primary's error.
+                next(iter(streams)).result()
+
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        for task, stream in streams.items():
+            if task is not winner:
+                await stream.aclose()
+        if winner is not next(iter(streams)):
+            latency_tracker.hedge_wins += 1
+
+        if winner.exception() is not None:
+            return  # empty response
+        yield winner.result()
+        async for chunk in streams[winner]:
+            yield chunk
+    finally:
+        # Also runs when the consumer is cancelled or stops early: release
+        # both upstream requests and their admission slots.
+        unfinished = [task for task in streams if not task.done()]
+        for task in unfinished:
+            task.cancel()
+        await asyncio.gather(*unfinished, return_exceptions=True)
+        for stream in set(streams.values()) | {primary}:
+            await stream.aclose()
+
+
+def vision_messages(
+    system_prompt: str, user_prompt: str, image_base64: str
+) -> List[Dict[str, Any]]:
+    """Chat messages asking the vision model about one base64 JPEG image."""
+    return [
+        {"role": "system", "content": system_prompt},
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": user_prompt},
+                {
+                    "type": "image_url",
+                    "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"},
+                },
+            ],
+        },
+    ]
+
+
+def call_vision_api(
+    system_prompt: str,
+    user_prompt: str,
+    image_base64: str,
+    model: Optional[str] = None,
+) -> str:
+    """
+    Call OpenAI Vision API to analyze images.
+
+    Args:
+        system_prompt: System instructions
+        user_prompt: User prompt
+        image_base64: Base64 encoded image
+        model: Vision model, defaults to the routed model for the image size
+
+    Returns:
+        AI response as string
+    """
+    model = model or choose_vision_route(len(image_base64) * 3 // 4).model
+    try:
+        return get_o4_service().complete(
+            vision_messages(system_prompt, user_prompt, image_base64),
+            model=model,
+            budget=plan_budget("image", model),
+        )
+
+    except Exception as e:
+        print(f"Error in Vision API call: {str(e)}")
+        raise
+
+
+async def call_vision_api_stream(
+    system_prompt: str,
+    user_prompt: str,
+    image_base64: str,
+    model: Optional[str] = None,
+    endpoint: str = "image",
+) -> AsyncGenerator[str, None]:
+    """
+    Stream a vision analysis of an image.
+
+    Args:
+        system_prompt: System instructions
+        user_prompt: User prompt
+        image_base64: Base64 encoded image
+        model: Vision model, defaults to the routed model for the image size
+        endpoint: "image", or "image_tile"/"pdf_page" for part of a document
+
+    Yields:
+        str: Chunks of the model's response text as they are received, see
+        budgeted_stream
+    """
+    model = model or choose_vision_route(len(image_base64) * 3 // 4).model
+    payload = {
+        "model": model,
+        "messages": vision_messages(system_prompt, user_prompt, image_base64),
+        "stream": True,
+    }
+    async for chunk in budgeted_stream(payload, plan_budget(endpoint, model)):
+        yield chunk
+
+
+class ScheduleEventExtractor:
+    """
+    Pull finished entries of the "events" array out of a streaming response.
+
+    Feed chunks as they arrive; each call returns the events whose JSON
+    objects were completed by that chunk. The text is scanned once, tracking
+    nesting and string state, so the cost is linear in the response length.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos: Optional[int] = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._object_start = 0
+        self._finished = False
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        self.text += chunk
+        if self._finished:
+            return []
+        if self._pos is None:
+            match = re.search(r'"events"\s*:\s*\[', self.text)
+            if not match:
+                return []
+            self._pos = match.end()
+
+        events = []
+        text = self.text
+        i = self._pos
+        while i < len(text):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                if self._depth == 0:
+                    self._object_start = i
+                self._depth += 1
+            elif ch in "}]":
+                if self._depth == 0:
+                    # End of the events array.
+                    self._finished = True
+                    break
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        event = json.loads(text[self._object_start : i + 1])
+                    except json.JSONDecodeError:
+                        event = None
+                    if isinstance(event, dict):
+                        events.append(event)
+            i += 1
+        self._pos = i
+        return events
+
+
+async def analyze_images_stream(
+    images: AsyncIterator[Tuple[int, str, str]],
+    system_prompt: str = SYLLABUS_ANALYSIS_SYSTEM_PROMPT,
+    merge: Callable[[List[Dict[str, Any]]], Dict[str, Any]] = merge_tile_results,
+    endpoint: str = "image_tile",
+) -> AsyncGenerator[Dict[str, Any], None]:
+    """
+    Analyze several images of one document concurrently.
+
+    Each image is sent as soon as ``images`` produces it, with at most
+    TILE_CONCURRENCY in flight across all requests. Each streams from the vision model, and
+    events are yielded as soon as any image finishes them, skipping
+    duplicates. Images that fail are skipped unless all of them do.
+
+    Args:
+        images: (index, user prompt, base64 JPEG) triples; the index orders
+            results when merging
+        system_prompt: System instructions for every image
+        merge: Combines the per-image results, in index order
+        endpoint: Endpoint type the output budgets are estimated for
+
+    Yields:
+        "streaming" events carrying newly found ``events``, then a
+        "complete" event with the merged result
+    """
+    found: asyncio.Queue = asyncio.Queue()
+    results: Dict[int, Dict[str, Any]] = {}
+    tasks: List[asyncio.Task] = []
+
+    async def analyze(index: int, user_prompt: str, image_base64: str):
+        async with tile_slots:
+            extractor = ScheduleEventExtractor()
+            async for chunk in call_vision_api_stream(
+                system_prompt, user_prompt, image_base64, endpoint=endpoint
+            ):
+                if chunk is STREAM_RESTART:
+                    # Events already found stay; the merger drops repeats.
+                    extractor = ScheduleEventExtractor()
+                for event in extractor.feed(chunk):
+                    found.put_nowait(event)
+        results[index] = parse_schedule_json(extractor.text)
+
+    async def feed():
+        try:
+            async for index, user_prompt, image_base64 in images:
+                tasks.append(
+                    asyncio.create_task(analyze(index, user_prompt, image_base64))
+                )
+            return await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            found.put_nowait(None)
+
+    feeder = asyncio.create_task(feed())
+    merger = EventMerger()
+    try:
+        done = False
+        while not done:
+            batch = [await found.get()]
+            while not found.empty():
+                batch.append(found.get_nowait())
+            done = batch[-1] is None
+            new_events = [e for e in batch if e is not None and merger.add(e)]
+            if new_events:
+                yield {"status": "streaming", "chunk": "", "events": new_events}
+    finally:
+        feeder.cancel()
+        for task in tasks:
+            task.cancel()
+
+    errors = [e for e in await feeder if isinstance(e, Exception)]
+    for error in errors:
+        print(f"Error analyzing image: {str(error)}")
+    if not results:
+        raise errors[0] if errors else ValueError("No images to analyze")
+    yield {
+        "status": "complete",
+        "data": merge([results[index] for index in sorted(results)]),
+    }
+
+
+def analyze_tiles_stream(tiles: List[str]) -> AsyncGenerator[Dict[str, Any], None]:
+    """
+    Analyze the tiles of a tall or dense image concurrently.
+
+    Args:
+        tiles: Base64 JPEG tiles from split_image
+
+    Returns:
+        Event stream from analyze_images_stream
+    """
+
+    async def images():
+        for index, tile in enumerate(tiles):
+            user_prompt = SYLLABUS_TILE_USER_PROMPT.format(
+                index=index + 1, count=len(tiles)
+            )
+            yield index, user_prompt, tile
+
+    return analyze_images_stream(images())
+
+
+def parse_schedule_json(ai_response: str) -> Dict[str, Any]:
+    """
+    Parse the JSON object out of a model response.
+
+    Args:
+        ai_response: Raw model output, possibly wrapped in extra text
+
+    Returns:
+        Parsed schedule data
+
+    Raises:
+        json.JSONDecodeError: If no valid JSON object is found
+    """
+    # Try to extract JSON from the response if it's wrapped in text
+    json_match = re.search(r"\{.*\}", ai_response, re.DOTALL)
+    if json_match:
+        return json.loads(json_match.group())
+    return json.loads(ai_response)
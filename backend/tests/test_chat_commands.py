@@ -0,0 +1,69 @@
+from app.services.chat_commands import apply_command, classify, find_events
+
+SCHEDULE = {
+    "course_name": "Senior Seminar",
+    "course_code": "SEM 499",
+    "events": [
+        {
+            "title": "Thesis Proposal",
+            "start_time": "2025-02-10T10:00:00",
+            "end_time": "2025-02-10T11:00:00",
+            "event_type": "deadline",
+        },
+        {
+            "title": "Thesis Defense",
+            "start_time": "2025-04-21T14:00:00",
+            "end_time": "2025-04-21T15:00:00",
+            "event_type": "exam",
+        },
+        {
+            "title": "Quiz 1",
+            "start_time": "2025-02-03T09:00:00",
+            "end_time": "2025-02-03T09:30:00",
+            "event_type": "quiz",
+        },
+        {
+            "title": "Quiz 2",
+            "start_time": "2025-03-03T09:00:00",
+            "end_time": "2025-03-03T09:30:00",
+            "event_type": "quiz",
+        },
+    ],
+}
+
+
+def test_singular_target_ending_in_s_is_not_plural():
+    command = classify("delete the thesis")
+    assert command.intent == "delete"
+    assert find_events(SCHEDULE["events"], command.target) is None
+    assert apply_command(command, SCHEDULE) is None
+
+
+def test_real_plural_matches_every_event():
+    assert find_events(SCHEDULE["events"], "quizzes") == [2, 3]
+    assert find_events(SCHEDULE["events"], "all of the thesis") == [0, 1]
+
+
+def test_singular_target_matching_several_events_falls_back():
+    assert find_events(SCHEDULE["events"], "quiz") is None
+    assert find_events(SCHEDULE["events"], "quiz 2") == [3]
+
+
+def test_yes_confirms_only_a_pure_file_offer():
+    offer = [{"text": "Would you like me to generate the ICS file?", "isUser": False}]
+    assert classify("yes", offer).intent == "confirm"
+
+    proposal = [
+        {
+            "text": "I'll move the midterm to Friday, March 7. Would you like me "
+            "to generate an updated calendar file?",
+            "isUser": False,
+        }
+    ]
+    assert classify("yes", proposal) is None
+    assert classify("yes, generate the calendar file", proposal) is None
+
+
+def test_malformed_history_falls_back():
+    for history in [{"text": "hi"}, ["Would you like the ICS file?"], "yes", 3]:
+        assert classify("yes", history) is None
@@ -3,6 +3,8 @@ const API_BASE_URL =
     ? process.env.NEXT_PUBLIC_API_URL
     : "http://localhost:8000";
 
+const MAX_STREAM_RESUMES = 3;
+
 export interface Event {
   title: string;
   start_time: string;
@@ -59,16 +61,18 @@ export const api = {
     return response.json();
   },
 
-  async *analyzePdfStream(
+  async *analyzeFileStream(
     file: File,
     onStatus?: (status: string, message?: string) => void,
-    onProgress?: (chunk: string) => void
+    onProgress?: (chunk: string) => void,
+    onEvents?: (events: Event[]) => void
   ): AsyncGenerator<
     {
       status: string;
       data?: ExtractedEvents;
       message?: string;
       chunk?: string;
+      events?: Event[];
     },
     void,
     unknown
@@ -76,57 +80,89 @@ export const api = {
     const formData = new FormData();
     formData.append("file", file);
 
-    const response = await fetch(`${API_BASE_URL}/pdf/analyze-stream`, {
+    // PDFs and images share one SSE vocabulary.
+    const endpoint = file.type.startsWith("image/")
+      ? "/generate/analyze-image-stream"
+      : "/pdf/analyze-stream";
+    let response = await fetch(`${API_BASE_URL}${endpoint}`, {
       method: "POST",
       body: formData,
     });
 
     if (!response.ok) {
-      throw new Error(`Failed to analyze PDF: ${response.statusText}`);
+      throw new Error(`Failed to analyze file: ${response.statusText}`);
     }
 
-    const reader = response.body?.getReader();
-    if (!reader) {
-      throw new Error("No response body");
-    }
+    // Dropped connections resume from the server's replay buffer.
+    const streamId = response.headers.get("X-Stream-Id");
+    let lastEventId: string | null = null;
+    let retries = 0;
+
+    while (true) {
+      const reader = response.body?.getReader();
+      if (!reader) {
+        throw new Error("No response body");
+      }
 
-    const decoder = new TextDecoder();
-    let buffer = "";
-
-    try {
-      while (true) {
-        const { done, value } = await reader.read();
-        if (done) break;
-
-        buffer += decoder.decode(value, { stream: true });
-        const lines = buffer.split("\n");
-        buffer = lines.pop() || "";
-
-        for (const line of lines) {
-          if (line.startsWith("data: ")) {
-            try {
-              const data = JSON.parse(line.slice(6));
-
-              if (data.status === "analyzing") {
-                onStatus?.(data.status, data.message);
-                yield { status: data.status, message: data.message };
-              } else if (data.status === "streaming") {
-                onProgress?.(data.chunk);
-                yield { status: data.status, chunk: data.chunk };
-              } else if (data.status === "complete") {
-                yield { status: data.status, data: data.data };
-                return;
-              } else if (data.status === "error") {
-                throw new Error(data.message);
+      const decoder = new TextDecoder();
+      let buffer = "";
+
+      try {
+        while (true) {
+          const { done, value } = await reader.read();
+          if (done) return;
+
+          buffer += decoder.decode(value, { stream: true });
+          const lines = buffer.split("\n");
+          buffer = lines.pop() || "";
+
+          for (const line of lines) {
+            if (line.startsWith("id: ")) {
+              lastEventId = line.slice(4);
+            } else if (line.startsWith("data: ")) {
+              try {
+                const data = JSON.parse(line.slice(6));
+
+                if (data.status === "analyzing") {
+                  onStatus?.(data.status, data.message);
+                  yield { status: data.status, message: data.message };
+                } else if (data.status === "streaming") {
+                  onProgress?.(data.chunk);
+                  if (data.events) {
+                    onEvents?.(data.events);
+                  }
+                  yield {
+                    status: data.status,
+                    chunk: data.chunk,
+                    events: data.events,
+                  };
+                } else if (data.status === "complete") {
+                  yield { status: data.status, data: data.data };
+                  return;
+                } else if (data.status === "error") {
+                  throw new Error(data.message);
+                }
+              } catch {
+                console.warn("Failed to parse SSE data:", line);
               }
-            } catch {
-              console.warn("Failed to parse SSE data:", line);
             }
           }
         }
+      } catch (error) {
+        if (!streamId || retries >= MAX_STREAM_RESUMES) {
+          throw error;
+        }
+      } finally {
+        reader.releaseLock();
+      }
+
+      retries += 1;
+      response = await fetch(`${API_BASE_URL}/streams/${streamId}`, {
+        headers: lastEventId ? { "Last-Event-ID": lastEventId } : {},
+      });
+      if (!response.ok) {
+        throw new Error(`Failed to resume analysis: ${response.statusText}`);
       }
-    } finally {
-      reader.releaseLock();
     }
   },
 
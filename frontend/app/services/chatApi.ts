@@ -26,7 +26,8 @@ export async function sendChatMessage(
     text: string;
     isUser: boolean;
     timestamp: Date;
-  }>
+  }>,
+  schedule?: ChatResponse["ics_data"]
 ): Promise<ChatResponse> {
   try {
     const formData = new FormData();
@@ -39,6 +40,11 @@ export async function sendChatMessage(
       );
     }
 
+    // Lets the backend apply simple edits without a model round-trip
+    if (schedule) {
+      formData.append("events", JSON.stringify(schedule));
+    }
+
     const response = await fetch(`${API_BASE_URL}/generate/chat`, {
       method: "POST",
       body: formData,
@@ -62,9 +68,15 @@ export async function* sendChatMessageStream(
     text: string;
     isUser: boolean;
     timestamp: Date;
-  }>
+  }>,
+  schedule?: ChatResponse["ics_data"]
 ): AsyncGenerator<
-  { chunk?: string; ics_data?: ChatResponse["ics_data"]; done?: boolean },
+  {
+    chunk?: string;
+    ics_data?: ChatResponse["ics_data"];
+    reset?: boolean;
+    done?: boolean;
+  },
   void,
   unknown
 > {
@@ -79,6 +91,11 @@ export async function* sendChatMessageStream(
       );
     }
 
+    // Lets the backend apply simple edits without a model round-trip
+    if (schedule) {
+      formData.append("events", JSON.stringify(schedule));
+    }
+
     const response = await fetch(`${API_BASE_URL}/generate/chat-stream`, {
       method: "POST",
       body: formData,
@@ -111,6 +128,9 @@ export async function* sendChatMessageStream(
               const data = JSON.parse(line.slice(6));
               if (data.chunk) {
                 yield { chunk: data.chunk };
+              } else if (data.reset) {
+                // The reply is being regenerated; drop what was shown
+                yield { reset: true };
               } else if (data.ics_data) {
                 yield { ics_data: data.ics_data };
               } else if (data.done) {
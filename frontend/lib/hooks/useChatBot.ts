@@ -35,6 +35,10 @@ export function useChatBot() {
       event_type?: string;
     }>;
   } | null>(null);
+  // Latest schedule from the assistant, kept after download for follow-up edits
+  const [schedule, setSchedule] = useState<ChatResponse["ics_data"] | null>(
+    null
+  );
 
   const {
     generateIcs,
@@ -69,7 +73,11 @@ export function useChatBot() {
 
       let displayText = "";
       try {
-        for await (const data of sendChatMessageStream(text, messages)) {
+        for await (const data of sendChatMessageStream(
+          text,
+          messages,
+          schedule ?? undefined
+        )) {
           if (data.chunk) {
             displayText += data.chunk;
             setMessages((prev) =>
@@ -77,8 +85,16 @@ export function useChatBot() {
                 msg.id === aiMessageId ? { ...msg, text: displayText } : msg
               )
             );
+          } else if (data.reset) {
+            displayText = "";
+            setMessages((prev) =>
+              prev.map((msg) =>
+                msg.id === aiMessageId ? { ...msg, text: displayText } : msg
+              )
+            );
           } else if (data.ics_data) {
             setPendingIcsData(data.ics_data);
+            setSchedule(data.ics_data);
             addMessage(
               "ICS file is ready! You can download it using the button below.",
               false
@@ -90,7 +106,15 @@ export function useChatBot() {
           "Streaming error, falling back to regular chat:",
           streamError
         );
-        const response: ChatResponse = await sendChatMessage(text, messages);
+        const response: ChatResponse = await sendChatMessage(
+          text,
+          messages,
+          schedule ?? undefined
+        );
+        if (response.ics_data) {
+          setPendingIcsData(response.ics_data);
+          setSchedule(response.ics_data);
+        }
         displayText = response.response;
         setMessages((prev) =>
           prev.map((msg) =>
@@ -1,5 +1,5 @@
 import { useMutation } from "@tanstack/react-query";
-import { api, ExtractedEvents } from "../../app/services/api";
+import { api, Event, ExtractedEvents } from "../../app/services/api";
 
 export const useFileAnalysis = () => {
   const analyzeImageMutation = useMutation({
@@ -26,16 +26,18 @@ export const useFileAnalysis = () => {
     }
   };
 
-  const analyzePdfWithStream = async (
+  const analyzeWithStream = async (
     file: File,
     onStatus?: (status: string, message?: string) => void,
-    onProgress?: (chunk: string) => void
+    onProgress?: (chunk: string) => void,
+    onEvents?: (events: Event[]) => void
   ): Promise<ExtractedEvents> => {
     try {
-      for await (const result of api.analyzePdfStream(
+      for await (const result of api.analyzeFileStream(
         file,
         onStatus,
-        onProgress
+        onProgress,
+        onEvents
       )) {
         if (result.status === "complete" && result.data) {
           return result.data;
@@ -43,15 +45,15 @@ export const useFileAnalysis = () => {
       }
       throw new Error("No data received from streaming analysis");
     } catch (error) {
-      console.error("PDF streaming analysis error:", error);
-      // Fallback to regular PDF analysis
-      return analyzePdfMutation.mutateAsync(file);
+      console.error("Streaming analysis error:", error);
+      // Fallback to regular analysis
+      return analyzeFile(file);
     }
   };
 
   return {
     analyzeFile,
-    analyzePdfWithStream,
+    analyzeWithStream,
     isAnalyzing: analyzeImageMutation.isPending || analyzePdfMutation.isPending,
     error: analyzeImageMutation.error || analyzePdfMutation.error,
     reset: () => {
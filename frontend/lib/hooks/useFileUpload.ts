@@ -13,8 +13,7 @@ export function useFileUpload() {
   const fileInputRef = useRef<HTMLInputElement>(null);
 
   const {
-    analyzeFile,
-    analyzePdfWithStream,
+    analyzeWithStream,
     isAnalyzing,
     error: analysisError,
     reset: resetAnalysis,
@@ -67,26 +66,23 @@ export function useFileUpload() {
     resetAnalysis();
 
     try {
-      let eventsData: ExtractedEvents;
-
-      if (fileType === "pdf") {
-        // Use streaming for PDF analysis
-        eventsData = await analyzePdfWithStream(
-          selectedFile,
-          (status, message) => {
-            if (status === "analyzing") {
-              setUploadStatus(message || "Analyzing PDF content...");
-            }
-          },
-          () => {
-            // Optionally show streaming progress
-            // setUploadStatus(`Analyzing... (${chunk.length} characters processed)`);
+      let found = 0;
+      const eventsData: ExtractedEvents = await analyzeWithStream(
+        selectedFile,
+        (status, message) => {
+          if (status === "analyzing") {
+            setUploadStatus(message || `Analyzing ${fileType} content...`);
           }
-        );
-      } else {
-        // Use regular analysis for images
-        eventsData = await analyzeFile(selectedFile);
-      }
+        },
+        () => {
+          // Optionally show streaming progress
+          // setUploadStatus(`Analyzing... (${chunk.length} characters processed)`);
+        },
+        (events) => {
+          found += events.length;
+          setUploadStatus(`Analyzing ${fileType}... found ${found} events so far`);
+        }
+      );
 
       setExtractedEvents(eventsData);
       setUploadStatus(